@@ -0,0 +1,61 @@
+"""Compare ``run_backfill`` with feeding the same files through a tailer.
+
+Usage (from ``backend/``):
+
+    python -m benchmarks.bench_backfill --files 4 --lines 250000
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+
+from fizzylog.backfill import run_backfill
+from fizzylog.ingest import BlockReader, PathNormalizer, aggregate_lines
+
+from .bench_ingest import make_config, write_log
+
+
+def run_tailer(paths, config) -> float:
+    buffer = {}
+    normalizer = PathNormalizer(config)
+    started = time.perf_counter()
+    for path in paths:
+        with open(path, "rb") as handle:
+            reader = BlockReader(handle, config.ingest.read_chunk_bytes)
+            while True:
+                lines = reader.read()
+                if lines is None:
+                    break
+                aggregate_lines(lines, config, buffer, normalizer)
+    return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fizzylog backfill throughput")
+    parser.add_argument("--files", type=int, default=4)
+    parser.add_argument("--lines", type=int, default=250000, help="Lines per file")
+    parser.add_argument("--workers", type=int, default=0)
+    args = parser.parse_args()
+
+    config = make_config()
+    config.storage.retention_seconds = 30 * 86400
+    start = int(time.time()) - 86400
+    with tempfile.TemporaryDirectory() as tmpdir:
+        live = os.path.join(tmpdir, "access.log")
+        paths = [live] + [f"{live}.{index}" for index in range(1, args.files)]
+        for index, path in enumerate(paths):
+            write_log(path, args.lines, seed=index, start=start)
+        config.log.path = live
+        total = args.files * args.lines
+
+        tailer_seconds = run_tailer(paths, config)
+        result = run_backfill(config, os.path.join(tmpdir, "rollups.sqlite"), workers=args.workers)
+        print(f"  tailer: {total / tailer_seconds:>12,.0f} lines/s ({tailer_seconds:.3f}s)")
+        print(f"backfill: {total / result.seconds:>12,.0f} lines/s ({result.seconds:.3f}s, {result.rows} rows)")
+        print(f"speedup: {tailer_seconds / result.seconds:.2f}x on {os.cpu_count()} CPUs")
+
+
+if __name__ == "__main__":
+    main()
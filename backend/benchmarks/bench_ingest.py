@@ -0,0 +1,101 @@
+"""Compare ingest throughput of the per-line and block read loops.
+
+Usage (from ``backend/``):
+
+    python -m benchmarks.bench_ingest --lines 200000
+
+Both modes replay the same synthetic access log through the reader and
+``aggregate_lines`` and pay the same per-iteration clock checks as
+``LogIngester._run``, so the numbers reflect the loop overhead that the
+block reader removes.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import random
+import tempfile
+import time
+
+from fizzylog.config import (
+    ApiConfig,
+    Config,
+    IngestConfig,
+    LogConfig,
+    PathsConfig,
+    StatusFilterConfig,
+    StorageConfig,
+    UIConfig,
+    WindowConfig,
+)
+from fizzylog.ingest import BlockReader, LineReader, PathNormalizer, aggregate_lines
+
+
+PATHS = ["/", "/index.html", "/terms.html", "/terms.html?ref=1", "/missing", "/style.css"]
+STATUSES = [200, 200, 200, 304, 404, 500]
+
+
+def make_config() -> Config:
+    return Config(
+        log=LogConfig(path="-"),
+        api=ApiConfig(),
+        window=WindowConfig(),
+        paths=PathsConfig(include_exact=["/", "/terms.html"]),
+        status_filter=StatusFilterConfig(),
+        ui=UIConfig(),
+        storage=StorageConfig(sqlite_path=":memory:"),
+        ingest=IngestConfig(),
+    )
+
+
+def write_log(path: str, lines: int, seed: int = 1, start: int = 1728568536) -> None:
+    rng = random.Random(seed)
+    with open(path, "w", encoding="utf-8") as handle:
+        for i in range(lines):
+            ts = time.strftime("%d/%b/%Y:%H:%M:%S +0000", time.gmtime(start + i // 50))
+            handle.write(
+                f'203.0.113.{rng.randint(1, 254)} - - [{ts}] "GET {rng.choice(PATHS)} HTTP/1.1" '
+                f'{rng.choice(STATUSES)} 512 "-" "bench/1.0"\n'
+            )
+
+
+def run(path: str, mode: str, config: Config, chunk_bytes: int) -> float:
+    buffer = {}
+    normalizer = PathNormalizer(config)
+    next_flush = time.time() + 3600
+    with open(path, "rb") as handle:
+        reader = LineReader(handle) if mode == "line" else BlockReader(handle, chunk_bytes)
+        started = time.perf_counter()
+        while True:
+            lines = reader.read()
+            if lines is None:
+                break
+            aggregate_lines(lines, config, buffer, normalizer)
+            if time.time() >= next_flush:
+                buffer.clear()
+        return time.perf_counter() - started
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fizzylog ingest throughput")
+    parser.add_argument("--lines", type=int, default=200000)
+    parser.add_argument("--chunk-bytes", type=int, default=IngestConfig().read_chunk_bytes)
+    args = parser.parse_args()
+
+    config = make_config()
+    fd, path = tempfile.mkstemp(suffix=".log")
+    os.close(fd)
+    try:
+        write_log(path, args.lines)
+        results = {}
+        for mode in ("line", "block"):
+            elapsed = run(path, mode, config, args.chunk_bytes)
+            results[mode] = args.lines / elapsed
+            print(f"{mode:>5}: {results[mode]:>12,.0f} lines/s ({elapsed:.3f}s)")
+        print(f"block/line speedup: {results['block'] / results['line']:.2f}x")
+    finally:
+        os.unlink(path)
+
+
+if __name__ == "__main__":
+    main()
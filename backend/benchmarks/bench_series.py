@@ -0,0 +1,94 @@
+"""Compare series queries on a fresh connection per request and on a pooled one.
+
+Usage (from ``backend/``):
+
+    python -m benchmarks.bench_series --requests 2000 --buckets 720
+
+Each request runs the same ``query_rollups`` call the series endpoint
+makes for a full window; ``open`` is the cost of getting a connection and
+``total`` includes the query.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+
+from fizzylog import db
+from fizzylog.models import StatusFilter
+
+from .bench_ingest import PATHS, STATUSES
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(len(ordered) * fraction))]
+
+
+def fill(path: str, buckets: int, bucket_seconds: int) -> int:
+    db.init_db(path)
+    end = (int(time.time()) // bucket_seconds) * bucket_seconds
+    rows = {}
+    for index in range(buckets):
+        bucket = end - index * bucket_seconds
+        for path_index, request_path in enumerate(PATHS):
+            for status in set(STATUSES):
+                rows[(bucket, request_path, status)] = index + path_index + 1
+    conn = db.get_connection(path)
+    try:
+        db.write_rollups(conn, rows)
+    finally:
+        conn.close()
+    return end
+
+
+def run(sqlite_path: str, requests: int, start: int, end: int, pooled: bool):
+    status_filter = StatusFilter(mode="ranges", ranges=["2xx", "3xx"], exact=[])
+    pool = db.ReadPool(sqlite_path) if pooled else None
+    opens: List[float] = []
+    totals: List[float] = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        if pool is not None:
+            conn, identity = pool.acquire()
+        else:
+            conn = db.get_connection(sqlite_path, read_only=True)
+        opened = time.perf_counter()
+        db.query_rollups(conn, PATHS, status_filter, start, end)
+        if pool is not None:
+            pool.release(conn, identity)
+        else:
+            conn.close()
+        finished = time.perf_counter()
+        opens.append(opened - started)
+        totals.append(finished - started)
+    if pool is not None:
+        pool.close()
+    return opens, totals
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fizzylog series connection cost")
+    parser.add_argument("--requests", type=int, default=2000)
+    parser.add_argument("--buckets", type=int, default=720)
+    parser.add_argument("--bucket-seconds", type=int, default=60)
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+        end = fill(sqlite_path, args.buckets, args.bucket_seconds)
+        start = end - (args.buckets - 1) * args.bucket_seconds
+        for label, pooled in (("per-request", False), ("pooled", True)):
+            opens, totals = run(sqlite_path, args.requests, start, end, pooled)
+            print(
+                f"{label:>11}: open p50 {percentile(opens, 0.5) * 1e3:.3f}ms "
+                f"p99 {percentile(opens, 0.99) * 1e3:.3f}ms | "
+                f"total p50 {percentile(totals, 0.5) * 1e3:.3f}ms "
+                f"p99 {percentile(totals, 0.99) * 1e3:.3f}ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
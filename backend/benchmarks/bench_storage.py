@@ -0,0 +1,130 @@
+"""Compare database size and series query latency before and after migration.
+
+Usage (from ``backend/``):
+
+    python -m benchmarks.bench_storage --buckets 720 --paths 50
+
+Loads the same rollups into the original single-table layout (rowid
+table, path TEXT in every row and two secondary indexes), measures it,
+then runs ``init_db`` to migrate it in place and measures again.
+"""
+from __future__ import annotations
+
+import argparse
+import os
+import tempfile
+import time
+from typing import List
+
+from fizzylog import db
+from fizzylog.models import StatusFilter
+
+from .bench_series import percentile
+
+
+LEGACY_SCHEMA = """
+CREATE TABLE rollup_counts (
+    bucket_start_utc INTEGER NOT NULL,
+    path TEXT NOT NULL,
+    status INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (bucket_start_utc, path, status)
+);
+CREATE INDEX idx_rollup_time ON rollup_counts (bucket_start_utc);
+CREATE INDEX idx_rollup_path_time ON rollup_counts (path, bucket_start_utc);
+"""
+
+LEGACY_QUERY = (
+    "SELECT bucket_start_utc, path, SUM(count) as count "
+    "FROM rollup_counts "
+    "WHERE bucket_start_utc BETWEEN ? AND ? "
+    "AND path IN ({paths}) "
+    "AND ((status BETWEEN 200 AND 299) OR (status BETWEEN 300 AND 399)) "
+    "GROUP BY bucket_start_utc, path "
+    "ORDER BY bucket_start_utc ASC"
+)
+
+STATUSES = [200, 204, 301, 304, 404, 500]
+
+
+def database_size(sqlite_path: str) -> int:
+    conn = db.get_connection(sqlite_path)
+    try:
+        conn.execute("VACUUM")
+        conn.execute("PRAGMA wal_checkpoint(TRUNCATE)")
+    finally:
+        conn.close()
+    return os.path.getsize(sqlite_path)
+
+
+def timed(run, requests: int) -> List[float]:
+    samples = []
+    for _ in range(requests):
+        started = time.perf_counter()
+        run()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def report(label: str, size: int, samples: List[float]) -> None:
+    print(
+        f"{label:>6}: {size / 1e6:8.2f} MB | query p50 {percentile(samples, 0.5) * 1e3:.3f}ms "
+        f"p99 {percentile(samples, 0.99) * 1e3:.3f}ms"
+    )
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fizzylog rollup storage size and latency")
+    parser.add_argument("--buckets", type=int, default=720)
+    parser.add_argument("--paths", type=int, default=50)
+    parser.add_argument("--query-paths", type=int, default=5)
+    parser.add_argument("--requests", type=int, default=200)
+    args = parser.parse_args()
+
+    end = (int(time.time()) // 60) * 60
+    start = end - (args.buckets - 1) * 60
+    paths = [f"/section-{index}/page.html" for index in range(args.paths)]
+    wanted = paths[: args.query_paths]
+    rows = [
+        (start + index * 60, path, status, 1 + (index + status) % 7)
+        for index in range(args.buckets)
+        for path in paths
+        for status in STATUSES
+    ]
+
+    with tempfile.TemporaryDirectory() as tmpdir:
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+        conn = db.get_connection(sqlite_path)
+        try:
+            conn.executescript(LEGACY_SCHEMA)
+            with conn:
+                conn.executemany("INSERT INTO rollup_counts VALUES (?, ?, ?, ?)", rows)
+        finally:
+            conn.close()
+
+        size = database_size(sqlite_path)
+        conn = db.get_connection(sqlite_path, read_only=True)
+        sql = LEGACY_QUERY.format(paths=",".join(["?"] * len(wanted)))
+        try:
+            samples = timed(lambda: conn.execute(sql, [start, end, *wanted]).fetchall(), args.requests)
+        finally:
+            conn.close()
+        report("before", size, samples)
+
+        migrate_started = time.perf_counter()
+        db.init_db(sqlite_path)
+        migrate_seconds = time.perf_counter() - migrate_started
+
+        size = database_size(sqlite_path)
+        status_filter = StatusFilter(mode="ranges", ranges=["2xx", "3xx"], exact=[])
+        conn = db.get_connection(sqlite_path, read_only=True)
+        try:
+            samples = timed(lambda: db.query_rollups(conn, wanted, status_filter, start, end), args.requests)
+        finally:
+            conn.close()
+        report("after", size, samples)
+        print(f"migrated {len(rows)} rows in {migrate_seconds:.2f}s")
+
+
+if __name__ == "__main__":
+    main()
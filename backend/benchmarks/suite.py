@@ -0,0 +1,212 @@
+"""Benchmark suite for the ingest and query hot paths.
+
+Usage (from ``backend/``):
+
+    python -m benchmarks.suite --output bench.json
+    python -m benchmarks.suite --sizes 1k,100k --output new.json --compare bench.json
+
+Reports lines/s for ``parse_log_line`` alone, with ``PathNormalizer`` and
+through ``aggregate_lines``; and, for each rollup table size, rows/s for
+``write_rollups`` and p50/p99 latency of a series query
+(``query_rollups`` plus ``_build_series`` over the default window).
+Inputs come from ``benchmarks.synthetic`` and are identical between runs.
+"""
+from __future__ import annotations
+
+import argparse
+import json
+import os
+import platform
+import sqlite3
+import tempfile
+import time
+from typing import Dict, List
+
+from fizzylog import db
+from fizzylog.api import _build_series
+from fizzylog.ingest import PathNormalizer, aggregate_lines, normalize_path, parse_log_line
+from fizzylog.models import StatusFilter
+
+from .bench_ingest import make_config
+from .bench_series import percentile
+from .synthetic import INCLUDED_PAGES, generate_lines, generate_rollups, rollup_paths
+
+
+DEFAULT_SIZES = "1k,100k,10M"
+FLUSH_ROWS = 5000
+QUERY_PATHS = 5
+SUFFIXES = {"k": 1000, "m": 1000 * 1000}
+
+
+def parse_size(text: str) -> int:
+    text = text.strip().lower()
+    if text and text[-1] in SUFFIXES:
+        return int(float(text[:-1]) * SUFFIXES[text[-1]])
+    return int(text)
+
+
+def rate(count: int, seconds: float) -> float:
+    return count / seconds if seconds > 0 else 0.0
+
+
+def bench_parse(lines: List[str], config) -> Dict[str, float]:
+    # Warm the timestamp decoder's caches so the first pass is not penalised.
+    for line in lines[:1000]:
+        parse_log_line(line)
+    started = time.perf_counter()
+    for line in lines:
+        parse_log_line(line)
+    parse_seconds = time.perf_counter() - started
+
+    normalizer = PathNormalizer(config)
+    started = time.perf_counter()
+    for line in lines:
+        parsed = parse_log_line(line)
+        if parsed is not None:
+            normalizer.normalize(parsed[1])
+    normalize_seconds = time.perf_counter() - started
+
+    # normalize_path has no cache; it shows the cost a cache miss pays.
+    started = time.perf_counter()
+    for line in lines:
+        parsed = parse_log_line(line)
+        if parsed is not None:
+            normalize_path(parsed[1], config)
+    uncached_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    aggregate_lines(lines, config, {}, PathNormalizer(config))
+    aggregate_seconds = time.perf_counter() - started
+
+    return {
+        "parse_lines_per_s": rate(len(lines), parse_seconds),
+        "parse_normalize_lines_per_s": rate(len(lines), normalize_seconds),
+        "parse_normalize_uncached_lines_per_s": rate(len(lines), uncached_seconds),
+        "aggregate_lines_per_s": rate(len(lines), aggregate_seconds),
+    }
+
+
+def bench_rollups(rows: int, config, requests: int, tmpdir: str) -> Dict[str, float]:
+    sqlite_path = os.path.join(tmpdir, f"rollups-{rows}.sqlite")
+    bucket_seconds = config.window.bucket_seconds
+    end_bucket = (int(time.time()) // bucket_seconds) * bucket_seconds
+    db.init_db(sqlite_path, bucket_seconds=bucket_seconds)
+    conn = db.get_connection(sqlite_path)
+    path_index = db.PathIndex()
+    write_seconds = 0.0
+    try:
+        pending: Dict = {}
+        for batch in generate_rollups(rows, end_bucket, bucket_seconds):
+            for bucket, path, status, count in batch:
+                pending[(bucket, path, status)] = count
+            if len(pending) >= FLUSH_ROWS:
+                started = time.perf_counter()
+                db.write_rollups(conn, pending, path_index=path_index)
+                write_seconds += time.perf_counter() - started
+                pending = {}
+        if pending:
+            started = time.perf_counter()
+            db.write_rollups(conn, pending, path_index=path_index)
+            write_seconds += time.perf_counter() - started
+    finally:
+        conn.close()
+
+    paths = rollup_paths()[:QUERY_PATHS]
+    status_filter = StatusFilter(mode="ranges", ranges=["2xx", "3xx"], exact=[])
+    bucket_count = max(1, config.window.lookback_seconds // bucket_seconds)
+    start_bucket = end_bucket - (bucket_count - 1) * bucket_seconds
+    bucket_starts = list(range(start_bucket, end_bucket + 1, bucket_seconds))
+    samples: List[float] = []
+    pool = db.ReadPool(sqlite_path, 1)
+    try:
+        for _ in range(requests):
+            started = time.perf_counter()
+            with pool.connection() as read_conn:
+                result = db.query_rollups(read_conn, paths, status_filter, start_bucket, end_bucket)
+            _build_series(bucket_starts, paths, result)
+            samples.append(time.perf_counter() - started)
+    finally:
+        pool.close()
+    size = os.path.getsize(sqlite_path)
+    os.unlink(sqlite_path)
+    return {
+        "rows": rows,
+        "upsert_rows_per_s": rate(rows, write_seconds),
+        "query_p50_ms": percentile(samples, 0.5) * 1000,
+        "query_p99_ms": percentile(samples, 0.99) * 1000,
+        "db_bytes": size,
+    }
+
+
+def flatten(results: Dict[str, object], prefix: str = "") -> Dict[str, float]:
+    flat: Dict[str, float] = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        elif isinstance(value, (int, float)):
+            flat[name] = float(value)
+    return flat
+
+
+def compare(previous: Dict[str, object], current: Dict[str, object]) -> None:
+    before = flatten(previous.get("results", {}))
+    after = flatten(current["results"])
+    print("\ncomparison with previous run (new / old):")
+    for name, value in after.items():
+        old = before.get(name)
+        if not old:
+            continue
+        print(f"  {name:<48} {old:>14,.2f} -> {value:>14,.2f} ({value / old:.2f}x)")
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(description="fizzylog benchmark suite")
+    parser.add_argument("--lines", type=int, default=200000, help="Synthetic log lines to parse")
+    parser.add_argument("--sizes", default=DEFAULT_SIZES, help="Rollup row counts, e.g. 1k,100k,10M")
+    parser.add_argument("--requests", type=int, default=200, help="Series queries per size")
+    parser.add_argument("--output", help="Write results to this JSON file")
+    parser.add_argument("--compare", help="Previous JSON results to compare with")
+    args = parser.parse_args()
+
+    config = make_config()
+    config.paths.include_exact = list(INCLUDED_PAGES)
+    lines = list(generate_lines(args.lines))
+    results: Dict[str, object] = bench_parse(lines, config)
+    for name, value in results.items():
+        print(f"{name:<40} {value:>14,.0f}")
+
+    rollups: Dict[str, object] = {}
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for label in [item for item in args.sizes.split(",") if item.strip()]:
+            entry = bench_rollups(parse_size(label), config, args.requests, tmpdir)
+            rollups[label.strip()] = entry
+            print(
+                f"rollups {label.strip():>5}: {entry['upsert_rows_per_s']:>12,.0f} rows/s upsert | "
+                f"query p50 {entry['query_p50_ms']:.3f}ms p99 {entry['query_p99_ms']:.3f}ms"
+            )
+    results["rollups"] = rollups
+
+    report = {
+        "meta": {
+            "created_utc": int(time.time()),
+            "python": platform.python_version(),
+            "sqlite": sqlite3.sqlite_version,
+            "platform": platform.platform(),
+            "cpu_count": os.cpu_count(),
+            "lines": args.lines,
+            "requests": args.requests,
+        },
+        "results": results,
+    }
+    if args.compare:
+        with open(args.compare, "r", encoding="utf-8") as handle:
+            compare(json.load(handle), report)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as handle:
+            json.dump(report, handle, indent=2, sort_keys=True)
+            handle.write("\n")
+
+
+if __name__ == "__main__":
+    main()
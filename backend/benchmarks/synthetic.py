@@ -0,0 +1,120 @@
+"""Deterministic synthetic nginx ``combined`` access logs for benchmarks.
+
+The same seed always yields the same lines. The mix covers pages that are
+in ``paths.include_exact``, pages that are not, query strings, static
+assets, every status class and a small share of malformed lines.
+"""
+from __future__ import annotations
+
+import random
+import time
+from typing import Iterator, List, Tuple
+
+
+PAGES = [
+    "/",
+    "/index.html",
+    "/terms.html",
+    "/pricing",
+    "/blog/",
+    "/blog/2024/launch.html",
+    "/docs/getting-started",
+    "/docs/api",
+    "/login",
+    "/search",
+]
+INCLUDED_PAGES = ["/", "/terms.html", "/pricing", "/docs/api", "/login"]
+STATIC_ASSETS = [
+    "/static/app.js",
+    "/static/style.css",
+    "/favicon.ico",
+    "/images/hero.png",
+    "/fonts/inter.woff2",
+]
+QUERY_STRINGS = ["?ref=home", "?utm_source=newsletter&utm_medium=email", "?q=fizzylog", "?page=2"]
+METHODS = ["GET"] * 18 + ["POST", "HEAD"]
+STATUSES = [200] * 30 + [204, 206] + [301, 302] + [304] * 6 + [400, 401, 403] + [404] * 4 + [499, 500, 502, 503]
+USER_AGENTS = [
+    "Mozilla/5.0 (X11; Linux x86_64) AppleWebKit/537.36 (KHTML, like Gecko) Chrome/120.0 Safari/537.36",
+    "Mozilla/5.0 (iPhone; CPU iPhone OS 17_0 like Mac OS X) AppleWebKit/605.1.15 Mobile/15E148",
+    "curl/8.4.0",
+    "Googlebot/2.1 (+http://www.google.com/bot.html)",
+]
+MALFORMED = ['garbage line without fields', '203.0.113.9 - - [bad time] "GET / HTTP/1.1" 200 1 "-" "-"']
+
+# Share of generated lines of each kind.
+STATIC_SHARE = 0.3
+QUERY_SHARE = 0.2
+MALFORMED_SHARE = 0.005
+DEFAULT_START_UTC = 1728568536
+
+
+def _time_local(epoch: int) -> str:
+    return time.strftime("%d/%b/%Y:%H:%M:%S +0000", time.gmtime(epoch))
+
+
+def generate_lines(
+    count: int,
+    seed: int = 1,
+    start_utc: int = DEFAULT_START_UTC,
+    lines_per_second: int = 50,
+) -> Iterator[str]:
+    """Yields ``count`` log lines (without newlines) with advancing timestamps."""
+    rng = random.Random(seed)
+    cached_second = None
+    cached_text = ""
+    for index in range(count):
+        if rng.random() < MALFORMED_SHARE:
+            yield rng.choice(MALFORMED)
+            continue
+        second = start_utc + index // lines_per_second
+        if second != cached_second:
+            cached_second = second
+            cached_text = _time_local(second)
+        if rng.random() < STATIC_SHARE:
+            path = rng.choice(STATIC_ASSETS)
+        else:
+            path = rng.choice(PAGES)
+            if rng.random() < QUERY_SHARE:
+                path += rng.choice(QUERY_STRINGS)
+        yield (
+            f"198.51.100.{rng.randint(1, 254)} - - [{cached_text}] "
+            f'"{rng.choice(METHODS)} {path} HTTP/1.1" {rng.choice(STATUSES)} {rng.randint(0, 65536)} '
+            f'"-" "{rng.choice(USER_AGENTS)}"'
+        )
+
+
+def write_log(path: str, count: int, seed: int = 1, start_utc: int = DEFAULT_START_UTC) -> None:
+    with open(path, "w", encoding="utf-8") as handle:
+        for line in generate_lines(count, seed=seed, start_utc=start_utc):
+            handle.write(line)
+            handle.write("\n")
+
+
+def rollup_paths(paths: int = 50) -> List[str]:
+    return [f"/section-{index}/page.html" for index in range(paths)]
+
+
+def generate_rollups(
+    rows: int,
+    end_bucket_utc: int,
+    bucket_seconds: int = 60,
+    paths: int = 50,
+    statuses: Tuple[int, ...] = (200, 301, 304, 404, 500),
+) -> Iterator[List[Tuple[int, str, int, int]]]:
+    """Yields ``(bucket, path, status, count)`` batches, one bucket per batch,
+    ending at ``end_bucket_utc`` and totalling ``rows`` rows."""
+    names = rollup_paths(paths)
+    per_bucket = paths * len(statuses)
+    buckets = max(1, -(-rows // per_bucket))
+    emitted = 0
+    for index in range(buckets):
+        bucket = end_bucket_utc - (buckets - 1 - index) * bucket_seconds
+        batch = []
+        for path in names:
+            for status in statuses:
+                if emitted == rows:
+                    break
+                batch.append((bucket, path, status, 1 + (index + status) % 7))
+                emitted += 1
+        yield batch
@@ -1,14 +1,64 @@
 from __future__ import annotations
 
-import math
+import asyncio
+import hashlib
+import json
+import threading
 import time
-from typing import Dict, List, Optional
+from collections import OrderedDict
+from concurrent.futures import Future
+from typing import Callable, Dict, Iterable, List, Optional, Tuple
 
-from fastapi import FastAPI, HTTPException
+from fastapi import FastAPI, Header, HTTPException, Response
+from fastapi.responses import StreamingResponse
 
-from .config import Config
-from .db import get_connection, query_rollups
-from .models import resolve_status_filter
+from .config import Config, log_patterns, path_matcher, tier_seconds
+from .db import (
+    ReadPool,
+    query_classes,
+    query_clients,
+    query_clients_total,
+    query_latency,
+    query_rollups,
+    select_step,
+    select_tier,
+)
+from .hll import standard_error
+from .ingest import window_bucket_count
+from .latency import QUANTILES, merge, quantiles
+from .metrics import CONTENT_TYPE, MetricsRegistry
+from .models import STATUS_RANGE_BOUNDS, StatusFilter, resolve_status_filter
+from .stream import Broadcaster, format_event
+
+
+def _offsets(bucket_starts: List[int]) -> Tuple[int, int, int]:
+    """Returns ``(first, step, size)`` of an evenly spaced bucket list, so a
+    bucket's position is ``(bucket - first) // step``."""
+    if not bucket_starts:
+        return 0, 1, 0
+    step = bucket_starts[1] - bucket_starts[0] if len(bucket_starts) > 1 else 1
+    return bucket_starts[0], step, len(bucket_starts)
+
+
+def _fill(bucket_starts: List[int], rows: Iterable[tuple], series: Dict[object, List[int]]) -> None:
+    """Adds ``(bucket, key, value)`` rows into the dense per-key lists of
+    ``series`` by bucket offset. Rows for other keys or buckets outside
+    the list are skipped."""
+    first, step, size = _offsets(bucket_starts)
+    for bucket_start, key, value in rows:
+        values = series.get(key)
+        if values is not None:
+            offset = (bucket_start - first) // step
+            if 0 <= offset < size:
+                # Re-bucketed ranges can get one step bucket from both the
+                # ring and SQLite.
+                values[offset] += value
+
+
+def _rebucket(rows: List[tuple], step: Optional[int]) -> List[tuple]:
+    if step is None:
+        return rows
+    return [((row[0] // step) * step,) + tuple(row[1:]) for row in rows]
 
 
 def _build_series(
@@ -16,26 +66,175 @@ def _build_series(
     paths: List[str],
     rows: List[tuple],
 ) -> List[Dict[str, object]]:
-    counts_by_path: Dict[str, Dict[int, int]] = {path: {} for path in paths}
-    for bucket_start, path, count in rows:
-        if path in counts_by_path:
-            counts_by_path[path][bucket_start] = count
+    counts: Dict[object, List[int]] = {path: [0] * len(bucket_starts) for path in paths}
+    _fill(bucket_starts, rows, counts)
+    return [{"path": path, "counts": counts[path]} for path in paths]
+
+
+def _class_series(
+    bucket_starts: List[int],
+    paths: List[str],
+    rows: List[tuple],
+) -> Dict[str, Dict[str, List[int]]]:
+    """Returns per-path ``{"2xx": [...], ...}`` count lists from
+    ``(bucket, path, status_class, count)`` rows."""
+    classes = {bounds[0] // 100: name for name, bounds in STATUS_RANGE_BOUNDS.items()}
+    counts: Dict[object, List[int]] = {
+        (path, status_class): [0] * len(bucket_starts) for path in paths for status_class in classes
+    }
+    _fill(bucket_starts, ((bucket, (path, status_class), count) for bucket, path, status_class, count in rows), counts)
+    return {
+        path: {name: counts[(path, status_class)] for status_class, name in classes.items()} for path in paths
+    }
+
+
+def _latency_series(
+    bucket_starts: List[int],
+    paths: List[str],
+    rows: List[tuple],
+) -> Dict[str, Dict[str, object]]:
+    """Returns per-path p50/p95/p99 lists (seconds, ``None`` for empty
+    buckets) and the same quantiles over the merged window histogram."""
+    first, step, size = _offsets(bucket_starts)
+    histograms: Dict[str, List[Dict[int, int]]] = {path: [{} for _ in range(size)] for path in paths}
+    for bucket_start, path, index, count in rows:
+        per_bucket = histograms.get(path)
+        offset = (bucket_start - first) // step
+        if per_bucket is not None and 0 <= offset < size:
+            histogram = per_bucket[offset]
+            histogram[index] = histogram.get(index, 0) + count
+    names = [f"p{round(q * 100)}" for q in QUANTILES]
+    result: Dict[str, Dict[str, object]] = {}
+    for path, per_bucket in histograms.items():
+        columns: Dict[str, object] = {name: [] for name in names}
+        for histogram in per_bucket:
+            for name, value in zip(names, quantiles(histogram)):
+                columns[name].append(value)
+        columns["window"] = dict(zip(names, quantiles(merge(per_bucket))))
+        result[path] = columns
+    return result
 
-    series = []
-    for path in paths:
-        path_counts = counts_by_path.get(path, {})
-        counts = [int(path_counts.get(bucket, 0)) for bucket in bucket_starts]
-        series.append({"path": path, "counts": counts})
-    return series
+
+def _client_series(
+    bucket_starts: List[int],
+    paths: List[str],
+    rows: List[tuple],
+    totals: Dict[str, int],
+) -> Dict[str, Dict[str, object]]:
+    """Returns per-path distinct client estimates per bucket and over all
+    the buckets (not the sum, since clients recur across buckets)."""
+    counts: Dict[object, List[int]] = {path: [0] * len(bucket_starts) for path in paths}
+    _fill(bucket_starts, rows, counts)
+    return {path: {"counts": counts[path], "window": totals.get(path, 0)} for path in paths}
+
+
+def _series_paths(static_paths: List[str], rows: List[tuple], limit: int) -> List[str]:
+    """Returns the static paths plus the ``limit`` busiest other paths in ``rows``."""
+    static = set(static_paths)
+    totals: Dict[str, int] = {}
+    for _, path, count in rows:
+        if path not in static:
+            totals[path] = totals.get(path, 0) + count
+    busiest = sorted(totals, key=lambda path: (-totals[path], path))[:limit]
+    return list(static_paths) + sorted(busiest)
+
+
+def _server_timing(timings: Dict[str, float]) -> str:
+    """Formats seconds as a ``Server-Timing`` header value in milliseconds.
+
+    ``open`` is the time to get a pooled connection and ``db`` the query
+    itself; both are absent when the response came from the series cache
+    or the ring alone.
+    """
+    return ", ".join(f"{name};dur={seconds * 1000:.3f}" for name, seconds in timings.items())
+
+
+class SeriesCache:
+    """Pre-serialized series responses for the current flush generation.
+
+    The ingester bumps ``flush_generation`` after each committed flush; the
+    first request for a new generation clears every entry, so between
+    flushes each distinct query (keyed on the ring version when it reads
+    the ring) is computed once no matter how many viewers poll it. Queries are built outside the cache lock: only
+    requests for the same key wait for a build in progress, and once the
+    cache is full the least recently used entry is evicted.
+    """
+
+    def __init__(self, max_entries: int = 256) -> None:
+        self.max_entries = max_entries
+        self._generation: Optional[int] = None
+        self._entries: "OrderedDict[Tuple[object, ...], Tuple[str, bytes]]" = OrderedDict()
+        self._building: Dict[Tuple[object, ...], Future] = {}
+        self._lock = threading.Lock()
+
+    def get(
+        self,
+        key: Tuple[object, ...],
+        generation: int,
+        build: Callable[[], Dict[str, object]],
+    ) -> Tuple[str, bytes]:
+        with self._lock:
+            if generation != self._generation:
+                self._entries.clear()
+                self._generation = generation
+            cached = self._entries.get(key)
+            if cached is not None:
+                self._entries.move_to_end(key)
+                return cached
+            building_key = (generation, key)
+            pending = self._building.get(building_key)
+            if pending is not None:
+                owner = False
+            else:
+                owner = True
+                pending = self._building[building_key] = Future()
+        if not owner:
+            return pending.result()
+
+        try:
+            body = json.dumps(build(), separators=(",", ":")).encode("utf-8")
+        except BaseException as exc:
+            with self._lock:
+                del self._building[building_key]
+            pending.set_exception(exc)
+            raise
+        result = (f'"{hashlib.blake2b(body, digest_size=12).hexdigest()}"', body)
+        with self._lock:
+            del self._building[building_key]
+            if generation == self._generation:
+                self._entries[key] = result
+                while len(self._entries) > self.max_entries:
+                    self._entries.popitem(last=False)
+        pending.set_result(result)
+        return result
+
+
+def _rule_meta(rule) -> Dict[str, Optional[str]]:
+    return {"match": rule.match, "rewrite": rule.rewrite}
 
 
 def create_app(config: Config, ingest_state, sqlite_path: str) -> FastAPI:
     app = FastAPI()
+    matcher = path_matcher(config.paths)
+    # With rules that keep or build the path at ingest time the set of
+    # paths is only known from the data, so every path is read.
+    query_paths = None if matcher.dynamic else matcher.static_paths
 
     @app.get("/api/v1/meta")
     def get_meta() -> Dict[str, object]:
         return {
-            "log": {"path": config.log.path, "format": config.log.format},
+            "log": {
+                "path": config.log.path,
+                "paths": log_patterns(config.log),
+                "format": config.log.format,
+                "latency_variable": config.log.latency_variable,
+            },
+            "clients": {
+                "enabled": config.clients.enabled,
+                "variable": config.clients.variable,
+                "precision": config.clients.precision,
+                "standard_error": standard_error(config.clients.precision),
+            },
             "api": {"port": config.api.port},
             "window": {
                 "lookback_seconds": config.window.lookback_seconds,
@@ -47,6 +246,11 @@ def create_app(config: Config, ingest_state, sqlite_path: str) -> FastAPI:
                 "strip_query_string": config.paths.strip_query_string,
                 "ignore_static_assets": config.paths.ignore_static_assets,
                 "ignore_extensions": list(config.paths.ignore_extensions),
+                "cache_size": config.paths.cache_size,
+                "include_prefix": [_rule_meta(rule) for rule in config.paths.include_prefix],
+                "include_glob": [_rule_meta(rule) for rule in config.paths.include_glob],
+                "include_regex": [_rule_meta(rule) for rule in config.paths.include_regex],
+                "max_dynamic_paths": config.paths.max_dynamic_paths,
             },
             "status_filter": {
                 "default_mode": config.status_filter.default_mode,
@@ -63,14 +267,144 @@ def create_app(config: Config, ingest_state, sqlite_path: str) -> FastAPI:
                 "backend": config.storage.backend,
                 "sqlite_path": config.storage.sqlite_path,
                 "retention_seconds": config.storage.retention_seconds,
+                "tiers": [
+                    {"bucket_seconds": t.bucket_seconds, "retention_seconds": t.retention_seconds}
+                    for t in config.storage.tiers
+                ],
             },
         }
 
+    series_cache = SeriesCache()
+    read_pool = ReadPool(sqlite_path, config.storage.read_pool_size)
+    app.state.read_pool = read_pool
+
+    metrics = getattr(ingest_state, "metrics", None) or MetricsRegistry()
+    series_latency = metrics.histogram("fizzylog_series_seconds", "Time to answer /api/v1/series.")
+
+    def live_window(now_utc: int) -> Tuple[Optional[int], int, int]:
+        """Returns ``(tier, bucket_seconds, end_bucket)`` of the live window."""
+        tier = select_tier(
+            config.window.bucket_seconds,
+            tier_seconds(config.storage),
+            config.window.lookback_seconds,
+            max(1, config.ui.max_points),
+        )
+        bucket_seconds = tier or config.window.bucket_seconds
+        return tier, bucket_seconds, (now_utc // bucket_seconds) * bucket_seconds
+
+    def build_series_payload(
+        status_filter: StatusFilter,
+        tier: Optional[int],
+        bucket_seconds: int,
+        end_bucket: int,
+        since_bucket: Optional[int] = None,
+        timings: Optional[Dict[str, float]] = None,
+        latency: bool = False,
+        clients: bool = False,
+        window_start: Optional[int] = None,
+        by_class: bool = False,
+    ) -> Dict[str, object]:
+        if window_start is None:
+            bucket_count = window_bucket_count(config, bucket_seconds)
+            window_start = end_bucket - (bucket_count - 1) * bucket_seconds
+        # bucket_seconds is the step returned; a coarser step than the level
+        # read is re-bucketed in SQL, and its last bucket ends at level_end.
+        level_seconds = tier or config.window.bucket_seconds
+        step = None if bucket_seconds == level_seconds else bucket_seconds
+        level_end = end_bucket + bucket_seconds - level_seconds
+        start_bucket = window_start
+        if since_bucket is not None:
+            # Delta request: only buckets at or after since_bucket are sent.
+            start_bucket = max(window_start, (since_bucket // bucket_seconds) * bucket_seconds)
+        bucket_starts = list(range(start_bucket, end_bucket + 1, bucket_seconds))
+        # Dynamic paths are ranked over the whole window, even for a delta,
+        # so the list of series does not change with since_bucket.
+        query_start = window_start if matcher.dynamic else start_bucket
+
+        # With range filters the by_class rows also give the filtered
+        # counts, so one query answers both.
+        from_classes = by_class and status_filter.mode == "ranges"
+        rows: List[tuple] = []
+        class_rows: List[tuple] = []
+        # Recent buckets come from the ingester's ring (including counts not
+        # flushed yet); only the older part of the window hits SQLite.
+        db_end = level_end
+        hot = getattr(ingest_state, "hot", None) if tier is None else None
+        hot_start = hot.first_bucket(level_end) if hot is not None else None
+        if bucket_starts and hot_start is not None and hot_start <= level_end:
+            ring_start = max(query_start, hot_start)
+            if by_class:
+                class_rows.extend(_rebucket(hot.query_classes(query_paths, ring_start, level_end), step))
+            if not from_classes:
+                rows.extend(_rebucket(hot.query(query_paths, status_filter, ring_start, level_end), step))
+            db_end = hot_start - level_seconds
+
+        if bucket_starts and db_end >= query_start:
+            started = time.perf_counter()
+            with read_pool.connection() as conn:
+                acquired = time.perf_counter()
+                if by_class:
+                    class_rows.extend(query_classes(conn, query_paths, query_start, db_end, tier, step))
+                if not from_classes:
+                    rows.extend(query_rollups(conn, query_paths, status_filter, query_start, db_end, tier, step))
+            if timings is not None:
+                timings["open"] = acquired - started
+                timings["db"] = time.perf_counter() - acquired
+        if from_classes:
+            wanted = {STATUS_RANGE_BOUNDS[name][0] // 100 for name in status_filter.ranges}
+            rows = [
+                (bucket, path, count) for bucket, path, status_class, count in class_rows if status_class in wanted
+            ]
+
+        paths = matcher.static_paths
+        if matcher.dynamic:
+            paths = _series_paths(paths, rows, config.paths.max_dynamic_paths)
+            rows = [row for row in rows if row[0] >= start_bucket]
+        series = _build_series(bucket_starts, paths, rows)
+        if by_class:
+            by_path = _class_series(bucket_starts, paths, class_rows)
+            for item in series:
+                item["classes"] = by_path[item["path"]]
+        if latency and bucket_starts:
+            # Histograms are only stored in SQLite, so the newest buckets
+            # gain latency once the ingester flushes them.
+            with read_pool.connection() as conn:
+                latency_rows = query_latency(conn, paths, status_filter, start_bucket, level_end, tier, step)
+            by_path = _latency_series(bucket_starts, paths, latency_rows)
+            for item in series:
+                item["latency"] = by_path[item["path"]]
+        if clients and bucket_starts:
+            # Sketches are only stored in SQLite, like latency histograms.
+            with read_pool.connection() as conn:
+                client_rows = query_clients(conn, paths, start_bucket, level_end, tier, step)
+                client_totals = query_clients_total(conn, paths, start_bucket, level_end, tier)
+            by_path = _client_series(bucket_starts, paths, client_rows, client_totals)
+            for item in series:
+                item["clients"] = by_path[item["path"]]
+        return {
+            "bucket_start_utc": bucket_starts,
+            "bucket_seconds": bucket_seconds,
+            "window_start_utc": window_start,
+            "series": series,
+        }
+
     @app.get("/api/v1/series")
     def get_series(
         status_ranges: Optional[str] = None,
         status_exact: Optional[str] = None,
-    ) -> Dict[str, object]:
+        since_bucket: Optional[int] = None,
+        latency: bool = False,
+        clients: bool = False,
+        start: Optional[int] = None,
+        end: Optional[int] = None,
+        by_class: bool = False,
+        if_none_match: Optional[str] = Header(default=None),
+    ) -> Response:
+        started = time.perf_counter()
+        if latency and config.log.latency_variable is None:
+            raise HTTPException(status_code=400, detail="latency is not recorded; set log.latency_variable")
+        if clients and not config.clients.enabled:
+            raise HTTPException(status_code=400, detail="clients are not counted; set clients.enabled")
         try:
             status_filter = resolve_status_filter(
                 config.status_filter.default_mode,
@@ -82,36 +416,159 @@ def create_app(config: Config, ingest_state, sqlite_path: str) -> FastAPI:
         except ValueError as exc:
             raise HTTPException(status_code=400, detail=str(exc)) from exc
 
-        bucket_seconds = config.window.bucket_seconds
         now_utc = int(time.time())
-        end_bucket = (now_utc // bucket_seconds) * bucket_seconds
-        max_points = max(1, config.ui.max_points)
-        requested_points = max(1, math.ceil(config.window.lookback_seconds / bucket_seconds))
-        bucket_count = min(max_points, requested_points)
-        start_bucket = end_bucket - (bucket_count - 1) * bucket_seconds
-        bucket_starts = [start_bucket + i * bucket_seconds for i in range(bucket_count)]
-
-        conn = get_connection(sqlite_path, read_only=True)
-        try:
-            rows = query_rollups(
-                conn,
-                config.paths.include_exact,
+        window_start: Optional[int] = None
+        if start is None and end is None:
+            tier, bucket_seconds, end_bucket = live_window(now_utc)
+        else:
+            # An explicit range: the server picks a step that keeps it
+            # within max_points buckets.
+            if since_bucket is not None:
+                raise HTTPException(status_code=400, detail="since_bucket cannot be combined with start/end")
+            range_end = now_utc if end is None else end
+            range_start = range_end - config.window.lookback_seconds if start is None else start
+            if range_start < 0 or range_start > range_end:
+                raise HTTPException(status_code=400, detail="start must be >= 0 and <= end")
+            levels = [(None, config.window.bucket_seconds, config.storage.retention_seconds)] + [
+                (t.bucket_seconds, t.bucket_seconds, t.retention_seconds) for t in config.storage.tiers
+            ]
+            tier, bucket_seconds = select_step(levels, range_start, range_end, config.ui.max_points, now_utc)
+            window_start = (range_start // bucket_seconds) * bucket_seconds
+            end_bucket = (range_end // bucket_seconds) * bucket_seconds
+
+        hot = getattr(ingest_state, "hot", None)
+        key = (
+            status_filter.mode,
+            tuple(status_filter.ranges),
+            tuple(status_filter.exact),
+            window_start,
+            end_bucket,
+            bucket_seconds,
+            since_bucket,
+            latency,
+            clients,
+            by_class,
+            # Ring counts change between flushes (and keep changing while
+            # flushes fail), so responses that read the ring are keyed on
+            # its version too.
+            hot.version if hot is not None and tier is None else None,
+        )
+        generation = getattr(ingest_state, "flush_generation", 0)
+        timings: Dict[str, float] = {}
+        etag, body = series_cache.get(
+            key,
+            generation,
+            lambda: build_series_payload(
                 status_filter,
-                start_bucket,
+                tier,
+                bucket_seconds,
                 end_bucket,
-            )
-        finally:
-            conn.close()
+                since_bucket,
+                timings,
+                latency,
+                clients,
+                window_start,
+                by_class,
+            ),
+        )
+        timings["total"] = time.perf_counter() - started
+        series_latency.observe(timings["total"])
+        headers = {
+            "ETag": etag,
+            "Cache-Control": "no-cache",
+            "Server-Timing": _server_timing(timings),
+        }
+        if if_none_match and etag in [value.strip() for value in if_none_match.split(",")]:
+            return Response(status_code=304, headers=headers)
+        return Response(content=body, media_type="application/json", headers=headers)
+
+    # Sent instead of the queued updates to a viewer that fell behind; the
+    # UI refetches the series when it sees resync.
+    broadcaster = Broadcaster(format_event("buckets", {"resync": True}))
+    last_stream_end: List[Optional[int]] = [None]
+
+    def publish_flush(generation: int, buckets: List[int]) -> None:
+        hot = getattr(ingest_state, "hot", None)
+        if hot is None or not broadcaster.subscribers:
+            return
+        tier, bucket_seconds, end_bucket = live_window(int(time.time()))
+        if not buckets and end_bucket == last_stream_end[0]:
+            return
+        last_stream_end[0] = end_bucket
+        window_start = end_bucket - (window_bucket_count(config, bucket_seconds) - 1) * bucket_seconds
+        if tier is not None:
+            # The series is served from a coarser tier than the ring's
+            # buckets, so viewers refetch it instead of applying counts.
+            resync = {
+                "resync": True,
+                "generation": generation,
+                "bucket_seconds": bucket_seconds,
+                "window_start_utc": window_start,
+                "end_bucket_utc": end_bucket,
+            }
+            broadcaster.publish(format_event("buckets", resync))
+            return
+        hot_start = hot.first_bucket(end_bucket)
+        if hot_start is None:
+            return
+        changed = [bucket for bucket in buckets if max(window_start, hot_start) <= bucket <= end_bucket]
+        payload: Dict[str, object] = {
+            # Buckets in the window that the ring cannot answer changed too;
+            # subscribers should refetch them through /api/v1/series.
+            "resync": any(window_start <= bucket < hot_start for bucket in buckets),
+            "generation": generation,
+            "bucket_seconds": bucket_seconds,
+            "window_start_utc": window_start,
+            "end_bucket_utc": end_bucket,
+            "bucket_start_utc": changed,
+            "counts": hot.snapshot(changed),
+        }
+        broadcaster.publish(format_event("buckets", payload))
+
+    if hasattr(ingest_state, "flush_listeners"):
+        ingest_state.flush_listeners.append(publish_flush)
+
+    @app.get("/api/v1/stream")
+    async def get_stream() -> StreamingResponse:
+        broadcaster.attach(asyncio.get_running_loop())
+        return StreamingResponse(
+            broadcaster.subscribe(),
+            media_type="text/event-stream",
+            headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+        )
+
+    @app.get("/api/v1/discovery")
+    def get_discovery(limit: int = 20) -> Dict[str, object]:
+        discovery = getattr(ingest_state, "discovery", None)
+        if discovery is None:
+            raise HTTPException(status_code=404, detail="discovery is disabled")
+        if limit <= 0:
+            raise HTTPException(status_code=400, detail="limit must be > 0")
+        bucket_seconds = config.window.bucket_seconds
+        end_bucket = (int(time.time()) // bucket_seconds) * bucket_seconds
+        window_start = end_bucket - (window_bucket_count(config) - 1) * bucket_seconds
+        return {
+            "window_start_utc": window_start,
+            "end_bucket_utc": end_bucket,
+            "capacity": discovery.capacity,
+            "paths": discovery.top(limit, window_start, end_bucket),
+        }
 
-        series = _build_series(bucket_starts, config.paths.include_exact, rows)
-        return {"bucket_start_utc": bucket_starts, "series": series}
+    @app.get("/api/v1/metrics")
+    def get_metrics() -> Response:
+        return Response(content=metrics.render(), media_type=CONTENT_TYPE)
 
     @app.get("/api/v1/health")
     def get_health() -> Dict[str, object]:
+        normalizer = getattr(ingest_state, "normalizer", None)
         return {
             "ok": True,
             "tailing": bool(getattr(ingest_state, "tailing", False)),
             "last_ingest_utc": getattr(ingest_state, "last_ingest_utc", None),
+            "sources": dict(getattr(ingest_state, "sources", {})),
+            "stream_subscribers": broadcaster.subscribers,
+            "read_pool": read_pool.stats(),
+            "path_cache": normalizer.cache_stats() if normalizer is not None else None,
         }
 
     return app
@@ -0,0 +1,274 @@
+from __future__ import annotations
+
+import glob
+import gzip
+import multiprocessing
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from .config import Config, expand_log_paths, tier_seconds
+from . import db, hll
+from .ingest import BlockReader, PathNormalizer, aggregate_lines
+
+
+# Plain files are split into ranges of this size so one large log still
+# spreads across the pool.
+BACKFILL_CHUNK_BYTES = 32 * 1024 * 1024
+BACKFILL_READ_BYTES = 1024 * 1024
+
+
+@dataclass(frozen=True)
+class BackfillUnit:
+    path: str
+    start: int
+    end: Optional[int]
+    compressed: bool = False
+
+
+@dataclass
+class BackfillResult:
+    files: int
+    lines: int
+    parse_errors: int
+    rows: int
+    seconds: float
+    offsets: Dict[str, Tuple[int, int]]
+
+
+def find_rotated_logs(log_path: str, cutoff_utc: int) -> List[str]:
+    """Returns ``access.log.N`` and ``access.log.*.gz`` modified after cutoff."""
+    rotated: List[str] = []
+    for candidate in glob.glob(glob.escape(log_path) + ".*"):
+        suffix = candidate[len(log_path) + 1 :]
+        if not (suffix.isdigit() or suffix.endswith(".gz")):
+            continue
+        try:
+            if os.stat(candidate).st_mtime < cutoff_utc:
+                continue
+        except OSError:
+            continue
+        rotated.append(candidate)
+    return sorted(rotated)
+
+
+def plan_units(paths: List[str], limits: Dict[str, int]) -> List[BackfillUnit]:
+    units: List[BackfillUnit] = []
+    for path in paths:
+        if path.endswith(".gz"):
+            units.append(BackfillUnit(path, 0, None, compressed=True))
+            continue
+        size = limits.get(path)
+        if size is None:
+            try:
+                size = os.stat(path).st_size
+            except OSError:
+                continue
+        for start in range(0, size, BACKFILL_CHUNK_BYTES):
+            units.append(BackfillUnit(path, start, min(start + BACKFILL_CHUNK_BYTES, size)))
+    return units
+
+
+def _read_unit(unit: BackfillUnit):
+    """Yields batches of the lines whose first byte falls inside the unit."""
+    if unit.compressed:
+        with gzip.open(unit.path, "rb") as handle:
+            reader = BlockReader(handle, BACKFILL_READ_BYTES)
+            while True:
+                lines = reader.read()
+                if lines is None:
+                    break
+                yield lines
+            if reader.pending:
+                yield [reader.pending.decode("utf-8", errors="replace")]
+        return
+
+    with open(unit.path, "rb") as handle:
+        if unit.start > 0:
+            handle.seek(unit.start - 1)
+            handle.readline()
+        position = handle.tell()
+        pending = b""
+        while position < unit.end:
+            data = handle.read(min(BACKFILL_READ_BYTES, unit.end - position))
+            if not data:
+                break
+            position += len(data)
+            if position >= unit.end and not data.endswith(b"\n"):
+                data += handle.readline()
+            if pending:
+                data = pending + data
+            cut = data.rfind(b"\n")
+            if cut < 0:
+                pending = data
+                continue
+            pending = data[cut + 1 :]
+            yield data[:cut].decode("utf-8", errors="replace").split("\n")
+        if pending:
+            yield [pending.decode("utf-8", errors="replace")]
+
+
+def _covered(bucket: int, ranges: List[Tuple[int, int]]) -> bool:
+    return any(first <= bucket <= last for first, last in ranges)
+
+
+def _aggregate_unit(
+    unit: BackfillUnit,
+    config: Config,
+    cutoff_utc: int,
+    covered: List[Tuple[int, int]],
+) -> Tuple[
+    Dict[Tuple[int, str, int], int],
+    Dict[Tuple[int, str, int, int], int],
+    Dict[Tuple[int, str], bytes],
+    int,
+    int,
+]:
+    normalizer = PathNormalizer(config)
+    counts: Dict[Tuple[int, str, int], int] = {}
+    latency: Dict[Tuple[int, str, int, int], int] = {}
+    clients: Dict[Tuple[int, str], Dict[int, int]] = {}
+    lines_read = 0
+    parse_errors = 0
+    for lines in _read_unit(unit):
+        lines_read += len(lines)
+        _, errors, _ = aggregate_lines(lines, config, counts, normalizer, latency=latency, clients=clients)
+        parse_errors += errors
+
+    def keep(bucket: int) -> bool:
+        return bucket >= cutoff_utc and not _covered(bucket, covered)
+
+    filtered = {key: count for key, count in counts.items() if keep(key[0])}
+    filtered_latency = {key: count for key, count in latency.items() if keep(key[0])}
+    sketches: Dict[Tuple[int, str], bytes] = {}
+    for key, ranks in clients.items():
+        if keep(key[0]):
+            registers = bytearray(1 << config.clients.precision)
+            hll.apply(registers, ranks)
+            sketches[key] = bytes(registers)
+    return filtered, filtered_latency, sketches, lines_read, parse_errors
+
+
+def _complete_size(handle, size: int) -> int:
+    """Returns the offset just past the last newline at or before ``size``."""
+    end = size
+    while end > 0:
+        start = max(0, end - BACKFILL_READ_BYTES)
+        handle.seek(start)
+        cut = handle.read(end - start).rfind(b"\n")
+        if cut >= 0:
+            return start + cut + 1
+        end = start
+    return 0
+
+
+def snapshot_offsets(paths: List[str]) -> Dict[str, Tuple[int, int]]:
+    """Returns ``(inode, offset)`` of the last complete line of each log."""
+    offsets: Dict[str, Tuple[int, int]] = {}
+    for path in paths:
+        try:
+            with open(path, "rb") as handle:
+                stat = os.fstat(handle.fileno())
+                offsets[path] = (stat.st_ino, _complete_size(handle, stat.st_size))
+        except OSError:
+            continue
+    return offsets
+
+
+def run_backfill(config: Config, sqlite_path: str, workers: int = 0) -> BackfillResult:
+    """Loads rotated logs and the live logs up to their last complete line.
+
+    Only buckets inside the retention window that no earlier ingest or
+    backfill covered for the same log are written, so running it against
+    a database the live ingester has filled never double-counts, while
+    another log's history or lines written during downtime are still
+    loaded. The bucket a live run started in counts as covered, so lines
+    before the run started in that bucket are not loaded. Live logs that
+    already have an ingest checkpoint are left to their tailer. The
+    ``(inode, offset)`` reached in every other live log is stored as its
+    checkpoint in the same transaction and returned in ``offsets``.
+    """
+    started = time.perf_counter()
+    cutoff_utc = int(time.time()) - config.storage.retention_seconds
+
+    tiers = tier_seconds(config.storage)
+    db.init_db(sqlite_path, tiers, config.window.bucket_seconds)
+    conn = db.get_connection(sqlite_path)
+    try:
+        coverage = db.load_coverage(conn)
+        checkpoints = db.load_checkpoints(conn)
+        live_paths = expand_log_paths(config.log)
+        # Logs with a checkpoint are resumed losslessly by their tailer.
+        offsets = snapshot_offsets([path for path in live_paths if path not in checkpoints])
+
+        # The live log each file's lines belong to.
+        sources: Dict[str, str] = {}
+        for path in live_paths:
+            for rotated in find_rotated_logs(path, cutoff_utc):
+                sources.setdefault(rotated, path)
+            if path in offsets:
+                sources[path] = path
+        files = list(sources)
+        limits = {path: size for path, (_, size) in offsets.items()}
+        units = plan_units(files, limits)
+        shared = coverage.get(db.ALL_SOURCES, [])
+
+        merged: Dict[Tuple[int, str, int], int] = {}
+        merged_latency: Dict[Tuple[int, str, int, int], int] = {}
+        merged_clients: Dict[Tuple[int, str], bytes] = {}
+        # (first, last) bucket written per log, so a later run skips them.
+        loaded: Dict[str, Tuple[int, int]] = {}
+        lines_read = 0
+        parse_errors = 0
+        if units:
+            max_workers = workers or os.cpu_count() or 1
+            with ProcessPoolExecutor(
+                max_workers=min(max_workers, len(units)),
+                mp_context=multiprocessing.get_context("spawn"),
+            ) as executor:
+                futures = [
+                    (
+                        sources[unit.path],
+                        executor.submit(
+                            _aggregate_unit,
+                            unit,
+                            config,
+                            cutoff_utc,
+                            coverage.get(sources[unit.path], []) + shared,
+                        ),
+                    )
+                    for unit in units
+                ]
+                for source, future in futures:
+                    counts, latency, clients, unit_lines, unit_errors = future.result()
+                    lines_read += unit_lines
+                    parse_errors += unit_errors
+                    if counts:
+                        buckets = [key[0] for key in counts]
+                        first, last = min(buckets), max(buckets)
+                        if source in loaded:
+                            first, last = min(first, loaded[source][0]), max(last, loaded[source][1])
+                        loaded[source] = (first, last)
+                    for key, count in counts.items():
+                        merged[key] = merged.get(key, 0) + count
+                    for key, count in latency.items():
+                        merged_latency[key] = merged_latency.get(key, 0) + count
+                    for key, registers in clients.items():
+                        current = merged_clients.get(key)
+                        merged_clients[key] = registers if current is None else hll.union(current, registers)
+        db.write_rollups(
+            conn, merged, offsets, tiers, latency=merged_latency, clients=merged_clients, coverage=loaded
+        )
+    finally:
+        conn.close()
+
+    return BackfillResult(
+        files=len(files),
+        lines=lines_read,
+        parse_errors=parse_errors,
+        rows=len(merged),
+        seconds=time.perf_counter() - started,
+        offsets=offsets,
+    )
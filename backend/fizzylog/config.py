@@ -1,11 +1,16 @@
 from __future__ import annotations
 
 from dataclasses import dataclass, field
-from typing import Dict, List, Any
+from typing import Dict, Iterable, List, Any, Optional, Set
+import glob
 import os
 
 import yaml
 
+from .formats import compile_log_format
+from .hll import DEFAULT_PRECISION, MAX_PRECISION, MIN_PRECISION
+from .pathrules import PathMatcher, PathRule, compile_path_rules
+
 
 DEFAULT_IGNORE_EXTENSIONS = [
     ".css",
@@ -26,8 +31,10 @@ DEFAULT_IGNORE_EXTENSIONS = [
 
 @dataclass
 class LogConfig:
-    path: str
+    path: str = ""
     format: str = "nginx_combined"
+    paths: List[str] = field(default_factory=list)
+    latency_variable: Optional[str] = None
 
 
 @dataclass
@@ -48,6 +55,12 @@ class PathsConfig:
     strip_query_string: bool = True
     ignore_static_assets: bool = True
     ignore_extensions: List[str] = field(default_factory=lambda: list(DEFAULT_IGNORE_EXTENSIONS))
+    cache_size: int = 4096
+    include_prefix: List[PathRule] = field(default_factory=list)
+    include_glob: List[PathRule] = field(default_factory=list)
+    include_regex: List[PathRule] = field(default_factory=list)
+    max_dynamic_paths: int = 50
+    max_paths_per_bucket: int = 1000
 
 
 @dataclass
@@ -65,16 +78,52 @@ class UIConfig:
     title: str = "fizzylog"
 
 
+@dataclass(frozen=True)
+class TierConfig:
+    bucket_seconds: int
+    retention_seconds: int
+
+
+DEFAULT_TIERS = (
+    TierConfig(bucket_seconds=600, retention_seconds=604800),
+    TierConfig(bucket_seconds=3600, retention_seconds=2592000),
+)
+
+
 @dataclass
 class StorageConfig:
     backend: str = "sqlite"
     sqlite_path: str = "/var/lib/fizzylog/rollups.sqlite"
     retention_seconds: int = 43200
+    tiers: List[TierConfig] = field(default_factory=lambda: list(DEFAULT_TIERS))
+    read_pool_size: int = 8
 
 
 @dataclass
 class IngestConfig:
     flush_seconds: int = 2
+    flush_max_keys: int = 50000
+    flush_max_events: int = 1000000
+    flush_target_seconds: float = 0.25
+    max_tailers: int = 16
+    read_mode: str = "block"
+    read_chunk_bytes: int = 262144
+    watch: str = "auto"
+    backfill_on_start: bool = False
+    backfill_workers: int = 0
+
+
+@dataclass
+class DiscoveryConfig:
+    enabled: bool = False
+    capacity: int = 200
+
+
+@dataclass
+class ClientsConfig:
+    enabled: bool = False
+    variable: str = "remote_addr"
+    precision: int = DEFAULT_PRECISION
 
 
 @dataclass
@@ -87,6 +136,8 @@ class Config:
     ui: UIConfig
     storage: StorageConfig
     ingest: IngestConfig
+    discovery: DiscoveryConfig = field(default_factory=DiscoveryConfig)
+    clients: ClientsConfig = field(default_factory=ClientsConfig)
 
 
 def _normalize_extensions(values: List[str]) -> List[str]:
@@ -104,6 +155,28 @@ def _normalize_extensions(values: List[str]) -> List[str]:
     return normalized
 
 
+def _parse_rules(values: Any, key: str) -> List[PathRule]:
+    if values is None:
+        return []
+    if not isinstance(values, list):
+        raise ValueError(f"paths.{key} must be a list")
+    rules: List[PathRule] = []
+    for item in values:
+        if isinstance(item, dict):
+            if "match" not in item:
+                raise ValueError(f"paths.{key} entries need a 'match' key")
+            rewrite = item.get("rewrite")
+            rules.append(PathRule(str(item["match"]), None if rewrite is None else str(rewrite)))
+        else:
+            rules.append(PathRule(str(item)))
+    return rules
+
+
+def path_matcher(paths: PathsConfig) -> PathMatcher:
+    """Returns the compiled include rules of ``paths`` (cached)."""
+    return compile_path_rules(paths.include_exact, paths.include_regex, paths.include_glob, paths.include_prefix)
+
+
 def _get_section(data: Dict[str, Any], key: str) -> Dict[str, Any]:
     section = data.get(key)
     if section is None:
@@ -123,11 +196,22 @@ def load_config(path: str) -> Config:
         raise ValueError("Config file must be a mapping at top level")
 
     log_section = _get_section(data, "log")
-    if "path" not in log_section:
-        raise ValueError("log.path is required")
+    log_paths = log_section.get("paths")
+    if log_paths is None:
+        log_paths = []
+    elif isinstance(log_paths, str):
+        log_paths = [log_paths]
+    elif not isinstance(log_paths, list):
+        raise ValueError("log.paths must be a list or a glob string")
+    log_paths = [str(item) for item in log_paths]
+    if "path" not in log_section and not log_paths:
+        raise ValueError("log.path or log.paths is required")
+    latency_variable = log_section.get("latency_variable")
     log_cfg = LogConfig(
-        path=str(log_section["path"]),
+        path=str(log_section.get("path", "")),
         format=str(log_section.get("format", "nginx_combined")),
+        paths=log_paths,
+        latency_variable=None if latency_variable is None else str(latency_variable),
     )
 
     api_section = _get_section(data, "api")
@@ -143,11 +227,19 @@ def load_config(path: str) -> Config:
 
     paths_section = _get_section(data, "paths")
     include_exact = paths_section.get("include_exact")
-    if not include_exact:
-        raise ValueError("paths.include_exact is required and must be a non-empty list")
+    if include_exact is None:
+        include_exact = []
     if not isinstance(include_exact, list):
         raise ValueError("paths.include_exact must be a list")
     include_exact = [str(item) for item in include_exact]
+    include_prefix = _parse_rules(paths_section.get("include_prefix"), "include_prefix")
+    include_glob = _parse_rules(paths_section.get("include_glob"), "include_glob")
+    include_regex = _parse_rules(paths_section.get("include_regex"), "include_regex")
+    if not (include_exact or include_prefix or include_glob or include_regex):
+        raise ValueError(
+            "paths.include_exact (or include_prefix, include_glob, include_regex) is required "
+            "and must be a non-empty list"
+        )
 
     aliases = paths_section.get("aliases", {"/index.html": "/"})
     if aliases is None:
@@ -168,6 +260,12 @@ def load_config(path: str) -> Config:
         strip_query_string=bool(paths_section.get("strip_query_string", True)),
         ignore_static_assets=bool(paths_section.get("ignore_static_assets", True)),
         ignore_extensions=_normalize_extensions([str(v) for v in ignore_extensions]),
+        cache_size=int(paths_section.get("cache_size", 4096)),
+        include_prefix=include_prefix,
+        include_glob=include_glob,
+        include_regex=include_regex,
+        max_dynamic_paths=int(paths_section.get("max_dynamic_paths", 50)),
+        max_paths_per_bucket=int(paths_section.get("max_paths_per_bucket", 1000)),
     )
 
     status_section = _get_section(data, "status_filter")
@@ -191,29 +289,116 @@ def load_config(path: str) -> Config:
     )
 
     storage_section = _get_section(data, "storage")
+    tiers_section = storage_section.get("tiers")
+    if tiers_section is None:
+        tiers = list(DEFAULT_TIERS) if "tiers" not in storage_section else []
+    elif not isinstance(tiers_section, list):
+        raise ValueError("storage.tiers must be a list")
+    else:
+        tiers = []
+        for entry in tiers_section:
+            if not isinstance(entry, dict) or "bucket_seconds" not in entry or "retention_seconds" not in entry:
+                raise ValueError("storage.tiers entries need bucket_seconds and retention_seconds")
+            tiers.append(
+                TierConfig(
+                    bucket_seconds=int(entry["bucket_seconds"]),
+                    retention_seconds=int(entry["retention_seconds"]),
+                )
+            )
     storage_cfg = StorageConfig(
         backend=str(storage_section.get("backend", "sqlite")),
         sqlite_path=str(storage_section.get("sqlite_path", "/var/lib/fizzylog/rollups.sqlite")),
         retention_seconds=int(storage_section.get("retention_seconds", 43200)),
+        tiers=sorted(tiers, key=lambda tier: tier.bucket_seconds),
+        read_pool_size=int(storage_section.get("read_pool_size", 8)),
     )
 
     ingest_section = _get_section(data, "ingest")
     ingest_cfg = IngestConfig(
         flush_seconds=int(ingest_section.get("flush_seconds", 2)),
+        flush_max_keys=int(ingest_section.get("flush_max_keys", 50000)),
+        flush_max_events=int(ingest_section.get("flush_max_events", 1000000)),
+        flush_target_seconds=float(ingest_section.get("flush_target_seconds", 0.25)),
+        max_tailers=int(ingest_section.get("max_tailers", 16)),
+        read_mode=str(ingest_section.get("read_mode", "block")),
+        read_chunk_bytes=int(ingest_section.get("read_chunk_bytes", 262144)),
+        watch=str(ingest_section.get("watch", "auto")),
+        backfill_on_start=bool(ingest_section.get("backfill_on_start", False)),
+        backfill_workers=int(ingest_section.get("backfill_workers", 0)),
+    )
+
+    discovery_section = _get_section(data, "discovery")
+    discovery_cfg = DiscoveryConfig(
+        enabled=bool(discovery_section.get("enabled", False)),
+        capacity=int(discovery_section.get("capacity", 200)),
+    )
+
+    clients_section = _get_section(data, "clients")
+    clients_cfg = ClientsConfig(
+        enabled=bool(clients_section.get("enabled", False)),
+        variable=str(clients_section.get("variable", "remote_addr")).lstrip("$"),
+        precision=int(clients_section.get("precision", DEFAULT_PRECISION)),
     )
 
-    if log_cfg.format != "nginx_combined":
-        raise ValueError("Only nginx_combined log format is supported")
+    try:
+        compile_log_format(log_cfg.format, log_cfg.latency_variable)
+    except ValueError as exc:
+        raise ValueError(f"log.format: {exc}") from exc
+    if clients_cfg.enabled:
+        try:
+            compile_log_format(log_cfg.format, log_cfg.latency_variable, clients_cfg.variable)
+        except ValueError as exc:
+            raise ValueError(f"clients.variable: {exc}") from exc
+    if not MIN_PRECISION <= clients_cfg.precision <= MAX_PRECISION:
+        raise ValueError(f"clients.precision must be between {MIN_PRECISION} and {MAX_PRECISION}")
     if api_cfg.port <= 0 or api_cfg.port > 65535:
         raise ValueError("api.port must be between 1 and 65535")
+    if paths_cfg.cache_size < 0:
+        raise ValueError("paths.cache_size must be >= 0")
+    if paths_cfg.max_dynamic_paths < 0:
+        raise ValueError("paths.max_dynamic_paths must be >= 0")
+    if paths_cfg.max_paths_per_bucket < 0:
+        raise ValueError("paths.max_paths_per_bucket must be >= 0")
+    try:
+        path_matcher(paths_cfg)
+    except ValueError as exc:
+        raise ValueError(f"paths: {exc}") from exc
     if window_cfg.bucket_seconds <= 0:
         raise ValueError("window.bucket_seconds must be > 0")
     if window_cfg.lookback_seconds <= 0:
         raise ValueError("window.lookback_seconds must be > 0")
     if ingest_cfg.flush_seconds <= 0:
         raise ValueError("ingest.flush_seconds must be > 0")
+    if ingest_cfg.flush_max_keys <= 0:
+        raise ValueError("ingest.flush_max_keys must be > 0")
+    if ingest_cfg.flush_max_events <= 0:
+        raise ValueError("ingest.flush_max_events must be > 0")
+    if ingest_cfg.flush_target_seconds <= 0:
+        raise ValueError("ingest.flush_target_seconds must be > 0")
+    if discovery_cfg.capacity <= 0:
+        raise ValueError("discovery.capacity must be > 0")
+    if ingest_cfg.max_tailers <= 0:
+        raise ValueError("ingest.max_tailers must be > 0")
+    if ingest_cfg.backfill_workers < 0:
+        raise ValueError("ingest.backfill_workers must be >= 0")
+    if ingest_cfg.read_mode not in ("block", "line"):
+        raise ValueError("ingest.read_mode must be 'block' or 'line'")
+    if ingest_cfg.read_chunk_bytes <= 0:
+        raise ValueError("ingest.read_chunk_bytes must be > 0")
+    if ingest_cfg.watch not in ("auto", "inotify", "poll"):
+        raise ValueError("ingest.watch must be 'auto', 'inotify' or 'poll'")
     if storage_cfg.retention_seconds <= 0:
         raise ValueError("storage.retention_seconds must be > 0")
+    tier_seconds = [tier.bucket_seconds for tier in storage_cfg.tiers]
+    if len(set(tier_seconds)) != len(tier_seconds):
+        raise ValueError("storage.tiers bucket_seconds must be unique")
+    for tier in storage_cfg.tiers:
+        if tier.bucket_seconds <= window_cfg.bucket_seconds or tier.bucket_seconds % window_cfg.bucket_seconds:
+            raise ValueError("storage.tiers bucket_seconds must be a multiple of window.bucket_seconds")
+        if tier.retention_seconds <= 0:
+            raise ValueError("storage.tiers retention_seconds must be > 0")
+    if storage_cfg.read_pool_size <= 0:
+        raise ValueError("storage.read_pool_size must be > 0")
     if ui_cfg.time_default not in ("local", "utc"):
         raise ValueError("ui.time_default must be 'local' or 'utc'")
 
@@ -226,9 +411,53 @@ def load_config(path: str) -> Config:
         ui=ui_cfg,
         storage=storage_cfg,
         ingest=ingest_cfg,
+        discovery=discovery_cfg,
+        clients=clients_cfg,
     )
 
 
+def log_patterns(log: LogConfig) -> List[str]:
+    """Returns the configured log paths and globs, ``log.path`` included."""
+    patterns = list(log.paths)
+    if log.path and log.path not in patterns:
+        patterns.insert(0, log.path)
+    return patterns
+
+
+def expand_log_paths(log: LogConfig, tailed: Iterable[str] = ()) -> List[str]:
+    """Resolves globs to the access logs that currently exist.
+
+    Literal paths are kept even when missing so their tailer can wait for
+    the file to appear. Compressed rotations (``*.gz``) are never tailed,
+    nor are plain rotations (``access.log.1``) of another resolved log:
+    those hold lines its tailer already read, and backfill loads them.
+    ``tailed`` names logs already being followed, so a rescan that runs
+    while a rotated log has not been recreated yet still skips its
+    rotations.
+    """
+    resolved: List[str] = []
+    for pattern in log_patterns(log):
+        if glob.has_magic(pattern):
+            matches = sorted(glob.glob(pattern))
+        else:
+            matches = [pattern]
+        for match in matches:
+            if match.endswith(".gz") or match in resolved:
+                continue
+            resolved.append(match)
+    logs = set(resolved).union(tailed)
+    return [path for path in resolved if not _is_rotation(path, logs)]
+
+
+def _is_rotation(path: str, logs: Set[str]) -> bool:
+    base, _, suffix = path.rpartition(".")
+    return suffix.isdigit() and base in logs
+
+
+def tier_seconds(storage: StorageConfig) -> List[int]:
+    return [tier.bucket_seconds for tier in storage.tiers]
+
+
 def storage_dsn(storage: StorageConfig) -> str:
     if storage.backend == "memory":
         return "file:fizzylog?mode=memory&cache=shared"
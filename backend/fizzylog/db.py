@@ -1,24 +1,230 @@
 from __future__ import annotations
 
+import math
+import operator
 import os
 import sqlite3
-from typing import Dict, Iterable, List, Tuple
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
 
+from . import hll
 from .models import StatusFilter, STATUS_RANGE_BOUNDS
 
 
 SCHEMA = """
-CREATE TABLE IF NOT EXISTS rollup_counts (
-    bucket_start_utc INTEGER NOT NULL,
+CREATE TABLE IF NOT EXISTS paths (
+    path_id INTEGER PRIMARY KEY,
+    path TEXT NOT NULL UNIQUE
+);
+CREATE TABLE IF NOT EXISTS rollup_levels (
+    name TEXT PRIMARY KEY,
+    bucket_seconds INTEGER NOT NULL,
+    partition_seconds INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest_checkpoints (
+    path TEXT PRIMARY KEY,
+    inode INTEGER NOT NULL,
+    offset INTEGER NOT NULL,
+    updated_utc INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS ingest_coverage (
     path TEXT NOT NULL,
+    start_utc INTEGER NOT NULL,
+    end_utc INTEGER NOT NULL,
+    PRIMARY KEY (path, start_utc)
+);
+"""
+
+
+# Each rollup level (the base buckets and every tier) is stored as one
+# table per time partition, named ``<level>_p<partition start>``, so
+# retention drops whole tables instead of deleting rows. Paths are stored
+# as ids from ``paths``; the primary key leads with ``(path_id,
+# bucket_start_utc)`` so the series query is answered from the clustered
+# WITHOUT ROWID table alone.
+PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    path_id INTEGER NOT NULL,
+    bucket_start_utc INTEGER NOT NULL,
     status INTEGER NOT NULL,
     count INTEGER NOT NULL,
-    PRIMARY KEY (bucket_start_utc, path, status)
-);
-CREATE INDEX IF NOT EXISTS idx_rollup_time ON rollup_counts (bucket_start_utc);
-CREATE INDEX IF NOT EXISTS idx_rollup_path_time ON rollup_counts (path, bucket_start_utc);
+    PRIMARY KEY (path_id, bucket_start_utc, status)
+) WITHOUT ROWID
+"""
+
+# Latency histograms (see ``latency``) use the same partitioned levels,
+# named after ``latency_table``, with one row per log-scale bin.
+LATENCY_PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    path_id INTEGER NOT NULL,
+    bucket_start_utc INTEGER NOT NULL,
+    status INTEGER NOT NULL,
+    bin INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path_id, bucket_start_utc, status, bin)
+) WITHOUT ROWID
+"""
+
+# Counts per status class (status // 100) use the same partitioned
+# levels, named after ``class_table``. They are written alongside the
+# per-status rows, so range filters such as 2xx,3xx read fewer rows and
+# match on ``status_class IN (...)`` instead of a chain of BETWEENs.
+CLASS_PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    path_id INTEGER NOT NULL,
+    bucket_start_utc INTEGER NOT NULL,
+    status_class INTEGER NOT NULL,
+    count INTEGER NOT NULL,
+    PRIMARY KEY (path_id, bucket_start_utc, status_class)
+) WITHOUT ROWID
+"""
+
+# Distinct-client sketches (see ``hll``), one fixed-size HyperLogLog blob
+# per path and bucket in levels named after ``client_table``. Upserts and
+# queries merge them with the ``hll_union``/``hll_merge`` SQL functions
+# every connection registers.
+CLIENT_PARTITION_SCHEMA = """
+CREATE TABLE IF NOT EXISTS {table} (
+    path_id INTEGER NOT NULL,
+    bucket_start_utc INTEGER NOT NULL,
+    registers BLOB NOT NULL,
+    PRIMARY KEY (path_id, bucket_start_utc)
+) WITHOUT ROWID
 """
 
+# 1: time-partitioned rollups. 2: interned path ids, WITHOUT ROWID.
+# 3: per-log ingest coverage.
+SCHEMA_VERSION = 3
+# ingest_coverage path whose ranges apply to every log.
+ALL_SOURCES = "*"
+PARTITION_LENGTHS = (3600, 86400, 604800)
+# Partitions read per statement, well under SQLite's compound SELECT limit.
+MAX_UNION_PARTITIONS = 64
+# Path ids resolved per statement, well under SQLite's variable limit.
+PATH_LOOKUP_CHUNK = 500
+# Path ids a PathIndex keeps before starting over from the paths in use.
+MAX_CACHED_PATHS = 100000
+# Key columns after (bucket_start_utc, path_id) of each partition schema.
+COUNT_KEY = ("status",)
+LATENCY_KEY = ("status", "bin")
+CLASS_KEY = ("status_class",)
+
+
+def tier_table(tier_seconds: Optional[int] = None) -> str:
+    """Returns the rollup level name for a coarser tier, or the base level for None."""
+    if tier_seconds is None:
+        return "rollup_counts"
+    return f"rollup_counts_{int(tier_seconds)}"
+
+
+def latency_table(tier_seconds: Optional[int] = None) -> str:
+    """Returns the latency histogram level name for a tier, or the base level for None."""
+    if tier_seconds is None:
+        return "latency_counts"
+    return f"latency_counts_{int(tier_seconds)}"
+
+
+def class_table(tier_seconds: Optional[int] = None) -> str:
+    """Returns the status class level name for a tier, or the base level for None."""
+    if tier_seconds is None:
+        return "class_counts"
+    return f"class_counts_{int(tier_seconds)}"
+
+
+def client_table(tier_seconds: Optional[int] = None) -> str:
+    """Returns the client sketch level name for a tier, or the base level for None."""
+    if tier_seconds is None:
+        return "client_sketches"
+    return f"client_sketches_{int(tier_seconds)}"
+
+
+def partition_seconds(bucket_seconds: int) -> int:
+    """Returns the partition length for a level: hourly for minute buckets,
+    daily for 10-minute buckets, weekly for hourly ones."""
+    for length in PARTITION_LENGTHS:
+        if length >= bucket_seconds * 60:
+            return length
+    return bucket_seconds * 60
+
+
+def _partition_table(level: str, start_utc: int) -> str:
+    return f"{level}_p{int(start_utc)}"
+
+
+def _load_levels(conn: sqlite3.Connection) -> Dict[str, int]:
+    return {
+        str(row[0]): int(row[1])
+        for row in conn.execute("SELECT name, partition_seconds FROM rollup_levels")
+    }
+
+
+def _list_partitions(conn: sqlite3.Connection, level: str) -> List[Tuple[int, str]]:
+    """Returns ``(start, table)`` of the level's partitions, oldest first."""
+    prefix = f"{level}_p"
+    rows = conn.execute(
+        "SELECT name FROM sqlite_master WHERE type = 'table' AND name GLOB ?",
+        (prefix + "[0-9]*",),
+    ).fetchall()
+    partitions = []
+    for row in rows:
+        suffix = str(row[0])[len(prefix) :]
+        if suffix.isdigit():
+            partitions.append((int(suffix), str(row[0])))
+    return sorted(partitions)
+
+
+def select_tier(
+    bucket_seconds: int,
+    tiers: Sequence[int],
+    window_seconds: int,
+    max_points: int,
+) -> Optional[int]:
+    """Picks the coarsest tier that still yields ``max_points`` buckets over the window.
+
+    Returns None when only the base granularity is fine enough.
+    """
+    chosen = None
+    for tier in sorted(tiers):
+        if tier > bucket_seconds and window_seconds // tier >= max_points:
+            chosen = tier
+    return chosen
+
+
+def select_step(
+    levels: Sequence[Tuple[Optional[int], int, int]],
+    start_utc: int,
+    end_utc: int,
+    max_points: int,
+    now_utc: int,
+) -> Tuple[Optional[int], int]:
+    """Picks the level to read and the step to re-bucket it to for an
+    arbitrary ``[start_utc, end_utc]`` range.
+
+    ``levels`` holds ``(tier, bucket_seconds, retention_seconds)`` with
+    ``tier=None`` for the base level. Among the levels whose retention
+    still covers ``start_utc`` (or the longest-kept one if none does),
+    the coarsest one no coarser than the step needed is read. The step
+    is the smallest multiple of its bucket size that fits the range in
+    ``max_points`` aligned buckets. Returns ``(tier, step)``.
+    """
+    max_points = max(1, max_points)
+    needed = max(1, math.ceil((end_utc - start_utc + 1) / max_points))
+    covering = [level for level in levels if now_utc - level[2] <= start_utc]
+    if not covering:
+        covering = [max(levels, key=lambda level: level[2])]
+    fine_enough = [level for level in covering if level[1] <= needed]
+    if fine_enough:
+        tier, bucket_seconds, _ = max(fine_enough, key=lambda level: level[1])
+    else:
+        tier, bucket_seconds, _ = min(covering, key=lambda level: level[1])
+    step = math.ceil(needed / bucket_seconds) * bucket_seconds
+    # Aligning both ends to the step can add one bucket.
+    while end_utc // step - start_utc // step + 1 > max_points:
+        step += bucket_seconds
+    return tier, step
+
 
 def _apply_pragmas(conn: sqlite3.Connection) -> None:
     conn.execute("PRAGMA journal_mode=WAL;")
@@ -26,20 +232,215 @@ def _apply_pragmas(conn: sqlite3.Connection) -> None:
     conn.execute("PRAGMA busy_timeout=5000;")
 
 
-def get_connection(sqlite_path: str, read_only: bool = False) -> sqlite3.Connection:
+def get_connection(
+    sqlite_path: str,
+    read_only: bool = False,
+    check_same_thread: bool = True,
+) -> sqlite3.Connection:
     if sqlite_path.startswith("file:"):
-        conn = sqlite3.connect(sqlite_path, uri=True, timeout=30)
+        conn = sqlite3.connect(sqlite_path, uri=True, timeout=30, check_same_thread=check_same_thread)
     elif read_only:
         uri = f"file:{sqlite_path}?mode=ro"
-        conn = sqlite3.connect(uri, uri=True, timeout=30)
+        conn = sqlite3.connect(uri, uri=True, timeout=30, check_same_thread=check_same_thread)
     else:
-        conn = sqlite3.connect(sqlite_path, timeout=30)
+        conn = sqlite3.connect(sqlite_path, timeout=30, check_same_thread=check_same_thread)
     conn.row_factory = sqlite3.Row
     _apply_pragmas(conn)
+    hll.register_functions(conn)
     return conn
 
 
-def init_db(sqlite_path: str) -> None:
+def _file_identity(sqlite_path: str) -> Optional[Tuple[int, int]]:
+    if sqlite_path.startswith("file:") or sqlite_path == ":memory:":
+        return None
+    try:
+        stat = os.stat(sqlite_path)
+    except OSError:
+        return None
+    return (stat.st_dev, stat.st_ino)
+
+
+class ReadPool:
+    """Bounded pool of long-lived read-only connections.
+
+    Connections keep SQLite's page cache and statement cache between
+    requests, so each request only pays for its query. A connection is
+    used by one thread at a time but may move between the API's worker
+    threads, hence ``check_same_thread=False``. At most
+    ``max_size`` idle connections are kept; a connection is discarded
+    when it is handed out if the database file has been replaced since
+    it was opened (different device or inode).
+    """
+
+    def __init__(self, sqlite_path: str, max_size: int = 8) -> None:
+        self.sqlite_path = sqlite_path
+        self.max_size = max(1, max_size)
+        self._idle: List[Tuple[sqlite3.Connection, Optional[Tuple[int, int]]]] = []
+        self._lock = threading.Lock()
+        self.opened = 0
+        self.reused = 0
+
+    def acquire(self) -> Tuple[sqlite3.Connection, Optional[Tuple[int, int]]]:
+        identity = _file_identity(self.sqlite_path)
+        while True:
+            with self._lock:
+                if not self._idle:
+                    self.opened += 1
+                    break
+                conn, opened_identity = self._idle.pop()
+                if opened_identity == identity:
+                    self.reused += 1
+                    return conn, opened_identity
+            conn.close()
+        return get_connection(self.sqlite_path, read_only=True, check_same_thread=False), identity
+
+    def release(self, conn: sqlite3.Connection, identity: Optional[Tuple[int, int]]) -> None:
+        with self._lock:
+            if len(self._idle) < self.max_size:
+                self._idle.append((conn, identity))
+                return
+        conn.close()
+
+    @contextmanager
+    def connection(self) -> Iterator[sqlite3.Connection]:
+        conn, identity = self.acquire()
+        try:
+            yield conn
+        except BaseException:
+            conn.close()
+            raise
+        self.release(conn, identity)
+
+    def close(self) -> None:
+        with self._lock:
+            idle, self._idle = self._idle, []
+        for conn, _ in idle:
+            conn.close()
+
+    def stats(self) -> Dict[str, int]:
+        with self._lock:
+            return {
+                "idle": len(self._idle),
+                "max_size": self.max_size,
+                "opened": self.opened,
+                "reused": self.reused,
+            }
+
+
+class PathIndex:
+    """In-process cache of ``path -> path_id``.
+
+    Ids are assigned on first use and never change, so a writer that
+    keeps one index for its lifetime only touches ``paths`` for paths it
+    has not seen before.
+    """
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+
+    def intern(self, conn: sqlite3.Connection, paths: Iterable[str]) -> Dict[str, int]:
+        paths = set(paths)
+        missing = [path for path in paths if path not in self._ids]
+        if missing:
+            if len(self._ids) + len(missing) > MAX_CACHED_PATHS:
+                # Dynamic paths come and go; keep only those of this batch.
+                self._ids = {path: self._ids[path] for path in paths if path in self._ids}
+            conn.executemany("INSERT OR IGNORE INTO paths (path) VALUES (?)", [(path,) for path in missing])
+            self._ids.update(_lookup_path_ids(conn, missing))
+        return self._ids
+
+    def clear(self) -> None:
+        self._ids.clear()
+
+
+def _lookup_path_ids(conn: sqlite3.Connection, paths: Sequence[str]) -> Dict[str, int]:
+    if not paths:
+        return {}
+    placeholders = ",".join(["?"] * len(paths))
+    rows = conn.execute(f"SELECT path, path_id FROM paths WHERE path IN ({placeholders})", list(paths))
+    return {str(row[0]): int(row[1]) for row in rows}
+
+
+def _lookup_paths(conn: sqlite3.Connection, path_ids: Iterable[int]) -> Dict[int, str]:
+    ids = list(path_ids)
+    names: Dict[int, str] = {}
+    for offset in range(0, len(ids), PATH_LOOKUP_CHUNK):
+        chunk = ids[offset : offset + PATH_LOOKUP_CHUNK]
+        placeholders = ",".join(["?"] * len(chunk))
+        rows = conn.execute(f"SELECT path_id, path FROM paths WHERE path_id IN ({placeholders})", chunk)
+        names.update((int(row[0]), str(row[1])) for row in rows)
+    return names
+
+
+def _copy_text_rows(conn: sqlite3.Connection, source: str, target: str, where: str = "", params=()) -> None:
+    """Copies ``(bucket_start_utc, path, status, count)`` rows into a partition, interning paths."""
+    conn.execute(f"INSERT OR IGNORE INTO paths (path) SELECT DISTINCT s.path FROM {source} AS s {where}", params)
+    conn.execute(
+        f"""
+        INSERT INTO {target} (path_id, bucket_start_utc, status, count)
+        SELECT p.path_id, s.bucket_start_utc, s.status, s.count
+        FROM {source} AS s JOIN paths AS p ON p.path = s.path {where}
+        """,
+        params,
+    )
+
+
+def _register_level(conn: sqlite3.Connection, level: str, bucket_seconds: int) -> int:
+    length = partition_seconds(bucket_seconds)
+    conn.execute(
+        "INSERT INTO rollup_levels (name, bucket_seconds, partition_seconds) VALUES (?, ?, ?)",
+        (level, bucket_seconds, length),
+    )
+    return length
+
+
+def _migrate_legacy_tables(conn: sqlite3.Connection, bucket_seconds: int) -> None:
+    """Moves rows from the single-table layout into partitions and drops it."""
+    legacy = [
+        str(row[0])
+        for row in conn.execute(
+            "SELECT name FROM sqlite_master WHERE type = 'table' "
+            "AND (name = 'rollup_counts' OR name GLOB 'rollup_counts_[0-9]*') "
+            "AND name NOT GLOB '*_p[0-9]*'"
+        )
+    ]
+    levels = _load_levels(conn)
+    for table in legacy:
+        level_bucket = bucket_seconds if table == "rollup_counts" else int(table.rsplit("_", 1)[1])
+        length = levels.get(table) or _register_level(conn, table, level_bucket)
+        starts = [
+            int(row[0])
+            for row in conn.execute(f"SELECT DISTINCT (bucket_start_utc / ?) * ? FROM {table}", (length, length))
+        ]
+        for start in starts:
+            partition = _partition_table(table, start)
+            conn.execute(PARTITION_SCHEMA.format(table=partition))
+            _copy_text_rows(
+                conn,
+                table,
+                partition,
+                "WHERE s.bucket_start_utc >= ? AND s.bucket_start_utc < ?",
+                (start, start + length),
+            )
+        conn.execute(f"DROP TABLE {table}")
+
+
+def _migrate_text_partitions(conn: sqlite3.Connection) -> None:
+    """Rewrites version 1 partitions (path TEXT in every row) to use path ids."""
+    for level in _load_levels(conn):
+        for _, table in _list_partitions(conn, level):
+            conn.execute(f"ALTER TABLE {table} RENAME TO {table}_text")
+            conn.execute(PARTITION_SCHEMA.format(table=table))
+            _copy_text_rows(conn, f"{table}_text", table)
+            conn.execute(f"DROP TABLE {table}_text")
+
+
+def init_db(sqlite_path: str, tiers: Sequence[int] = (), bucket_seconds: int = 60) -> None:
+    """Creates the schema, migrating older layouts tracked by ``user_version``.
+
+    ``bucket_seconds`` is the base bucket size, which sets the partition
+    length of the base level the first time it is registered.
+    """
     if sqlite_path != ":memory:" and not sqlite_path.startswith("file:"):
         directory = os.path.dirname(sqlite_path)
         if directory:
@@ -47,38 +448,332 @@ def init_db(sqlite_path: str) -> None:
     conn = get_connection(sqlite_path)
     try:
         conn.executescript(SCHEMA)
+        with conn:
+            # DDL does not open a transaction implicitly; the migration and
+            # tier seeding must commit as a whole.
+            conn.execute("BEGIN")
+            version = int(conn.execute("PRAGMA user_version").fetchone()[0])
+            if version < 1:
+                _migrate_legacy_tables(conn, bucket_seconds)
+            elif version < 2:
+                _migrate_text_partitions(conn)
+            if version < 3:
+                # Rollups written before coverage was recorded may hold any
+                # source's lines, so they count as covered for every source.
+                stored_from = first_bucket(conn)
+                if stored_from is not None:
+                    conn.execute(
+                        "INSERT OR IGNORE INTO ingest_coverage (path, start_utc, end_utc) VALUES (?, ?, ?)",
+                        (ALL_SOURCES, stored_from, int(time.time())),
+                    )
+            conn.execute(f"PRAGMA user_version = {SCHEMA_VERSION}")
+
+            levels = _load_levels(conn)
+            for level_name, schema, key_columns in (
+                (tier_table, PARTITION_SCHEMA, COUNT_KEY),
+                (latency_table, LATENCY_PARTITION_SCHEMA, LATENCY_KEY),
+            ):
+                base = level_name()
+                if base not in levels:
+                    levels[base] = _register_level(conn, base, bucket_seconds)
+                columns = ", ".join(("bucket_start_utc", "path_id") + key_columns + ("count",))
+                for tier in tiers:
+                    level = level_name(tier)
+                    if level in levels:
+                        continue
+                    levels[level] = _register_level(conn, level, tier)
+                    # Seed a newly added tier from the base rows already stored.
+                    for _, table in _list_partitions(conn, base):
+                        rows = {
+                            tuple(int(value) for value in row[:-1]): int(row[-1])
+                            for row in conn.execute(f"SELECT {columns} FROM {table}")
+                        }
+                        _write_level(conn, level, levels[level], _rollup_tier(rows, tier), schema, key_columns)
+
+            # Class levels are seeded from the count level of the same tier,
+            # which is complete by now.
+            for tier in (None,) + tuple(tiers):
+                level = class_table(tier)
+                if level in levels:
+                    continue
+                levels[level] = _register_level(conn, level, tier or bucket_seconds)
+                for _, table in _list_partitions(conn, tier_table(tier)):
+                    rows = {
+                        (int(row[0]), int(row[1]), int(row[2])): int(row[3])
+                        for row in conn.execute(
+                            "SELECT bucket_start_utc, path_id, status / 100, SUM(count) "
+                            f"FROM {table} GROUP BY 1, 2, 3"
+                        )
+                    }
+                    _write_level(conn, level, levels[level], rows, CLASS_PARTITION_SCHEMA, CLASS_KEY)
+
+            base = client_table()
+            if base not in levels:
+                levels[base] = _register_level(conn, base, bucket_seconds)
+            for tier in tiers:
+                level = client_table(tier)
+                if level in levels:
+                    continue
+                levels[level] = _register_level(conn, level, tier)
+                for _, table in _list_partitions(conn, base):
+                    sketches = {
+                        (int(row[0]), int(row[1])): bytes(row[2])
+                        for row in conn.execute(f"SELECT bucket_start_utc, path_id, registers FROM {table}")
+                    }
+                    _write_sketches(conn, level, levels[level], _rollup_sketches(sketches, tier))
     finally:
         conn.close()
 
 
-def write_rollups(conn: sqlite3.Connection, rows: Dict[Tuple[int, str, int], int]) -> None:
-    if not rows:
-        return
-    payload = [
-        (bucket, path, status, count)
-        for (bucket, path, status), count in rows.items()
-        if count
-    ]
-    if not payload:
-        return
-    with conn:
+def _rollup_tier(
+    rows: Dict[Tuple[int, ...], int],
+    tier_seconds: int,
+) -> Dict[Tuple[int, ...], int]:
+    """Re-buckets ``(bucket, path_id, ...)`` rows into ``tier_seconds`` buckets."""
+    tier_rows: Dict[Tuple[int, ...], int] = {}
+    for key, count in rows.items():
+        tier_key = ((key[0] // tier_seconds) * tier_seconds,) + key[1:]
+        tier_rows[tier_key] = tier_rows.get(tier_key, 0) + count
+    return tier_rows
+
+
+def _rollup_sketches(
+    sketches: Dict[Tuple[int, int], bytes],
+    tier_seconds: int,
+) -> Dict[Tuple[int, int], bytes]:
+    """Re-buckets ``(bucket, path_id)`` sketches into ``tier_seconds`` buckets."""
+    tier_sketches: Dict[Tuple[int, int], bytes] = {}
+    for (bucket, path_id), registers in sketches.items():
+        tier_key = ((bucket // tier_seconds) * tier_seconds, path_id)
+        current = tier_sketches.get(tier_key)
+        tier_sketches[tier_key] = registers if current is None else hll.union(current, registers)
+    return tier_sketches
+
+
+def _status_classes(rows: Dict[Tuple[int, int, int], int]) -> Dict[Tuple[int, int, int], int]:
+    """Folds ``(bucket, path_id, status)`` rows into ``(bucket, path_id, status // 100)``."""
+    classes: Dict[Tuple[int, int, int], int] = {}
+    for (bucket, path_id, status), count in rows.items():
+        key = (bucket, path_id, status // 100)
+        classes[key] = classes.get(key, 0) + count
+    return classes
+
+
+def _write_sketches(
+    conn: sqlite3.Connection,
+    level: str,
+    length: int,
+    sketches: Dict[Tuple[int, int], bytes],
+) -> None:
+    """Merges ``(bucket, path_id) -> registers`` sketches into their partitions."""
+    by_partition: Dict[int, List[Tuple[int, int, bytes]]] = {}
+    for (bucket, path_id), registers in sketches.items():
+        by_partition.setdefault((bucket // length) * length, []).append((path_id, bucket, registers))
+    for start, payload in by_partition.items():
+        table = _partition_table(level, start)
+        conn.execute(CLIENT_PARTITION_SCHEMA.format(table=table))
+        conn.executemany(
+            f"""
+            INSERT INTO {table} (path_id, bucket_start_utc, registers)
+            VALUES (?, ?, ?)
+            ON CONFLICT(path_id, bucket_start_utc)
+            DO UPDATE SET registers = hll_union(registers, excluded.registers)
+            """,
+            payload,
+        )
+
+
+def _write_level(
+    conn: sqlite3.Connection,
+    level: str,
+    length: int,
+    rows: Dict[Tuple[int, ...], int],
+    schema: str = PARTITION_SCHEMA,
+    key_columns: Tuple[str, ...] = COUNT_KEY,
+) -> None:
+    """Upserts ``(bucket, path_id, *key_columns) -> count`` rows into their partitions."""
+    by_partition: Dict[int, List[Tuple[int, ...]]] = {}
+    if len(key_columns) == 1:
+        # The count levels' fast path; flushes write every row through here.
+        for (bucket, path_id, status), count in rows.items():
+            by_partition.setdefault((bucket // length) * length, []).append((path_id, bucket, status, count))
+    else:
+        for key, count in rows.items():
+            bucket = key[0]
+            by_partition.setdefault((bucket // length) * length, []).append((key[1], bucket) + key[2:] + (count,))
+    columns = ", ".join(("path_id", "bucket_start_utc") + key_columns)
+    placeholders = ", ".join(["?"] * (len(key_columns) + 3))
+    for start, payload in by_partition.items():
+        table = _partition_table(level, start)
+        conn.execute(schema.format(table=table))
         conn.executemany(
-            """
-            INSERT INTO rollup_counts (bucket_start_utc, path, status, count)
-            VALUES (?, ?, ?, ?)
-            ON CONFLICT(bucket_start_utc, path, status)
+            f"""
+            INSERT INTO {table} ({columns}, count)
+            VALUES ({placeholders})
+            ON CONFLICT({columns})
             DO UPDATE SET count = count + excluded.count
             """,
             payload,
         )
 
 
-def apply_retention(conn: sqlite3.Connection, cutoff_utc: int) -> None:
+def write_rollups(
+    conn: sqlite3.Connection,
+    rows: Dict[Tuple[int, str, int], int],
+    checkpoints: Optional[Dict[str, Tuple[int, int]]] = None,
+    tiers: Sequence[int] = (),
+    path_index: Optional[PathIndex] = None,
+    latency: Optional[Dict[Tuple[int, str, int, int], int]] = None,
+    clients: Optional[Dict[Tuple[int, str], bytes]] = None,
+    coverage: Optional[Dict[str, Tuple[int, int]]] = None,
+) -> None:
+    """Upserts rollup deltas, and optionally ingest checkpoints, in one transaction.
+
+    Storing the ``(inode, offset)`` each tailer had consumed alongside the
+    counts it produced means a restart can resume from the checkpoint
+    without losing or double-counting events. The deltas are also rolled
+    up into each coarser tier in ``tiers`` within the same transaction.
+    Long-lived writers pass their own ``path_index`` to skip path lookups.
+    ``latency`` holds ``(bucket, path, status, bin) -> count`` histogram
+    deltas, written to the latency levels the same way. ``clients`` holds
+    ``(bucket, path) -> registers`` HyperLogLog sketches, merged into the
+    stored ones register by register. ``coverage`` maps each log to the
+    ``(first, last)`` buckets a run has ingested from it, extending the
+    range stored for the same first bucket; backfill skips those buckets.
+    """
+    rows = {key: count for key, count in rows.items() if count}
+    latency = {key: count for key, count in (latency or {}).items() if count}
+    clients = clients or {}
+    if not rows and not checkpoints and not latency and not clients and not coverage:
+        return
+    if path_index is None:
+        path_index = PathIndex()
+    try:
+        with conn:
+            if rows or latency or clients:
+                path_ids = path_index.intern(
+                    conn, [key[1] for key in rows] + [key[1] for key in latency] + [key[1] for key in clients]
+                )
+                levels = _load_levels(conn)
+            if rows:
+                id_rows = {
+                    (bucket, path_ids[path], status): count for (bucket, path, status), count in rows.items()
+                }
+                id_classes = _status_classes(id_rows)
+                for tier in (None,) + tuple(tiers):
+                    level_rows, level_classes = id_rows, id_classes
+                    if tier is not None:
+                        level_rows, level_classes = _rollup_tier(id_rows, tier), _rollup_tier(id_classes, tier)
+                    _write_level(conn, tier_table(tier), levels[tier_table(tier)], level_rows)
+                    level = class_table(tier)
+                    _write_level(conn, level, levels[level], level_classes, CLASS_PARTITION_SCHEMA, CLASS_KEY)
+            if latency:
+                id_latency = {
+                    (bucket, path_ids[path], status, index): count
+                    for (bucket, path, status, index), count in latency.items()
+                }
+                for tier in (None,) + tuple(tiers):
+                    level = latency_table(tier)
+                    level_rows = id_latency if tier is None else _rollup_tier(id_latency, tier)
+                    _write_level(conn, level, levels[level], level_rows, LATENCY_PARTITION_SCHEMA, LATENCY_KEY)
+            if clients:
+                id_clients = {
+                    (bucket, path_ids[path]): bytes(registers) for (bucket, path), registers in clients.items()
+                }
+                for tier in (None,) + tuple(tiers):
+                    level = client_table(tier)
+                    level_sketches = id_clients if tier is None else _rollup_sketches(id_clients, tier)
+                    _write_sketches(conn, level, levels[level], level_sketches)
+            if checkpoints:
+                now_utc = int(time.time())
+                conn.executemany(
+                    """
+                    INSERT INTO ingest_checkpoints (path, inode, offset, updated_utc)
+                    VALUES (?, ?, ?, ?)
+                    ON CONFLICT(path)
+                    DO UPDATE SET inode = excluded.inode, offset = excluded.offset,
+                        updated_utc = excluded.updated_utc
+                    """,
+                    [(path, inode, offset, now_utc) for path, (inode, offset) in checkpoints.items()],
+                )
+            if coverage:
+                conn.executemany(
+                    """
+                    INSERT INTO ingest_coverage (path, start_utc, end_utc)
+                    VALUES (?, ?, ?)
+                    ON CONFLICT(path, start_utc)
+                    DO UPDATE SET end_utc = MAX(end_utc, excluded.end_utc)
+                    """,
+                    [(path, start, end) for path, (start, end) in coverage.items()],
+                )
+    except BaseException:
+        # Ids assigned inside the rolled-back transaction no longer exist.
+        path_index.clear()
+        raise
+
+
+def load_checkpoints(conn: sqlite3.Connection) -> Dict[str, Tuple[int, int]]:
+    rows = conn.execute("SELECT path, inode, offset FROM ingest_checkpoints").fetchall()
+    return {str(row["path"]): (int(row["inode"]), int(row["offset"])) for row in rows}
+
+
+def load_coverage(conn: sqlite3.Connection) -> Dict[str, List[Tuple[int, int]]]:
+    """Returns the ``(first, last)`` bucket ranges ingested from each log;
+    ranges under ``ALL_SOURCES`` apply to every log."""
+    coverage: Dict[str, List[Tuple[int, int]]] = {}
+    for row in conn.execute("SELECT path, start_utc, end_utc FROM ingest_coverage ORDER BY path, start_utc"):
+        coverage.setdefault(str(row[0]), []).append((int(row[1]), int(row[2])))
+    return coverage
+
+
+def first_bucket(conn: sqlite3.Connection) -> Optional[int]:
+    for _, table in _list_partitions(conn, tier_table()):
+        row = conn.execute(f"SELECT MIN(bucket_start_utc) FROM {table}").fetchone()
+        if row is not None and row[0] is not None:
+            return int(row[0])
+    return None
+
+
+def apply_retention(
+    conn: sqlite3.Connection,
+    cutoff_utc: int,
+    tier_cutoffs: Optional[Dict[int, int]] = None,
+) -> int:
+    """Drops partitions that end at or before each level's cutoff.
+
+    Buckets older than the cutoff survive until their whole partition has
+    expired. Each drop is its own short transaction, and the WAL is then
+    checkpointed in PASSIVE mode, which never waits on readers. Returns
+    the number of partitions dropped.
+    """
+    cutoffs = {
+        tier_table(): cutoff_utc,
+        class_table(): cutoff_utc,
+        latency_table(): cutoff_utc,
+        client_table(): cutoff_utc,
+    }
+    for tier, tier_cutoff in (tier_cutoffs or {}).items():
+        cutoffs[tier_table(tier)] = tier_cutoff
+        cutoffs[class_table(tier)] = tier_cutoff
+        cutoffs[latency_table(tier)] = tier_cutoff
+        cutoffs[client_table(tier)] = tier_cutoff
+    levels = _load_levels(conn)
+    dropped = 0
+    for level, level_cutoff in cutoffs.items():
+        length = levels.get(level)
+        if length is None:
+            continue
+        for start, table in _list_partitions(conn, level):
+            if start + length > level_cutoff:
+                break
+            with conn:
+                conn.execute(f"DROP TABLE IF EXISTS {table}")
+            dropped += 1
     with conn:
-        conn.execute(
-            "DELETE FROM rollup_counts WHERE bucket_start_utc < ?",
-            (cutoff_utc,),
-        )
+        conn.execute("DELETE FROM ingest_coverage WHERE end_utc < ?", (cutoff_utc,))
+    if dropped:
+        conn.execute("PRAGMA wal_checkpoint(PASSIVE)")
+    return dropped
 
 
 def _build_status_clause(status_filter: StatusFilter) -> Tuple[str, List[int]]:
@@ -105,29 +800,251 @@ def _build_status_clause(status_filter: StatusFilter) -> Tuple[str, List[int]]:
     return " OR ".join(parts), params
 
 
+def _build_class_clause(status_filter: StatusFilter) -> Tuple[str, List[int]]:
+    classes = [
+        STATUS_RANGE_BOUNDS[entry][0] // 100 for entry in status_filter.ranges if entry in STATUS_RANGE_BOUNDS
+    ]
+    if not classes:
+        return "0", []
+    return f"status_class IN ({','.join(['?'] * len(classes))})", classes
+
+
+def _level_tables(conn: sqlite3.Connection, level: str, start_bucket_utc: int, end_bucket_utc: int) -> List[str]:
+    """Returns the partitions of ``level`` that overlap the bucket range."""
+    length = _load_levels(conn).get(level)
+    if length is None:
+        return []
+    return [
+        table
+        for start, table in _list_partitions(conn, level)
+        if start <= end_bucket_utc and start + length > start_bucket_utc
+    ]
+
+
+def _path_clause(
+    conn: sqlite3.Connection,
+    paths: Optional[List[str]],
+) -> Optional[Tuple[str, List[int], Dict[int, str]]]:
+    """Returns ``(clause, params, id_paths)`` selecting ``paths``, or
+    ``None`` when none of them is stored. ``paths=None`` selects all."""
+    if paths is None:
+        return "1", [], {}
+    path_ids = _lookup_path_ids(conn, paths)
+    if not path_ids:
+        return None
+    id_paths = {path_id: path for path, path_id in path_ids.items()}
+    return f"path_id IN ({','.join(['?'] * len(id_paths))})", list(id_paths), id_paths
+
+
+def _query_level(
+    conn: sqlite3.Connection,
+    level: str,
+    paths: Optional[List[str]],
+    where: Tuple[str, List[int]],
+    start_bucket_utc: int,
+    end_bucket_utc: int,
+    group_columns: Tuple[str, ...] = (),
+    aggregate: str = "SUM(count)",
+    step: Optional[int] = None,
+    combine: Callable[[Any, Any], Any] = operator.add,
+) -> List[Tuple]:
+    """Returns ``(bucket, path, *group_columns, value)`` rows of one level,
+    reading only the partitions that overlap the range through one
+    ``UNION ALL`` statement. ``paths=None`` returns every stored path;
+    ``where`` is an extra ``(clause, params)`` filter on the rows.
+
+    With ``step`` the rows are re-bucketed in SQL to
+    ``(bucket_start_utc / step) * step``. A step bucket may span
+    partitions, so the per-partition values are then merged with
+    ``combine``.
+    """
+    if paths is not None and not paths:
+        return []
+    where_clause, where_params = where
+    # Listing partitions and reading them share one snapshot, so a
+    # concurrent retention drop cannot remove a table mid-query.
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        tables = _level_tables(conn, level, start_bucket_utc, end_bucket_utc)
+        selected = _path_clause(conn, paths)
+        if not tables or selected is None:
+            return []
+        path_clause, arm_params, id_paths = selected
+        bucket = "bucket_start_utc" if step is None else f"(bucket_start_utc / {int(step)}) * {int(step)}"
+        group = ", ".join((bucket, "path_id") + group_columns)
+        arm = (
+            f"SELECT {group}, {aggregate} AS value "
+            "FROM {table} "
+            f"WHERE {path_clause} "
+            "AND bucket_start_utc BETWEEN ? AND ? "
+            f"AND ({where_clause}) "
+            f"GROUP BY {group}"
+        )
+        arm_params.extend([start_bucket_utc, end_bucket_utc])
+        arm_params.extend(where_params)
+
+        id_rows: List[sqlite3.Row] = []
+        # Without a step a bucket lives in exactly one partition, so arms
+        # never overlap.
+        for offset in range(0, len(tables), MAX_UNION_PARTITIONS):
+            chunk = tables[offset : offset + MAX_UNION_PARTITIONS]
+            sql = " UNION ALL ".join(arm.format(table=table) for table in chunk)
+            sql += " ORDER BY 1 ASC"
+            id_rows.extend(conn.execute(sql, arm_params * len(chunk)).fetchall())
+        if paths is None:
+            id_paths = _lookup_paths(conn, {int(row[1]) for row in id_rows})
+        if step is not None:
+            merged: Dict[Tuple[int, ...], Any] = {}
+            for row in id_rows:
+                key = tuple(int(value) for value in row[:-1])
+                current = merged.get(key)
+                merged[key] = row[-1] if current is None else combine(current, row[-1])
+            return [(key[0], id_paths[key[1]], *key[2:], value) for key, value in sorted(merged.items())]
+        if not group_columns:
+            return [(int(row[0]), id_paths[int(row[1])], row[2]) for row in id_rows]
+        return [(int(row[0]), id_paths[int(row[1])], *(int(value) for value in row[2:-1]), row[-1]) for row in id_rows]
+    finally:
+        if own_transaction:
+            conn.commit()
+
+
 def query_rollups(
     conn: sqlite3.Connection,
-    paths: List[str],
+    paths: Optional[List[str]],
     status_filter: StatusFilter,
     start_bucket_utc: int,
     end_bucket_utc: int,
+    tier_seconds: Optional[int] = None,
+    step: Optional[int] = None,
 ) -> List[Tuple[int, str, int]]:
-    if not paths:
-        return []
-    path_placeholders = ",".join(["?"] * len(paths))
-    status_clause, status_params = _build_status_clause(status_filter)
-    sql = (
-        "SELECT bucket_start_utc, path, SUM(count) as count "
-        "FROM rollup_counts "
-        "WHERE bucket_start_utc BETWEEN ? AND ? "
-        f"AND path IN ({path_placeholders}) "
-        f"AND ({status_clause}) "
-        "GROUP BY bucket_start_utc, path "
-        "ORDER BY bucket_start_utc ASC"
+    """Returns ``(bucket, path, count)`` rows, reading only the partitions
+    that overlap the range through one ``UNION ALL`` statement.
+
+    ``paths=None`` returns rows for every stored path. ``step`` re-buckets
+    the level's rows into ``step``-second buckets. Range filters read the
+    status class level; exact ones the per-status level.
+    """
+    if status_filter.mode == "ranges":
+        level, where = class_table(tier_seconds), _build_class_clause(status_filter)
+    else:
+        level, where = tier_table(tier_seconds), _build_status_clause(status_filter)
+    return _query_level(conn, level, paths, where, start_bucket_utc, end_bucket_utc, step=step)
+
+
+def query_classes(
+    conn: sqlite3.Connection,
+    paths: Optional[List[str]],
+    start_bucket_utc: int,
+    end_bucket_utc: int,
+    tier_seconds: Optional[int] = None,
+    step: Optional[int] = None,
+) -> List[Tuple[int, str, int, int]]:
+    """Returns ``(bucket, path, status_class, count)`` rows for every
+    status class, like ``query_rollups``."""
+    return _query_level(
+        conn,
+        class_table(tier_seconds),
+        paths,
+        ("1", []),
+        start_bucket_utc,
+        end_bucket_utc,
+        ("status_class",),
+        step=step,
     )
-    params: List[int] = [start_bucket_utc, end_bucket_utc]
-    params.extend(paths)
-    params.extend(status_params)
-    cursor = conn.execute(sql, params)
-    rows = cursor.fetchall()
-    return [(int(row["bucket_start_utc"]), str(row["path"]), int(row["count"])) for row in rows]
+
+
+def query_latency(
+    conn: sqlite3.Connection,
+    paths: Optional[List[str]],
+    status_filter: StatusFilter,
+    start_bucket_utc: int,
+    end_bucket_utc: int,
+    tier_seconds: Optional[int] = None,
+    step: Optional[int] = None,
+) -> List[Tuple[int, str, int, int]]:
+    """Returns ``(bucket, path, bin, count)`` latency histogram rows, merged
+    over the statuses ``status_filter`` selects, like ``query_rollups``."""
+    return _query_level(
+        conn,
+        latency_table(tier_seconds),
+        paths,
+        _build_status_clause(status_filter),
+        start_bucket_utc,
+        end_bucket_utc,
+        ("bin",),
+        step=step,
+    )
+
+
+def query_clients(
+    conn: sqlite3.Connection,
+    paths: Optional[List[str]],
+    start_bucket_utc: int,
+    end_bucket_utc: int,
+    tier_seconds: Optional[int] = None,
+    step: Optional[int] = None,
+) -> List[Tuple[int, str, int]]:
+    """Returns ``(bucket, path, distinct_clients)`` estimates, like
+    ``query_rollups``. Client sketches have no status, so every request
+    to the path counts."""
+    rows = _query_level(
+        conn,
+        client_table(tier_seconds),
+        paths,
+        ("1", []),
+        start_bucket_utc,
+        end_bucket_utc,
+        aggregate="hll_merge(registers)",
+        step=step,
+        combine=hll.union,
+    )
+    return [(bucket, path, hll.estimate(registers)) for bucket, path, registers in rows]
+
+
+def query_clients_total(
+    conn: sqlite3.Connection,
+    paths: Optional[List[str]],
+    start_bucket_utc: int,
+    end_bucket_utc: int,
+    tier_seconds: Optional[int] = None,
+) -> Dict[str, int]:
+    """Returns each path's distinct clients over the whole range.
+
+    The bucket sketches are merged inside SQLite by ``hll_merge``, so a
+    client seen in many buckets is still counted once.
+    """
+    if paths is not None and not paths:
+        return {}
+    own_transaction = not conn.in_transaction
+    if own_transaction:
+        conn.execute("BEGIN")
+    try:
+        tables = _level_tables(conn, client_table(tier_seconds), start_bucket_utc, end_bucket_utc)
+        selected = _path_clause(conn, paths)
+        if not tables or selected is None:
+            return {}
+        path_clause, arm_params, id_paths = selected
+        arm_params.extend([start_bucket_utc, end_bucket_utc])
+        arm = (
+            "SELECT path_id, registers FROM {table} "
+            f"WHERE {path_clause} AND bucket_start_utc BETWEEN ? AND ?"
+        )
+        merged: Dict[int, bytes] = {}
+        for offset in range(0, len(tables), MAX_UNION_PARTITIONS):
+            chunk = tables[offset : offset + MAX_UNION_PARTITIONS]
+            sql = (
+                "SELECT path_id, hll_merge(registers) FROM ("
+                + " UNION ALL ".join(arm.format(table=table) for table in chunk)
+                + ") GROUP BY path_id"
+            )
+            for path_id, registers in conn.execute(sql, arm_params * len(chunk)):
+                current = merged.get(path_id)
+                merged[path_id] = registers if current is None else hll.union(current, registers)
+        if paths is None:
+            id_paths = _lookup_paths(conn, merged)
+        return {id_paths[path_id]: hll.estimate(registers) for path_id, registers in merged.items()}
+    finally:
+        if own_transaction:
+            conn.commit()
@@ -0,0 +1,117 @@
+from __future__ import annotations
+
+import heapq
+import threading
+from typing import Dict, List, Optional, Tuple
+
+# The lazy min-heap is rebuilt once it holds this many entries per counter.
+HEAP_SLACK = 4
+
+
+class SpaceSaving:
+    """Space-Saving heavy-hitters sketch with a fixed number of counters.
+
+    Keys are counted exactly while fewer than ``capacity`` are tracked.
+    After that a new key takes over the smallest counter and inherits its
+    count as ``error``, so every reported count is an upper bound and
+    ``count - error`` a lower bound. Any key seen more than
+    ``total / capacity`` times is guaranteed to be tracked.
+
+    The smallest counter is found through a min-heap updated lazily:
+    increments push a new entry and stale ones are skipped on eviction.
+    """
+
+    def __init__(self, capacity: int) -> None:
+        self.capacity = max(1, capacity)
+        self.counts: Dict[str, int] = {}
+        self.errors: Dict[str, int] = {}
+        self._heap: List[Tuple[int, str]] = []
+
+    def add(self, key: str, count: int = 1) -> None:
+        counts = self.counts
+        current = counts.get(key)
+        if current is not None:
+            counts[key] = current + count
+        elif len(counts) < self.capacity:
+            counts[key] = count
+            self.errors[key] = 0
+        else:
+            floor, victim = self._pop_min()
+            del counts[victim]
+            del self.errors[victim]
+            counts[key] = floor + count
+            self.errors[key] = floor
+        heapq.heappush(self._heap, (counts[key], key))
+        if len(self._heap) > HEAP_SLACK * self.capacity:
+            self._heap = [(value, name) for name, value in counts.items()]
+            heapq.heapify(self._heap)
+
+    def _pop_min(self) -> Tuple[int, str]:
+        heap = self._heap
+        while True:
+            value, key = heapq.heappop(heap)
+            if self.counts.get(key) == value:
+                return value, key
+
+    def floor(self) -> int:
+        """Upper bound on the count of any key the sketch is not tracking."""
+        if len(self.counts) < self.capacity:
+            return 0
+        return min(self.counts.values())
+
+
+class DiscoveryRing:
+    """One ``SpaceSaving`` sketch per recent bucket, for top-N path queries.
+
+    Fed with paths that no include rule matched. Memory is bounded by
+    ``slots * capacity`` counters regardless of how many distinct paths
+    arrive; buckets older than the ring are overwritten.
+    """
+
+    def __init__(self, bucket_seconds: int, slots: int, capacity: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.slots = max(1, slots)
+        self.capacity = capacity
+        self._buckets: List[Optional[int]] = [None] * self.slots
+        self._sketches: List[Optional[SpaceSaving]] = [None] * self.slots
+        self._lock = threading.Lock()
+
+    def add(self, counts: Dict[Tuple[int, str], int]) -> None:
+        with self._lock:
+            for (bucket, path), count in counts.items():
+                slot = (bucket // self.bucket_seconds) % self.slots
+                if self._buckets[slot] != bucket:
+                    if self._buckets[slot] is not None and self._buckets[slot] > bucket:
+                        continue
+                    self._buckets[slot] = bucket
+                    self._sketches[slot] = SpaceSaving(self.capacity)
+                self._sketches[slot].add(path, count)
+
+    def top(self, limit: int, start_bucket_utc: int, end_bucket_utc: int) -> List[Dict[str, object]]:
+        """Returns the ``limit`` busiest paths over the buckets in range.
+
+        Counts from each bucket are summed; a full bucket that is not
+        tracking a path adds its floor, since the path may have been
+        evicted there. The true count lies in ``[count - error, count]``.
+        """
+        counts: Dict[str, int] = {}
+        errors: Dict[str, int] = {}
+        with self._lock:
+            sketches = [
+                sketch
+                for bucket, sketch in zip(self._buckets, self._sketches)
+                if bucket is not None and start_bucket_utc <= bucket <= end_bucket_utc
+            ]
+            for sketch in sketches:
+                for path, count in sketch.counts.items():
+                    counts[path] = counts.get(path, 0) + count
+                    errors[path] = errors.get(path, 0) + sketch.errors[path]
+            for sketch in sketches:
+                floor = sketch.floor()
+                if floor:
+                    for path in counts:
+                        if path not in sketch.counts:
+                            counts[path] += floor
+                            errors[path] += floor
+        busiest = sorted(counts, key=lambda path: (-counts[path], path))[: max(0, limit)]
+        return [{"path": path, "count": counts[path], "error": errors[path]} for path in busiest]
@@ -0,0 +1,280 @@
+from __future__ import annotations
+
+import functools
+import json
+import re
+from datetime import datetime
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .latency import latency_bin
+from .timestamps import parse_nginx_time
+
+
+NGINX_COMBINED = (
+    '$remote_addr - $remote_user [$time_local] "$request" $status $body_bytes_sent '
+    '"$http_referer" "$http_user_agent"'
+)
+# A typical ``log_format ... escape=json`` layout.
+NGINX_JSON = '{"time_local":"$time_local","request":"$request","status":"$status"}'
+PRESETS = {"nginx_combined": NGINX_COMBINED, "json": NGINX_JSON}
+
+TIME_VARIABLES = ("time_local", "time_iso8601", "msec")
+PATH_VARIABLES = ("request", "request_uri", "uri")
+LATENCY_VARIABLES = ("request_time", "upstream_response_time")
+
+_VARIABLE = re.compile(r"\$(?:\{(\w+)\}|(\w+))")
+_JSON_FIELD = re.compile(r'"([^"\\]+)"\s*:\s*"?\$\{?(\w+)\}?"?')
+# Seconds with millisecond resolution, "-", or one value per upstream tried.
+_LATENCY_FIELD = r"(?:-|[\d.]+)(?:(?:, | : )(?:-|[\d.]+))*"
+# Variables whose values always have the same shape, which may include
+# characters (such as the space in $time_local) that delimit other fields:
+# (value pattern, class of the characters a value can contain). The
+# cheaper "up to the next literal" field is used when that literal cannot
+# occur inside the value.
+_FIXED_FIELDS = {
+    "time_local": (r"\d{2}/[A-Za-z]{3}/\d{4}:\d{2}:\d{2}:\d{2} [+-]\d{4}", r"[\w/: +-]"),
+    "time_iso8601": (r"\d{4}-\d{2}-\d{2}T\d{2}:\d{2}:\d{2}(?:\.\d+)?(?:Z|[+-]\d{2}:\d{2})?", r"[\w:.+-]"),
+    "msec": (r"\d+(?:\.\d+)?", r"[\d.]"),
+}
+
+ParsedLine = Tuple[int, str, int]
+# With a latency or client variable: the line plus the latency histogram
+# bin and then the client address, each only if requested (and None when
+# logged as "-").
+DetailedLine = Tuple[object, ...]
+
+
+def _parse_iso8601(text: str) -> Optional[int]:
+    try:
+        return int(datetime.fromisoformat(text).timestamp())
+    except ValueError:
+        return None
+
+
+def _parse_msec(text: str) -> Optional[int]:
+    try:
+        return int(float(text))
+    except ValueError:
+        return None
+
+
+TIME_DECODERS: Dict[str, Callable[[str], Optional[int]]] = {
+    "time_local": parse_nginx_time,
+    "time_iso8601": _parse_iso8601,
+    "msec": _parse_msec,
+}
+
+
+def _request_path(request: str) -> Optional[str]:
+    if not request or request == "-":
+        return None
+    parts = request.split()
+    if len(parts) < 2:
+        return None
+    return parts[1]
+
+
+def _direct_path(value: str) -> Optional[str]:
+    if not value or value == "-":
+        return None
+    return value
+
+
+def _pick(variables: List[str], candidates: Tuple[str, ...], what: str) -> str:
+    for candidate in candidates:
+        if candidate in variables:
+            return candidate
+    names = ", ".join(f"${name}" for name in candidates)
+    raise ValueError(f"log format needs a {what} variable ({names})")
+
+
+class LogParser:
+    """Parses one access log line into ``(event_time_utc, path, status)``.
+
+    Built by ``compile_log_format`` from an nginx ``log_format`` string.
+    Only the time, request path and status fields are extracted; for text
+    formats the generated regex stops right after the last of them, so
+    the rest of the line is never scanned. With ``latency_variable`` the
+    parser also reads that field and appends its ``latency.latency_bin``;
+    with ``client_variable`` (usually ``remote_addr``) it appends that
+    field's value.
+    """
+
+    def __init__(
+        self,
+        template: str,
+        latency_variable: Optional[str] = None,
+        client_variable: Optional[str] = None,
+    ) -> None:
+        self.template = template
+        self.latency_variable = latency_variable
+        self.client_variable = client_variable
+        stripped = template.strip()
+        self.is_json = stripped.startswith("{")
+        if self.is_json:
+            fields = {variable: key for key, variable in _JSON_FIELD.findall(stripped)}
+            variables = list(fields)
+        else:
+            variables = [braced or bare for braced, bare in _VARIABLE.findall(template)]
+        self.time_variable = _pick(variables, TIME_VARIABLES, "time")
+        self.path_variable = _pick(variables, PATH_VARIABLES, "request path")
+        if "status" not in variables:
+            raise ValueError("log format needs a $status variable")
+        if latency_variable is not None:
+            if latency_variable not in LATENCY_VARIABLES:
+                names = ", ".join(LATENCY_VARIABLES)
+                raise ValueError(f"latency variable must be one of {names}")
+            if latency_variable not in variables:
+                raise ValueError(f"log format has no ${latency_variable} variable")
+        if client_variable is not None:
+            if client_variable in (self.time_variable, self.path_variable, "status", latency_variable):
+                raise ValueError(f"${client_variable} cannot be used as the client variable")
+            if client_variable not in variables:
+                raise ValueError(f"log format has no ${client_variable} variable")
+        # (variable, decoder) for each extra field, in output order.
+        extras = []
+        if latency_variable is not None:
+            extras.append((latency_variable, latency_bin))
+        if client_variable is not None:
+            # Logged as-is, with "-" meaning absent, like a direct path.
+            extras.append((client_variable, _direct_path))
+        self._decode_time = TIME_DECODERS[self.time_variable]
+        self._extract_path = _request_path if self.path_variable == "request" else _direct_path
+
+        if self.is_json:
+            self._keys = (fields[self.time_variable], fields[self.path_variable], fields["status"])
+            self._extras = [(fields[variable], decode) for variable, decode in extras]
+            self.parse = self._parse_json_detailed if extras else self._parse_json
+        else:
+            self.pattern = self._compile_text(template)
+            self._extras = [(self._extra_groups[variable], decode) for variable, decode in extras]
+            self.parse = self._parse_text_detailed if extras else self._parse_text
+
+    def _compile_text(self, template: str) -> "re.Pattern[str]":
+        # Alternating literal, variable, literal, ... pieces.
+        pieces = _VARIABLE.split(template)
+        literals = pieces[0::3]
+        variables = [braced or bare for braced, bare in zip(pieces[1::3], pieces[2::3])]
+        needed = {self.time_variable: "time", self.path_variable: "path", "status": "status"}
+        for extra in (self.latency_variable, self.client_variable):
+            if extra is not None:
+                needed[extra] = extra
+        last_needed = max(index for index, name in enumerate(variables) if name in needed)
+
+        parts = [re.escape(literals[0])]
+        groups: Dict[str, int] = {}
+        for index, name in enumerate(variables[: last_needed + 1]):
+            following = literals[index + 1]
+            fixed = _FIXED_FIELDS.get(name)
+            if name == "status":
+                field = r"\d{3}"
+            elif fixed is not None and (not following or re.match(fixed[1], following[0])):
+                field = fixed[0]
+            elif name == self.latency_variable:
+                field = _LATENCY_FIELD
+            elif following:
+                field = f"[^{re.escape(following[0])}]*"
+            elif index == len(variables) - 1:
+                # Last in the line: the rest of it, anchored at the end.
+                field = r".*?(?=\s*$)"
+            elif index == last_needed:
+                # Nothing after it is matched, so it must stop by itself.
+                field = r"\S*"
+            else:
+                field = ".*?"
+            if name in needed and needed[name] not in groups:
+                groups[needed[name]] = len(groups) + 1
+                parts.append(f"({field})")
+            else:
+                parts.append(field)
+            if index < last_needed:
+                parts.append(re.escape(following))
+        self._groups = (groups["time"], groups["path"], groups["status"])
+        self._extra_groups = {
+            extra: groups[extra] for extra in (self.latency_variable, self.client_variable) if extra is not None
+        }
+        return re.compile("".join(parts))
+
+    def _parse_text(self, line: str) -> Optional[ParsedLine]:
+        match = self.pattern.match(line)
+        if match is None:
+            return None
+        time_group, path_group, status_group = self._groups
+        event_time_utc = self._decode_time(match.group(time_group))
+        if event_time_utc is None:
+            return None
+        path = self._extract_path(match.group(path_group))
+        if path is None:
+            return None
+        return event_time_utc, path, int(match.group(status_group))
+
+    def _parse_text_detailed(self, line: str) -> Optional[DetailedLine]:
+        match = self.pattern.match(line)
+        if match is None:
+            return None
+        time_group, path_group, status_group = self._groups
+        event_time_utc = self._decode_time(match.group(time_group))
+        if event_time_utc is None:
+            return None
+        path = self._extract_path(match.group(path_group))
+        if path is None:
+            return None
+        extras = tuple([decode(match.group(group)) for group, decode in self._extras])
+        return (event_time_utc, path, int(match.group(status_group))) + extras
+
+    def _parse_json(self, line: str) -> Optional[ParsedLine]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        return self._read_record(record)
+
+    def _read_record(self, record: Dict[str, object]) -> Optional[ParsedLine]:
+        time_key, path_key, status_key = self._keys
+        time_text = record.get(time_key)
+        path_text = record.get(path_key)
+        status_value = record.get(status_key)
+        if not isinstance(time_text, str) or not isinstance(path_text, str):
+            return None
+        event_time_utc = self._decode_time(time_text)
+        if event_time_utc is None:
+            return None
+        path = self._extract_path(path_text)
+        if path is None:
+            return None
+        status_text = str(status_value)
+        if len(status_text) != 3 or not status_text.isdigit():
+            return None
+        return event_time_utc, path, int(status_text)
+
+    def _parse_json_detailed(self, line: str) -> Optional[DetailedLine]:
+        try:
+            record = json.loads(line)
+        except ValueError:
+            return None
+        if not isinstance(record, dict):
+            return None
+        parsed = self._read_record(record)
+        if parsed is None:
+            return None
+        extras = []
+        for key, decode in self._extras:
+            value = record.get(key)
+            extras.append(None if value is None else decode(str(value)))
+        return parsed + tuple(extras)
+
+
+@functools.lru_cache(maxsize=16)
+def compile_log_format(
+    log_format: str,
+    latency_variable: Optional[str] = None,
+    client_variable: Optional[str] = None,
+) -> LogParser:
+    """Returns the parser for a preset name or a literal ``log_format`` string.
+
+    Raises ``ValueError`` if the format lacks a time, request path or
+    status variable, or the requested latency or client variable.
+    """
+    return LogParser(PRESETS.get(log_format, log_format), latency_variable, client_variable)
@@ -0,0 +1,120 @@
+from __future__ import annotations
+
+import functools
+import hashlib
+import math
+import sqlite3
+from typing import Dict, Optional, Tuple
+
+# A sketch is 2**precision one-byte registers, stored as a fixed-size blob.
+# Its standard error is 1.04 / sqrt(2**precision): 3.25% at the default
+# precision of 10 (1 KiB per sketch), and estimates fall within three
+# standard errors about 99.7% of the time.
+DEFAULT_PRECISION = 10
+MIN_PRECISION = 4
+MAX_PRECISION = 16
+HASH_BITS = 64
+
+
+def standard_error(precision: int) -> float:
+    return 1.04 / math.sqrt(1 << precision)
+
+
+@functools.lru_cache(maxsize=65536)
+def client_register(value: str, precision: int = DEFAULT_PRECISION) -> Tuple[int, int]:
+    """Returns ``(register index, rank)`` for one client address.
+
+    The hash is stable across processes, unlike ``hash()``, so sketches
+    written by different runs merge correctly.
+    """
+    digest = int.from_bytes(hashlib.blake2b(value.encode("utf-8", "replace"), digest_size=8).digest(), "big")
+    remaining = HASH_BITS - precision
+    rest = digest & ((1 << remaining) - 1)
+    return digest >> remaining, remaining - rest.bit_length() + 1
+
+
+def _alpha(registers: int) -> float:
+    if registers == 16:
+        return 0.673
+    if registers == 32:
+        return 0.697
+    if registers == 64:
+        return 0.709
+    return 0.7213 / (1 + 1.079 / registers)
+
+
+def estimate(registers: bytes) -> int:
+    """Returns the estimated number of distinct clients in a sketch."""
+    size = len(registers)
+    if not size:
+        return 0
+    # Tally registers by rank with bytes.count, which runs in C, stopping
+    # once every register is accounted for.
+    zeros = registers.count(0)
+    total = float(zeros)
+    remaining = size - zeros
+    rank = 0
+    while remaining:
+        rank += 1
+        found = registers.count(rank)
+        total += found * 2.0 ** -rank
+        remaining -= found
+    value = _alpha(size) * size * size / total
+    if value <= 2.5 * size and zeros:
+        # Linear counting is more accurate while many registers are empty.
+        value = size * math.log(size / zeros)
+    return int(round(value))
+
+
+@functools.lru_cache(maxsize=8)
+def _high_bits(size: int) -> int:
+    return int.from_bytes(b"\x80" * size, "big")
+
+
+def union(first: bytes, second: bytes) -> bytes:
+    """Register-wise maximum of two sketches of the same precision.
+
+    Computed on the blobs as big integers (every register is below 128,
+    so per-byte comparisons cannot borrow across bytes), which is much
+    faster in Python than looping over the registers. Sketches of another
+    precision cannot be merged, so ``second`` (the newer one, in upserts)
+    replaces ``first`` after ``clients.precision`` changes.
+    """
+    if len(first) != len(second):
+        return second
+    size = len(first)
+    a = int.from_bytes(first, "big")
+    b = int.from_bytes(second, "big")
+    high = _high_bits(size)
+    # High bit of each byte of (a | high) - b is set where a >= b.
+    keep_a = (((a | high) - b) & high) >> 7
+    mask = (keep_a << 8) - keep_a
+    return ((a & mask) | (b & ~mask & ((1 << (8 * size)) - 1))).to_bytes(size, "big")
+
+
+def apply(registers: bytearray, ranks: Dict[int, int]) -> None:
+    """Raises ``registers`` to the sparse ``index -> rank`` updates of a batch."""
+    for index, rank in ranks.items():
+        if rank > registers[index]:
+            registers[index] = rank
+
+
+class _Merge:
+    """SQLite aggregate ``hll_merge(registers)``."""
+
+    def __init__(self) -> None:
+        self.value: Optional[bytes] = None
+
+    def step(self, registers: Optional[bytes]) -> None:
+        if registers is None:
+            return
+        self.value = registers if self.value is None else union(self.value, registers)
+
+    def finalize(self) -> Optional[bytes]:
+        return self.value
+
+
+def register_functions(conn: sqlite3.Connection) -> None:
+    """Adds ``hll_union(a, b)`` and the ``hll_merge(x)`` aggregate to a connection."""
+    conn.create_function("hll_union", 2, union, deterministic=True)
+    conn.create_aggregate("hll_merge", 1, _Merge)
@@ -1,87 +1,575 @@
 from __future__ import annotations
 
+import functools
+import glob
+import math
 import os
-import re
 import threading
 import time
-from dataclasses import dataclass
-from datetime import datetime, timezone
-from typing import Dict, Optional, Tuple
-
-from .config import Config
-from . import db
-
-
-LOG_PATTERN = re.compile(
-    r'^(?P<remote>\S+) \S+ \S+ \[(?P<time>[^\]]+)\] "(?P<request>[^"]*)" (?P<status>\d{3}) (?P<size>\S+) "(?P<referer>[^"]*)" "(?P<ua>[^"]*)"'
-)
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import Callable, Collection, Dict, Iterable, List, Optional, Set, Tuple
+
+from .config import Config, PathsConfig, expand_log_paths, path_matcher, tier_seconds
+from .metrics import MetricsRegistry
+from .ring import HotRing
+from . import db, hll
+from .discovery import DiscoveryRing
+from .formats import compile_log_format
+from .hll import client_register
+from .pathrules import PathMatcher
+from .watch import PollWatcher, create_watcher
+
+
+_parse_combined = compile_log_format("nginx_combined").parse
+
+# Idle tailers re-check their file for rotation at least this often.
+TAILER_WAIT_SECONDS = 1.0
+# Globbed log paths are re-expanded this often to pick up new files.
+RESCAN_SECONDS = 10.0
+# Retention only drops expired partition tables, so it can run often.
+RETENTION_CHECK_SECONDS = 300.0
+# The adaptive key limit never drops below this, and flushes smaller than
+# this are not used to measure commit throughput.
+MIN_FLUSH_KEYS = 1000
+# Weight of the newest flush in the smoothed commit throughput.
+FLUSH_RATE_SMOOTHING = 0.3
+# Tailers pause while the buffer holds this many times the key limit.
+BACKPRESSURE_FACTOR = 2
+# Dynamic paths beyond paths.max_paths_per_bucket in a bucket are counted
+# under this path, which no rule can produce since it has no leading "/".
+OTHER_PATH = "(other)"
+# Newest buckets whose admitted dynamic paths are remembered; lines for
+# older buckets only keep paths already admitted.
+ADMITTED_BUCKETS = 64
 
 
 @dataclass
 class IngestState:
     tailing: bool = False
     last_ingest_utc: Optional[int] = None
+    normalizer: Optional["PathNormalizer"] = None
+    sources: Dict[str, bool] = field(default_factory=dict)
+    hot: Optional[HotRing] = None
+    flush_generation: int = 0
+    # Called from the ingester thread as listener(flush_generation, buckets)
+    # after every flush, with the buckets that flush changed.
+    flush_listeners: List[Callable[[int, List[int]], None]] = field(default_factory=list)
+    metrics: MetricsRegistry = field(default_factory=MetricsRegistry)
+    discovery: Optional[DiscoveryRing] = None
+
+
+class IngestMetrics:
+    """Ingest counters and histograms, registered in a ``MetricsRegistry``.
+
+    Tailers update them once per batch, never per line.
+    """
+
+    def __init__(self, registry: MetricsRegistry) -> None:
+        self.lines_read = registry.counter("fizzylog_lines_read_total", "Log lines read by tailers.")
+        self.lines_parsed = registry.counter("fizzylog_lines_parsed_total", "Log lines that parsed.")
+        self.lines_rejected = registry.counter(
+            "fizzylog_lines_rejected_total", "Parsed lines dropped by path normalization."
+        )
+        self.parse_errors = registry.counter("fizzylog_parse_errors_total", "Log lines that failed to parse.")
+        self.flushes = registry.counter("fizzylog_flushes_total", "Rollup flushes committed.")
+        self.rows_upserted = registry.counter(
+            "fizzylog_rows_upserted_total", "Base rollup rows upserted by flushes."
+        )
+        self.flush_seconds = registry.histogram("fizzylog_flush_seconds", "Time to commit one flush.")
+        self.retention_seconds = registry.histogram(
+            "fizzylog_retention_seconds", "Time to apply retention once."
+        )
+        self.partitions_dropped = registry.counter(
+            "fizzylog_partitions_dropped_total", "Rollup partitions dropped by retention."
+        )
+        self.backpressure_seconds = registry.counter(
+            "fizzylog_backpressure_seconds_total", "Time tailers spent paused waiting for a flush."
+        )
 
 
 def parse_log_line(line: str) -> Optional[Tuple[int, str, int]]:
-    match = LOG_PATTERN.match(line)
-    if not match:
-        return None
-    timestamp = match.group("time")
-    request = match.group("request")
-    status_text = match.group("status")
-
-    try:
-        dt = datetime.strptime(timestamp, "%d/%b/%Y:%H:%M:%S %z").astimezone(timezone.utc)
-        event_time_utc = int(dt.timestamp())
-    except ValueError:
-        return None
+    """Parses one ``nginx_combined`` line; see ``formats`` for other layouts."""
+    return _parse_combined(line)
 
-    if not status_text.isdigit():
-        return None
-    status = int(status_text)
 
-    if not request or request == "-":
-        return None
-    parts = request.split()
-    if len(parts) < 2:
-        return None
-    path = parts[1]
-    return event_time_utc, path, status
-
-
-def normalize_path(raw_path: str, config: Config) -> Optional[str]:
+def _normalize(
+    raw_path: str,
+    paths: PathsConfig,
+    matcher: PathMatcher,
+    ignore_extensions: Collection[str],
+) -> Optional[str]:
     if not raw_path:
         return None
 
     path = raw_path
-    if config.paths.strip_query_string and "?" in path:
+    if paths.strip_query_string and "?" in path:
         path = path.split("?", 1)[0]
 
-    if config.paths.ignore_static_assets:
+    if paths.ignore_static_assets:
         _, ext = os.path.splitext(path.lower())
-        if ext and ext in config.paths.ignore_extensions:
+        if ext and ext in ignore_extensions:
             return None
 
-    path = config.paths.aliases.get(path, path)
-    if path not in config.paths.include_exact:
-        return None
+    path = paths.aliases.get(path, path)
+    return matcher.match(path)
+
 
-    return path
+def normalize_path(raw_path: str, config: Config) -> Optional[str]:
+    return _normalize(raw_path, config.paths, path_matcher(config.paths), config.paths.ignore_extensions)
+
+
+class PathNormalizer:
+    """Memoizes ``normalize_path`` in a bounded LRU keyed on the raw path.
+
+    Rejections are cached too (as ``None``). Uncached lookups use the
+    compiled include rules and a hash set of ignored extensions.
+
+    With rules that create paths as they are seen, ``admit`` caps the
+    distinct paths each bucket can hold, so a scanner requesting random
+    URLs cannot grow the ring, SQLite or series queries without bound.
+    """
+
+    def __init__(self, config: Config) -> None:
+        self.paths = config.paths
+        self._matcher = path_matcher(config.paths)
+        self._ignore_extensions = frozenset(config.paths.ignore_extensions)
+        self.normalize = functools.lru_cache(maxsize=config.paths.cache_size)(self._normalize)
+        self.dynamic = self._matcher.dynamic
+        self._static = frozenset(self._matcher.static_paths)
+        self._admitted: Dict[int, Set[str]] = {}
+        self._admit_lock = threading.Lock()
+
+    def _normalize(self, raw_path: str) -> Optional[str]:
+        return _normalize(raw_path, self.paths, self._matcher, self._ignore_extensions)
+
+    def admit(self, bucket: int, path: str) -> str:
+        """Returns ``path``, or ``OTHER_PATH`` once ``paths.max_paths_per_bucket``
+        other dynamic paths have been admitted for ``bucket``.
+
+        Shared by every tailer; two racing tailers may admit a path or
+        two beyond the limit.
+        """
+        if path in self._static:
+            return path
+        admitted = self._admitted.get(bucket)
+        if admitted is None:
+            with self._admit_lock:
+                admitted = self._admitted.get(bucket)
+                if admitted is None:
+                    if len(self._admitted) >= ADMITTED_BUCKETS and bucket < min(self._admitted):
+                        return OTHER_PATH
+                    admitted = self._admitted[bucket] = set()
+                    while len(self._admitted) > ADMITTED_BUCKETS:
+                        del self._admitted[min(self._admitted)]
+        if path in admitted:
+            return path
+        if len(admitted) >= self.paths.max_paths_per_bucket:
+            return OTHER_PATH
+        admitted.add(path)
+        return path
+
+    def discovery_path(self, raw_path: str) -> Optional[str]:
+        """Returns ``raw_path`` as discovery records it after a rejection:
+        without its query string (when stripped) and ``None`` for ignored
+        static assets."""
+        path = raw_path
+        if self.paths.strip_query_string:
+            path = path.partition("?")[0]
+        if not path:
+            return None
+        if self.paths.ignore_static_assets:
+            _, ext = os.path.splitext(path.lower())
+            if ext and ext in self._ignore_extensions:
+                return None
+        return path
+
+    def cache_stats(self) -> Dict[str, object]:
+        info = self.normalize.cache_info()
+        lookups = info.hits + info.misses
+        return {
+            "size": info.currsize,
+            "max_size": info.maxsize,
+            "hits": info.hits,
+            "misses": info.misses,
+            "hit_rate": info.hits / lookups if lookups else None,
+        }
 
 
 def bucket_start_utc(event_time_utc: int, bucket_seconds: int) -> int:
     return (event_time_utc // bucket_seconds) * bucket_seconds
 
 
+def window_bucket_count(config: Config, bucket_seconds: Optional[int] = None) -> int:
+    """Number of buckets in the series window served by the API."""
+    if bucket_seconds is None:
+        bucket_seconds = config.window.bucket_seconds
+    requested_points = max(1, math.ceil(config.window.lookback_seconds / bucket_seconds))
+    return min(max(1, config.ui.max_points), requested_points)
+
+
+def aggregate_lines(
+    lines: Iterable[str],
+    config: Config,
+    buffer: Dict[Tuple[int, str, int], int],
+    normalizer: Optional[PathNormalizer] = None,
+    rejected: Optional[Dict[Tuple[int, str], int]] = None,
+    latency: Optional[Dict[Tuple[int, str, int, int], int]] = None,
+    clients: Optional[Dict[Tuple[int, str], Dict[int, int]]] = None,
+) -> Tuple[int, int, Optional[int]]:
+    """Parse, normalize and bucket ``lines`` into ``buffer``.
+
+    When ``rejected`` is given, paths that normalization dropped are
+    counted into it as ``(bucket, path) -> count`` for discovery. When
+    ``latency`` is given and ``log.latency_variable`` is set, each line's
+    latency bin is counted into it as ``(bucket, path, status, bin)``.
+    When ``clients`` is given and ``clients.enabled`` is set, each line's
+    client address raises ``(bucket, path) -> {register: rank}``, the
+    sparse HyperLogLog update for the batch.
+    Returns ``(ingested, parse_errors, last_event_utc)`` for the batch.
+    """
+    if normalizer is None:
+        normalizer = PathNormalizer(config)
+    normalize = normalizer.normalize
+    admit = normalizer.admit if normalizer.dynamic else None
+    timed = latency is not None and config.log.latency_variable is not None
+    counted = clients is not None and config.clients.enabled
+    parse = compile_log_format(
+        config.log.format,
+        config.log.latency_variable if timed else None,
+        config.clients.variable if counted else None,
+    ).parse
+    precision = config.clients.precision
+    bucket_seconds = config.window.bucket_seconds
+    ingested = 0
+    parse_errors = 0
+    last_event_utc = None
+    for line in lines:
+        parsed = parse(line)
+        if parsed is None:
+            parse_errors += 1
+            continue
+        if timed and counted:
+            event_time_utc, path_raw, status, latency_index, client = parsed
+        elif timed:
+            event_time_utc, path_raw, status, latency_index = parsed
+        elif counted:
+            event_time_utc, path_raw, status, client = parsed
+        else:
+            event_time_utc, path_raw, status = parsed
+        path = normalize(path_raw)
+        if not path:
+            if rejected is not None:
+                candidate = normalizer.discovery_path(path_raw)
+                if candidate is not None:
+                    rejected_key = ((event_time_utc // bucket_seconds) * bucket_seconds, candidate)
+                    rejected[rejected_key] = rejected.get(rejected_key, 0) + 1
+            continue
+        bucket = (event_time_utc // bucket_seconds) * bucket_seconds
+        if admit is not None:
+            path = admit(bucket, path)
+        key = (bucket, path, status)
+        buffer[key] = buffer.get(key, 0) + 1
+        if timed and latency_index is not None:
+            latency_key = key + (latency_index,)
+            latency[latency_key] = latency.get(latency_key, 0) + 1
+        if counted and client is not None:
+            index, rank = client_register(client, precision)
+            ranks = clients.get(key[:2])
+            if ranks is None:
+                ranks = clients[key[:2]] = {}
+            if rank > ranks.get(index, 0):
+                ranks[index] = rank
+        last_event_utc = event_time_utc
+        ingested += 1
+    return ingested, parse_errors, last_event_utc
+
+
+class LineReader:
+    """Reads one complete line per call, holding back a partial last line."""
+
+    def __init__(self, handle) -> None:
+        self.handle = handle
+        self.pending = b""
+
+    def read(self) -> Optional[List[str]]:
+        data = self.handle.readline()
+        if not data:
+            return None
+        if not data.endswith(b"\n"):
+            self.pending += data
+            return []
+        if self.pending:
+            data = self.pending + data
+            self.pending = b""
+        return [data.decode("utf-8", errors="replace")]
+
+
+class BlockReader:
+    """Reads up to ``chunk_bytes`` per call and returns every complete line.
+
+    The trailing partial line is kept and prepended to the next read, so a
+    writer caught mid-line never produces a truncated record.
+    """
+
+    def __init__(self, handle, chunk_bytes: int) -> None:
+        self.handle = handle
+        self.chunk_bytes = chunk_bytes
+        self.pending = b""
+
+    def read(self) -> Optional[List[str]]:
+        data = self.handle.read(self.chunk_bytes)
+        if not data:
+            return None
+        if self.pending:
+            data = self.pending + data
+        cut = data.rfind(b"\n")
+        if cut < 0:
+            self.pending = data
+            return []
+        self.pending = data[cut + 1 :]
+        return data[:cut].decode("utf-8", errors="replace").split("\n")
+
+
+class LogTailer:
+    """Follows a single access log, tracking its own offset and rotation.
+
+    Each batch is aggregated locally and handed to ``sink`` together with
+    the newest event time, the ``(inode, offset)`` consumed so far, the
+    batch's latency histogram deltas (``None`` unless
+    ``log.latency_variable`` is set) and its client sketch updates
+    (``None`` unless ``clients.enabled``), so tailers never hold the
+    shared buffer lock while parsing.
+
+    ``start_offset`` resumes from a checkpoint. If that inode has since
+    been rotated to ``path.N`` the rotated file is drained first; the
+    current file is then read from its start.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        config: Config,
+        normalizer: PathNormalizer,
+        sink: Callable[
+            [
+                str,
+                Dict[Tuple[int, str, int], int],
+                Optional[int],
+                Tuple[int, int],
+                Optional[Dict[Tuple[int, str, int, int], int]],
+                Optional[Dict[Tuple[int, str], Dict[int, int]]],
+            ],
+            None,
+        ],
+        log_error: Callable[[str], None],
+        start_at_end: bool = True,
+        start_offset: Optional[Tuple[int, int]] = None,
+        metrics: Optional[IngestMetrics] = None,
+        discovery: Optional[DiscoveryRing] = None,
+    ) -> None:
+        self.path = path
+        self.config = config
+        self.normalizer = normalizer
+        self.sink = sink
+        self.log_error = log_error
+        self.start_at_end = start_at_end
+        self.start_offset = start_offset
+        self.metrics = metrics
+        self.discovery = discovery
+        self.tailing = False
+        # (file being read, offset consumed), for the bytes-behind gauge.
+        self.position: Optional[Tuple[str, int]] = None
+
+    def bytes_behind(self) -> int:
+        """Returns how far the consumed offset trails the end of the open file."""
+        position = self.position
+        if position is None:
+            return 0
+        try:
+            return max(0, os.stat(position[0]).st_size - position[1])
+        except OSError:
+            return 0
+
+    def _find_inode(self, inode: int) -> Optional[str]:
+        candidates = [self.path] + sorted(glob.glob(glob.escape(self.path) + ".*"))
+        for candidate in candidates:
+            if candidate.endswith(".gz"):
+                continue
+            try:
+                if os.stat(candidate).st_ino == inode:
+                    return candidate
+            except OSError:
+                continue
+        return None
+
+    def _open_log(self) -> Optional[Tuple[object, int, str]]:
+        path = self.path
+        offset = None
+        if self.start_offset is not None:
+            inode, offset = self.start_offset
+            found = self._find_inode(inode)
+            if found is None:
+                # The checkpointed file is gone, so all of the current one is new.
+                offset = 0
+            else:
+                path = found
+        try:
+            handle = open(path, "rb")
+        except OSError as exc:
+            self.tailing = False
+            self.log_error(f"ingest: unable to open log {path}: {exc}")
+            return None
+        try:
+            stat = os.fstat(handle.fileno())
+            inode = stat.st_ino
+            if offset is not None:
+                handle.seek(offset if offset <= stat.st_size else 0)
+            elif self.start_at_end:
+                handle.seek(0, os.SEEK_END)
+            self.start_offset = None
+            self.start_at_end = False
+            self.tailing = True
+            return handle, inode, path
+        except OSError as exc:
+            handle.close()
+            self.tailing = False
+            self.log_error(f"ingest: unable to stat log {path}: {exc}")
+            return None
+
+    def _make_reader(self, handle):
+        if self.config.ingest.read_mode == "line":
+            return LineReader(handle)
+        return BlockReader(handle, self.config.ingest.read_chunk_bytes)
+
+    def run(self, stop_event: threading.Event) -> None:
+        log_handle = None
+        log_inode = None
+        reader = None
+        watcher = create_watcher(self.config.ingest.watch)
+
+        try:
+            while not stop_event.is_set():
+                try:
+                    if log_handle is None:
+                        opened = self._open_log()
+                        if opened is None:
+                            stop_event.wait(1)
+                            continue
+                        log_handle, log_inode, open_path = opened
+                        self.position = (open_path, log_handle.tell())
+                        reader = self._make_reader(log_handle)
+                        try:
+                            watcher.watch(open_path)
+                        except OSError as exc:
+                            self.log_error(f"ingest: falling back to polling: {exc}")
+                            watcher.close()
+                            watcher = PollWatcher()
+
+                    lines = reader.read()
+                    if lines:
+                        counts: Dict[Tuple[int, str, int], int] = {}
+                        rejected: Optional[Dict[Tuple[int, str], int]] = None
+                        if self.discovery is not None:
+                            rejected = {}
+                        latency: Optional[Dict[Tuple[int, str, int, int], int]] = None
+                        if self.config.log.latency_variable is not None:
+                            latency = {}
+                        clients: Optional[Dict[Tuple[int, str], Dict[int, int]]] = None
+                        if self.config.clients.enabled:
+                            clients = {}
+                        ingested, parse_errors, last_event_utc = aggregate_lines(
+                            lines, self.config, counts, self.normalizer, rejected, latency, clients
+                        )
+                        if rejected:
+                            self.discovery.add(rejected)
+                        if parse_errors:
+                            self.log_error("ingest: parse error")
+                        metrics = self.metrics
+                        if metrics is not None:
+                            metrics.lines_read.inc(len(lines))
+                            metrics.lines_parsed.inc(len(lines) - parse_errors)
+                            metrics.lines_rejected.inc(len(lines) - parse_errors - ingested)
+                            metrics.parse_errors.inc(parse_errors)
+                        offset = log_handle.tell() - len(reader.pending)
+                        self.position = (open_path, offset)
+                        self.sink(self.path, counts, last_event_utc, (log_inode, offset), latency, clients)
+                    elif lines is None:
+                        if open_path == self.path:
+                            watcher.wait(TAILER_WAIT_SECONDS)
+                        try:
+                            stat = os.stat(self.path)
+                            if stat.st_ino != log_inode or stat.st_size < log_handle.tell():
+                                log_handle.close()
+                                log_handle = None
+                                log_inode = None
+                                self.tailing = False
+                        except OSError:
+                            log_handle.close()
+                            log_handle = None
+                            log_inode = None
+                            self.tailing = False
+                except Exception as exc:
+                    self.log_error(f"ingest: unexpected error: {exc}")
+                    stop_event.wait(1)
+        finally:
+            self.tailing = False
+            self.position = None
+            if log_handle is not None:
+                log_handle.close()
+            watcher.close()
+
+
 class LogIngester:
-    def __init__(self, config: Config, sqlite_path: str) -> None:
+    def __init__(
+        self,
+        config: Config,
+        sqlite_path: str,
+        start_offsets: Optional[Dict[str, Tuple[int, int]]] = None,
+    ) -> None:
         self.config = config
         self.sqlite_path = sqlite_path
-        self.state = IngestState()
+        self.start_offsets = dict(start_offsets or {})
+        self.normalizer = PathNormalizer(config)
+        self.hot = HotRing(config.window.bucket_seconds, window_bucket_count(config) + 1)
+        self.discovery: Optional[DiscoveryRing] = None
+        if config.discovery.enabled:
+            self.discovery = DiscoveryRing(
+                config.window.bucket_seconds, window_bucket_count(config), config.discovery.capacity
+            )
+        self.state = IngestState(normalizer=self.normalizer, hot=self.hot, discovery=self.discovery)
+        self.metrics = IngestMetrics(self.state.metrics)
+        self.state.metrics.gauge(
+            "fizzylog_buffer_keys", "Rollup keys waiting for the next flush.", lambda: len(self._buffer)
+        )
+        self.state.metrics.gauge(
+            "fizzylog_flush_max_keys", "Current adaptive flush key limit.", lambda: self.flush_max_keys
+        )
+        self.state.metrics.gauge(
+            "fizzylog_bytes_behind",
+            "Bytes between each tailer's offset and the end of its file.",
+            lambda: {path: tailer.bytes_behind() for path, tailer in list(self._tailers.items())},
+            label="path",
+        )
         self._stop_event = threading.Event()
+        # Set when the flush loop should run early: a limit was hit or stop().
+        self._wakeup = threading.Event()
         self._thread = threading.Thread(target=self._run, daemon=True)
         self._last_error_log = 0.0
+        self._lock = threading.Lock()
+        self._drained = threading.Condition(self._lock)
+        self._buffer: Dict[Tuple[int, str, int], int] = {}
+        self._latency: Dict[Tuple[int, str, int, int], int] = {}
+        # One fixed-size register array per (bucket, path).
+        self._clients: Dict[Tuple[int, str], bytearray] = {}
+        self._pending_events = 0
+        self._checkpoints: Dict[str, Tuple[int, int]] = {}
+        # (first, last) bucket ingested from each log during this run.
+        self._coverage: Dict[str, Tuple[int, int]] = {}
+        self.flush_max_keys = config.ingest.flush_max_keys
+        self._keys_per_second: Optional[float] = None
+        self._path_index = db.PathIndex()
+        self._tailers: Dict[str, LogTailer] = {}
 
     def start(self) -> None:
         if not self._thread.is_alive():
@@ -89,6 +577,9 @@ class LogIngester:
 
     def stop(self) -> None:
         self._stop_event.set()
+        self._wakeup.set()
+        with self._drained:
+            self._drained.notify_all()
         if self._thread.is_alive():
             self._thread.join(timeout=5)
 
@@ -98,94 +589,228 @@ class LogIngester:
             self._last_error_log = now
             print(message)
 
-    def _open_log(self) -> Optional[Tuple[object, int]]:
-        try:
-            handle = open(self.config.log.path, "r", encoding="utf-8", errors="replace")
-        except OSError as exc:
-            self.state.tailing = False
-            self._log_parse_error(f"ingest: unable to open log: {exc}")
-            return None
-        try:
-            stat = os.fstat(handle.fileno())
-            inode = stat.st_ino
-            handle.seek(0, os.SEEK_END)
-            self.state.tailing = True
-            return handle, inode
-        except OSError as exc:
-            handle.close()
-            self.state.tailing = False
-            self._log_parse_error(f"ingest: unable to stat log: {exc}")
-            return None
+    def _merge(
+        self,
+        path: str,
+        counts: Dict[Tuple[int, str, int], int],
+        last_event_utc: Optional[int],
+        checkpoint: Tuple[int, int],
+        latency: Optional[Dict[Tuple[int, str, int, int], int]] = None,
+        clients: Optional[Dict[Tuple[int, str], Dict[int, int]]] = None,
+    ) -> None:
+        with self._lock:
+            # Backpressure: while the flush loop is behind, the tailer blocks
+            # here and so stops reading until the buffer has been taken.
+            if len(self._buffer) >= BACKPRESSURE_FACTOR * self.flush_max_keys:
+                started = time.perf_counter()
+                while (
+                    len(self._buffer) >= BACKPRESSURE_FACTOR * self.flush_max_keys
+                    and not self._stop_event.is_set()
+                ):
+                    self._drained.wait(TAILER_WAIT_SECONDS)
+                self.metrics.backpressure_seconds.inc(time.perf_counter() - started)
+        if counts:
+            self.hot.add(counts)
+        with self._lock:
+            self._checkpoints[path] = checkpoint
+            if counts:
+                buckets = [key[0] for key in counts]
+                first, last = min(buckets), max(buckets)
+                covered = self._coverage.get(path)
+                if covered is not None:
+                    first, last = min(first, covered[0]), max(last, covered[1])
+                self._coverage[path] = (first, last)
+            buffer = self._buffer
+            for key, count in counts.items():
+                buffer[key] = buffer.get(key, 0) + count
+                self._pending_events += count
+            if latency:
+                latency_buffer = self._latency
+                for key, count in latency.items():
+                    latency_buffer[key] = latency_buffer.get(key, 0) + count
+            if clients:
+                client_buffer = self._clients
+                for key, ranks in clients.items():
+                    registers = client_buffer.get(key)
+                    if registers is None:
+                        registers = client_buffer[key] = bytearray(1 << self.config.clients.precision)
+                    hll.apply(registers, ranks)
+            if len(buffer) >= self.flush_max_keys or self._pending_events >= self.config.ingest.flush_max_events:
+                self._wakeup.set()
+            if last_event_utc is not None and (
+                self.state.last_ingest_utc is None or last_event_utc > self.state.last_ingest_utc
+            ):
+                self.state.last_ingest_utc = last_event_utc
+
+    def _take_buffer(
+        self,
+    ) -> Tuple[
+        Dict[Tuple[int, str, int], int],
+        Dict[str, Tuple[int, int]],
+        Dict[Tuple[int, str, int, int], int],
+        Dict[Tuple[int, str], bytearray],
+        Dict[str, Tuple[int, int]],
+    ]:
+        with self._lock:
+            buffer, checkpoints, latency, clients = self._buffer, self._checkpoints, self._latency, self._clients
+            self._buffer = {}
+            self._checkpoints = {}
+            self._latency = {}
+            self._clients = {}
+            self._pending_events = 0
+            self._drained.notify_all()
+            coverage = dict(self._coverage)
+        return buffer, checkpoints, latency, clients, coverage
+
+    def _restore_buffer(
+        self,
+        buffer: Dict[Tuple[int, str, int], int],
+        checkpoints: Dict[str, Tuple[int, int]],
+        latency: Dict[Tuple[int, str, int, int], int],
+        clients: Dict[Tuple[int, str], bytearray],
+    ) -> None:
+        """Puts a taken buffer back after its write failed, so the next
+        flush retries it.
+
+        A checkpoint merged since the take covers the restored counts as
+        well as the newer ones, so it wins over the restored checkpoint.
+        """
+        with self._lock:
+            live = self._buffer
+            for key, count in buffer.items():
+                live[key] = live.get(key, 0) + count
+                self._pending_events += count
+            for path, checkpoint in checkpoints.items():
+                self._checkpoints.setdefault(path, checkpoint)
+            for key, count in latency.items():
+                self._latency[key] = self._latency.get(key, 0) + count
+            for key, registers in clients.items():
+                current = self._clients.get(key)
+                self._clients[key] = registers if current is None else bytearray(hll.union(current, registers))
+
+    def _adapt_flush_limit(self, keys: int, seconds: float) -> None:
+        """Sizes the key limit so a flush commits in about ``flush_target_seconds``."""
+        if keys < MIN_FLUSH_KEYS:
+            return
+        rate = keys / max(seconds, 1e-6)
+        if self._keys_per_second is None:
+            self._keys_per_second = rate
+        else:
+            self._keys_per_second += FLUSH_RATE_SMOOTHING * (rate - self._keys_per_second)
+        target = int(self._keys_per_second * self.config.ingest.flush_target_seconds)
+        self.flush_max_keys = max(MIN_FLUSH_KEYS, min(self.config.ingest.flush_max_keys, target))
+
+    def _start_tailers(self, executor: ThreadPoolExecutor, start_at_end: bool) -> None:
+        for path in expand_log_paths(self.config.log, self._tailers):
+            if path in self._tailers:
+                continue
+            if len(self._tailers) >= self.config.ingest.max_tailers:
+                self._log_parse_error(f"ingest: max_tailers reached, not tailing {path}")
+                break
+            tailer = LogTailer(
+                path,
+                self.config,
+                self.normalizer,
+                self._merge,
+                self._log_parse_error,
+                start_at_end=start_at_end,
+                start_offset=self.start_offsets.get(path),
+                metrics=self.metrics,
+                discovery=self.discovery,
+            )
+            self._tailers[path] = tailer
+            executor.submit(tailer.run, self._stop_event)
+
+    def _notify_flush(self, buffer: Dict[Tuple[int, str, int], int]) -> None:
+        buckets = sorted({bucket for bucket, _, _ in buffer})
+        for listener in list(self.state.flush_listeners):
+            try:
+                listener(self.state.flush_generation, buckets)
+            except Exception as exc:
+                self._log_parse_error(f"ingest: flush listener failed: {exc}")
+
+    def _refresh_state(self) -> None:
+        sources = {path: tailer.tailing for path, tailer in self._tailers.items()}
+        self.state.sources = sources
+        self.state.tailing = any(sources.values())
 
     def _run(self) -> None:
-        db.init_db(self.sqlite_path)
+        tiers = tier_seconds(self.config.storage)
+        db.init_db(self.sqlite_path, tiers, self.config.window.bucket_seconds)
         conn = db.get_connection(self.sqlite_path)
 
-        buffer: Dict[Tuple[int, str, int], int] = {}
         flush_seconds = self.config.ingest.flush_seconds
         retention_seconds = self.config.storage.retention_seconds
         next_flush = time.time() + flush_seconds
-        next_retention = time.time() + retention_seconds
-
-        log_handle = None
-        log_inode = None
-
+        next_retention = time.time() + min(retention_seconds, RETENTION_CHECK_SECONDS)
+        next_rescan = time.time() + RESCAN_SECONDS
+
+        executor = ThreadPoolExecutor(
+            max_workers=self.config.ingest.max_tailers,
+            thread_name_prefix="fizzylog-tail",
+        )
+        bucket_seconds = self.config.window.bucket_seconds
+        # The current bucket may already hold counts flushed before a restart.
+        self.hot.reset(bucket_start_utc(int(time.time()), bucket_seconds) + bucket_seconds)
         try:
+            for path, checkpoint in db.load_checkpoints(conn).items():
+                self.start_offsets[path] = checkpoint
+            self._start_tailers(executor, start_at_end=True)
             while not self._stop_event.is_set():
                 try:
-                    if log_handle is None:
-                        opened = self._open_log()
-                        if opened is None:
-                            time.sleep(1)
-                            continue
-                        log_handle, log_inode = opened
-
-                    line = log_handle.readline()
-                    if line:
-                        parsed = parse_log_line(line)
-                        if parsed is None:
-                            self._log_parse_error("ingest: parse error")
-                        else:
-                            event_time_utc, path_raw, status = parsed
-                            path = normalize_path(path_raw, self.config)
-                            if path:
-                                bucket = bucket_start_utc(event_time_utc, self.config.window.bucket_seconds)
-                                key = (bucket, path, status)
-                                buffer[key] = buffer.get(key, 0) + 1
-                                self.state.last_ingest_utc = event_time_utc
-                    else:
-                        time.sleep(0.2)
-                        try:
-                            stat = os.stat(self.config.log.path)
-                            if stat.st_ino != log_inode or stat.st_size < log_handle.tell():
-                                log_handle.close()
-                                log_handle = None
-                                log_inode = None
-                                self.state.tailing = False
-                        except OSError:
-                            log_handle.close()
-                            log_handle = None
-                            log_inode = None
-                            self.state.tailing = False
+                    self._wakeup.wait(max(0.0, min(next_flush, next_retention) - time.time()))
+                    flush_wanted = self._wakeup.is_set()
+                    self._wakeup.clear()
+                    if self._stop_event.is_set():
+                        break
+                    self._refresh_state()
 
                     now = time.time()
-                    if now >= next_flush:
-                        db.write_rollups(conn, buffer)
-                        buffer.clear()
+                    if now >= next_flush or flush_wanted:
+                        buffer, checkpoints, latency, clients, coverage = self._take_buffer()
+                        started = time.perf_counter()
+                        try:
+                            db.write_rollups(
+                                conn, buffer, checkpoints, tiers, self._path_index, latency, clients, coverage
+                            )
+                        except Exception:
+                            self._restore_buffer(buffer, checkpoints, latency, clients)
+                            raise
+                        if buffer or checkpoints:
+                            elapsed = time.perf_counter() - started
+                            self.metrics.flush_seconds.observe(elapsed)
+                            self.metrics.flushes.inc()
+                            self.metrics.rows_upserted.inc(len(buffer))
+                            self._adapt_flush_limit(len(buffer), elapsed)
+                        if buffer:
+                            self.state.flush_generation += 1
+                        self._notify_flush(buffer)
                         next_flush = now + flush_seconds
 
                     if now >= next_retention:
                         cutoff = int(now) - retention_seconds
-                        db.apply_retention(conn, cutoff)
-                        next_retention = now + retention_seconds
+                        tier_cutoffs = {
+                            tier.bucket_seconds: int(now) - tier.retention_seconds
+                            for tier in self.config.storage.tiers
+                        }
+                        started = time.perf_counter()
+                        dropped = db.apply_retention(conn, cutoff, tier_cutoffs)
+                        self.metrics.retention_seconds.observe(time.perf_counter() - started)
+                        self.metrics.partitions_dropped.inc(dropped)
+                        next_retention = now + min(retention_seconds, RETENTION_CHECK_SECONDS)
+
+                    if now >= next_rescan:
+                        self._start_tailers(executor, start_at_end=False)
+                        next_rescan = now + RESCAN_SECONDS
                 except Exception as exc:
                     self._log_parse_error(f"ingest: unexpected error: {exc}")
                     time.sleep(1)
         except Exception as exc:
             self._log_parse_error(f"ingest: fatal error: {exc}")
         finally:
-            if buffer:
-                db.write_rollups(conn, buffer)
-            if log_handle is not None:
-                log_handle.close()
+            self._stop_event.set()
+            executor.shutdown(wait=True)
+            self._refresh_state()
+            buffer, checkpoints, latency, clients, coverage = self._take_buffer()
+            db.write_rollups(conn, buffer, checkpoints, tiers, self._path_index, latency, clients, coverage)
             conn.close()
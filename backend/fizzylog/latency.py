@@ -0,0 +1,83 @@
+from __future__ import annotations
+
+import functools
+import math
+from typing import Dict, Iterable, List, Optional, Sequence
+
+# Latency histograms use fixed log-scale bins so they merge by adding
+# counts. Bin 0 holds everything under LATENCY_MIN_SECONDS; bin n >= 1
+# covers [MIN * 2**((n-1)/k), MIN * 2**(n/k)) with k = BINS_PER_DOUBLING,
+# and the last bin also takes everything slower.
+LATENCY_MIN_SECONDS = 0.001
+BINS_PER_DOUBLING = 4
+LATENCY_MAX_BIN = 68  # 2**(68/4) ms is about 131 s
+QUANTILES = (0.5, 0.95, 0.99)
+
+
+def _bin_of(seconds: float) -> int:
+    if seconds < LATENCY_MIN_SECONDS:
+        return 0
+    position = math.log2(seconds / LATENCY_MIN_SECONDS) * BINS_PER_DOUBLING
+    return min(LATENCY_MAX_BIN, int(position) + 1)
+
+
+@functools.lru_cache(maxsize=65536)
+def latency_bin(text: str) -> Optional[int]:
+    """Returns the histogram bin of an nginx ``$request_time`` or
+    ``$upstream_response_time`` value, or ``None`` for ``-``.
+
+    Upstream times list one value per upstream tried (``0.010, 0.020``,
+    or ``:`` across internal redirects); they are added up. nginx logs
+    millisecond resolution, so the cache sees a bounded set of strings.
+    """
+    total = 0.0
+    seen = False
+    for part in text.replace(":", ",").split(","):
+        part = part.strip()
+        if not part or part == "-":
+            continue
+        try:
+            total += float(part)
+        except ValueError:
+            return None
+        seen = True
+    if not seen:
+        return None
+    return _bin_of(total)
+
+
+def bin_value(index: int) -> float:
+    """Representative latency of a bin in seconds (its geometric midpoint).
+
+    Quantiles read from it are within about 9% of the true value for
+    bins above ``LATENCY_MIN_SECONDS``.
+    """
+    if index <= 0:
+        return LATENCY_MIN_SECONDS / 2
+    return LATENCY_MIN_SECONDS * 2 ** ((index - 0.5) / BINS_PER_DOUBLING)
+
+
+def quantiles(histogram: Dict[int, int], qs: Sequence[float] = QUANTILES) -> List[Optional[float]]:
+    """Returns the latency in seconds at each quantile of a merged histogram."""
+    total = sum(histogram.values())
+    if not total:
+        return [None] * len(qs)
+    ordered = sorted(histogram.items())
+    results: List[Optional[float]] = []
+    for q in qs:
+        rank = max(1, math.ceil(q * total))
+        seen = 0
+        for index, count in ordered:
+            seen += count
+            if seen >= rank:
+                results.append(bin_value(index))
+                break
+    return results
+
+
+def merge(histograms: Iterable[Dict[int, int]]) -> Dict[int, int]:
+    merged: Dict[int, int] = {}
+    for histogram in histograms:
+        for index, count in histogram.items():
+            merged[index] = merged.get(index, 0) + count
+    return merged
@@ -6,7 +6,8 @@ import logging
 import uvicorn
 
 from .api import create_app
-from .config import load_config, storage_dsn
+from .backfill import run_backfill
+from .config import load_config, storage_dsn, tier_seconds
 from .db import init_db
 from .ingest import LogIngester
 
@@ -14,9 +15,37 @@ from .ingest import LogIngester
 def build_parser() -> argparse.ArgumentParser:
     parser = argparse.ArgumentParser(description="fizzylog")
     parser.add_argument("--config", required=True, help="Path to config.yml")
+    parser.add_argument(
+        "command",
+        nargs="?",
+        choices=["serve", "backfill"],
+        default="serve",
+        help="serve (default) runs the API and ingester; backfill loads rotated logs and exits",
+    )
+    parser.add_argument(
+        "--workers",
+        type=int,
+        default=None,
+        help="Backfill worker processes (defaults to ingest.backfill_workers)",
+    )
     return parser
 
 
+def _backfill(config, sqlite_path: str, workers) -> dict:
+    if workers is None:
+        workers = config.ingest.backfill_workers
+    result = run_backfill(config, sqlite_path, workers=workers)
+    logging.info(
+        "backfill: %d files, %d lines, %d parse errors, %d rows in %.2fs",
+        result.files,
+        result.lines,
+        result.parse_errors,
+        result.rows,
+        result.seconds,
+    )
+    return result.offsets
+
+
 def main() -> None:
     parser = build_parser()
     args = parser.parse_args()
@@ -26,9 +55,17 @@ def main() -> None:
     config = load_config(args.config)
     sqlite_path = storage_dsn(config.storage)
 
-    init_db(sqlite_path)
+    init_db(sqlite_path, tier_seconds(config.storage), config.window.bucket_seconds)
+
+    if args.command == "backfill":
+        _backfill(config, sqlite_path, args.workers)
+        return
+
+    start_offsets = None
+    if config.ingest.backfill_on_start:
+        start_offsets = _backfill(config, sqlite_path, args.workers)
 
-    ingester = LogIngester(config, sqlite_path)
+    ingester = LogIngester(config, sqlite_path, start_offsets=start_offsets)
     app = create_app(config, ingester.state, sqlite_path)
 
     @app.on_event("startup")
@@ -38,6 +75,7 @@ def main() -> None:
     @app.on_event("shutdown")
     def _shutdown() -> None:
         ingester.stop()
+        app.state.read_pool.close()
 
     uvicorn.run(app, host="127.0.0.1", port=config.api.port, log_level="info")
 
@@ -18,6 +18,15 @@ class StatusFilter:
     ranges: List[str]
     exact: List[int]
 
+    def matches(self, status: int) -> bool:
+        if self.mode == "exact":
+            return status in self.exact
+        for entry in self.ranges:
+            bounds = STATUS_RANGE_BOUNDS.get(entry)
+            if bounds and bounds[0] <= status <= bounds[1]:
+                return True
+        return False
+
 
 def parse_status_ranges(value: Optional[str]) -> List[str]:
     if not value:
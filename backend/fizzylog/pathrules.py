@@ -0,0 +1,251 @@
+from __future__ import annotations
+
+import functools
+import re
+from dataclasses import dataclass
+from typing import Callable, Dict, Iterable, List, Optional, Sequence, Tuple
+
+
+@dataclass(frozen=True)
+class PathRule:
+    """One ``include_prefix``, ``include_glob`` or ``include_regex`` entry.
+
+    Without ``rewrite`` a matching path is tracked as itself. ``rewrite``
+    is the canonical path to track instead; for regex rules it may refer
+    to named groups as ``{name}``.
+    """
+
+    match: str
+    rewrite: Optional[str] = None
+
+
+# Characters that stand for themselves in every rule kind, used to find the
+# literal text a rule starts with.
+_LITERAL_CHARS = frozenset("abcdefghijklmnopqrstuvwxyzABCDEFGHIJKLMNOPQRSTUVWXYZ0123456789/-_~%")
+_QUANTIFIERS = frozenset("?*+{")
+_PLACEHOLDER = re.compile(r"\{(\w+)\}")
+_NAMED_GROUP = re.compile(r"\(\?P<(\w+)>")
+_NAMED_BACKREF = re.compile(r"\(\?P=(\w+)\)")
+_LEADING_FLAGS = re.compile(r"^\(\?([imsx]+)\)")
+# \1 .. \9 not preceded by an escaping backslash.
+_NUMBERED_BACKREF = re.compile(r"(?<!\\)(?:\\\\)*\\[1-9]")
+
+Rewrite = Callable[["re.Match[str]"], str]
+
+
+def _glob_regex(pattern: str) -> str:
+    parts = []
+    index = 0
+    while index < len(pattern):
+        char = pattern[index]
+        if pattern.startswith("**", index):
+            parts.append(".*")
+            index += 2
+            continue
+        if char == "*":
+            parts.append("[^/]*")
+        elif char == "?":
+            parts.append("[^/]")
+        else:
+            parts.append(re.escape(char))
+        index += 1
+    return "".join(parts)
+
+
+def _regex_literal(pattern: str) -> str:
+    if "|" in pattern:
+        # A top-level alternative could start anywhere.
+        return ""
+    if pattern.startswith("^"):
+        pattern = pattern[1:]
+    elif pattern.startswith(r"\A"):
+        pattern = pattern[2:]
+    literal = []
+    for char in pattern:
+        if char not in _LITERAL_CHARS:
+            if char in _QUANTIFIERS and literal:
+                literal.pop()
+            break
+        literal.append(char)
+    return "".join(literal)
+
+
+def _glob_literal(pattern: str) -> str:
+    end = len(pattern)
+    for wildcard in "*?":
+        position = pattern.find(wildcard)
+        if position != -1:
+            end = min(end, position)
+    return pattern[:end]
+
+
+def _segment_key(literal: str) -> Optional[str]:
+    """First path segment of ``literal`` (``/api`` for ``/api/v1``), if complete."""
+    end = literal.find("/", 1)
+    if not literal.startswith("/") or end == -1:
+        return None
+    return literal[:end]
+
+
+def _path_key(path: str) -> Optional[str]:
+    end = path.find("/", 1)
+    if end == -1:
+        return None
+    return path[:end]
+
+
+def _template_rewrite(template: str, group_prefix: str) -> Rewrite:
+    names = [f"{group_prefix}{name}" for name in _PLACEHOLDER.findall(template)]
+    pieces = _PLACEHOLDER.split(template)[0::2]
+
+    def rewrite(match: "re.Match[str]") -> str:
+        out = [pieces[0]]
+        for name, piece in zip(names, pieces[1:]):
+            out.append(match.group(name) or "")
+            out.append(piece)
+        return "".join(out)
+
+    return rewrite
+
+
+class PathMatcher:
+    """Evaluates every include rule against a path in one regex match.
+
+    Exact paths are a set lookup. All other rules are compiled, in
+    priority order (regex, then glob, then prefix rules from the longest
+    prefix down), into alternations of one pattern, so the rule that
+    matched is read from ``Match.lastgroup`` instead of trying rules one
+    by one. Rules that start with a complete first path segment
+    (``/api/...``) are only placed in that segment's pattern; a path
+    picks its pattern with one dict lookup on its own first segment, so
+    rules for other sections of the site are never looked at.
+    """
+
+    def __init__(
+        self,
+        exact: Sequence[str],
+        regex: Sequence[PathRule] = (),
+        glob: Sequence[PathRule] = (),
+        prefix: Sequence[PathRule] = (),
+    ) -> None:
+        self.exact = frozenset(exact)
+        static: List[str] = list(exact)
+        self.dynamic = False
+        # (source regex, segment key, rewrite or None to keep the path)
+        compiled: List[Tuple[str, Optional[str], Optional[Rewrite]]] = []
+
+        for rule in regex:
+            try:
+                pattern = re.compile(rule.match)
+            except re.error as exc:
+                raise ValueError(f"invalid regex {rule.match!r}: {exc}") from exc
+            # Rules are wrapped in a group and joined into one pattern, which
+            # shifts group numbers and would let a verbose comment swallow
+            # the closing parenthesis.
+            if _NUMBERED_BACKREF.search(rule.match):
+                raise ValueError(f"regex {rule.match!r}: use a named group and (?P=name) instead of \\N")
+            if pattern.flags & re.VERBOSE:
+                raise ValueError(f"regex {rule.match!r}: verbose (?x) patterns are not supported")
+            groups = pattern.groupindex
+            group_prefix = f"_r{len(compiled)}_"
+            source = _NAMED_GROUP.sub(lambda m: f"(?P<{group_prefix}{m.group(1)}>", rule.match)
+            source = _NAMED_BACKREF.sub(lambda m: f"(?P={group_prefix}{m.group(1)})", source)
+            # Flags like (?i) must start a pattern, so scope them to this rule.
+            source = _LEADING_FLAGS.sub(lambda m: f"(?{m.group(1)}:", source)
+            if source != rule.match and _LEADING_FLAGS.match(rule.match):
+                source += ")"
+            try:
+                re.compile(f"(?P<_r{len(compiled)}>{source})")
+            except re.error as exc:
+                raise ValueError(f"regex {rule.match!r} cannot be combined with other rules: {exc}") from exc
+            rewrite: Optional[Rewrite] = None
+            if rule.rewrite is not None:
+                missing = [name for name in _PLACEHOLDER.findall(rule.rewrite) if name not in groups]
+                if missing:
+                    raise ValueError(f"rewrite {rule.rewrite!r} refers to unknown group {missing[0]!r}")
+                rewrite = _template_rewrite(rule.rewrite, group_prefix)
+            compiled.append((source, _segment_key(_regex_literal(rule.match)), rewrite))
+            self._track(rule, static, dynamic_rewrite=bool(_PLACEHOLDER.search(rule.rewrite or "")))
+
+        for rule in glob:
+            compiled.append(
+                (_glob_regex(rule.match), _segment_key(_glob_literal(rule.match)), self._fixed(rule.rewrite))
+            )
+            self._track(rule, static)
+
+        for rule in sorted(prefix, key=lambda item: len(item.match), reverse=True):
+            compiled.append((re.escape(rule.match) + ".*", _segment_key(rule.match), self._fixed(rule.rewrite)))
+            self._track(rule, static)
+
+        self.static_paths = list(dict.fromkeys(static))
+        self._rewrites: Dict[str, Optional[Rewrite]] = {
+            f"_r{position}": rewrite for position, (_, _, rewrite) in enumerate(compiled)
+        }
+
+        def combine(key: Optional[str]) -> Optional["re.Pattern[str]"]:
+            # Rules without a segment key can match under any segment, so
+            # they are part of every pattern, still in priority order.
+            alternatives = [
+                f"(?P<_r{position}>{source})"
+                for position, (source, rule_key, _) in enumerate(compiled)
+                if rule_key is None or rule_key == key
+            ]
+            if not alternatives:
+                return None
+            try:
+                return re.compile("|".join(alternatives))
+            except re.error as exc:
+                raise ValueError(f"include rules cannot be combined: {exc}") from exc
+
+        keys = {key for _, key, _ in compiled if key is not None}
+        self._by_segment = {key: combine(key) for key in keys}
+        self._fallback = combine(None)
+
+    @staticmethod
+    def _fixed(rewrite: Optional[str]) -> Optional[Rewrite]:
+        if rewrite is None:
+            return None
+        return lambda match: rewrite
+
+    def _track(self, rule: PathRule, static: List[str], dynamic_rewrite: bool = False) -> None:
+        if rule.rewrite is None or dynamic_rewrite:
+            self.dynamic = True
+        else:
+            static.append(rule.rewrite)
+
+    def match(self, path: str) -> Optional[str]:
+        """Returns the canonical path to track for ``path``, or ``None``."""
+        if path in self.exact:
+            return path
+        pattern = self._by_segment.get(_path_key(path), self._fallback)
+        if pattern is None:
+            return None
+        match = pattern.fullmatch(path)
+        if match is None:
+            return None
+        rewrite = self._rewrites[match.lastgroup]
+        return path if rewrite is None else rewrite(match)
+
+
+@functools.lru_cache(maxsize=16)
+def _compile(
+    exact: Tuple[str, ...],
+    regex: Tuple[PathRule, ...],
+    glob: Tuple[PathRule, ...],
+    prefix: Tuple[PathRule, ...],
+) -> PathMatcher:
+    return PathMatcher(exact, regex, glob, prefix)
+
+
+def compile_path_rules(
+    exact: Iterable[str],
+    regex: Iterable[PathRule] = (),
+    glob: Iterable[PathRule] = (),
+    prefix: Iterable[PathRule] = (),
+) -> PathMatcher:
+    """Returns the (cached) matcher for a set of include rules.
+
+    Raises ``ValueError`` for an invalid regex or a rewrite that refers to
+    a group the regex does not define.
+    """
+    return _compile(tuple(exact), tuple(regex), tuple(glob), tuple(prefix))
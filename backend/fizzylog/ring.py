@@ -0,0 +1,156 @@
+from __future__ import annotations
+
+import threading
+from typing import Callable, Dict, List, Optional, Tuple
+
+from .models import StatusFilter
+
+
+class HotRing:
+    """In-memory counters for the most recent buckets, shared with the API.
+
+    Each slot holds one bucket as ``status -> {path: count}``, so a slot
+    only holds the paths seen in its bucket and forgets them when it is
+    reused. The ingester adds every batch as it aggregates, so buckets
+    show up before they are flushed. Buckets older than ``valid_from``
+    (those that may have been partly ingested before this process started)
+    are never answered from the ring.
+    """
+
+    def __init__(self, bucket_seconds: int, slots: int) -> None:
+        self.bucket_seconds = bucket_seconds
+        self.slots = max(1, slots)
+        self._buckets: List[Optional[int]] = [None] * self.slots
+        self._counts: List[Dict[int, Dict[str, int]]] = [{} for _ in range(self.slots)]
+        self._newest: Optional[int] = None
+        self._lock = threading.Lock()
+        self.valid_from: Optional[int] = None
+        # Bumped by every add that changed a count, so responses built from
+        # the ring can tell when they are stale.
+        self.version = 0
+
+    def reset(self, valid_from: int) -> None:
+        with self._lock:
+            self._buckets = [None] * self.slots
+            self._counts = [{} for _ in range(self.slots)]
+            self._newest = None
+            self.valid_from = valid_from
+
+    def add(self, counts: Dict[Tuple[int, str, int], int]) -> None:
+        with self._lock:
+            valid_from = self.valid_from
+            if valid_from is None:
+                return
+            newest = self._newest
+            changed = False
+            for (bucket, path, status), count in counts.items():
+                if bucket < valid_from:
+                    continue
+                if newest is not None and bucket <= newest - self.slots * self.bucket_seconds:
+                    continue
+                if newest is None or bucket > newest:
+                    newest = bucket
+                slot = (bucket // self.bucket_seconds) % self.slots
+                if self._buckets[slot] != bucket:
+                    self._buckets[slot] = bucket
+                    self._counts[slot] = {}
+                per_path = self._counts[slot].get(status)
+                if per_path is None:
+                    per_path = self._counts[slot][status] = {}
+                per_path[path] = per_path.get(path, 0) + count
+                changed = True
+            self._newest = newest
+            if changed:
+                self.version += 1
+
+    def first_bucket(self, end_bucket: int) -> Optional[int]:
+        """Returns the oldest bucket the ring can answer for a window ending at ``end_bucket``."""
+        with self._lock:
+            if self.valid_from is None:
+                return None
+            newest = end_bucket if self._newest is None else max(end_bucket, self._newest)
+            return max(self.valid_from, newest - (self.slots - 1) * self.bucket_seconds)
+
+    def query(
+        self,
+        paths: Optional[List[str]],
+        status_filter: StatusFilter,
+        start_bucket_utc: int,
+        end_bucket_utc: int,
+    ) -> List[Tuple[int, str, int]]:
+        """Returns ``(bucket, path, count)`` rows like ``db.query_rollups``;
+        ``paths=None`` returns every path."""
+        rows = self._collect(
+            paths,
+            lambda status: 0 if status_filter.matches(status) else None,
+            start_bucket_utc,
+            end_bucket_utc,
+        )
+        return [(bucket, path, count) for bucket, path, _, count in rows]
+
+    def query_classes(
+        self,
+        paths: Optional[List[str]],
+        start_bucket_utc: int,
+        end_bucket_utc: int,
+    ) -> List[Tuple[int, str, int, int]]:
+        """Returns ``(bucket, path, status_class, count)`` rows like ``db.query_classes``."""
+        return self._collect(paths, lambda status: status // 100, start_bucket_utc, end_bucket_utc)
+
+    def _collect(
+        self,
+        paths: Optional[List[str]],
+        group: Callable[[int], Optional[int]],
+        start_bucket_utc: int,
+        end_bucket_utc: int,
+    ) -> List[Tuple[int, str, int, int]]:
+        """Sums counts into ``(bucket, path, group(status), count)`` rows,
+        skipping statuses ``group`` maps to ``None``."""
+        rows: List[Tuple[int, str, int, int]] = []
+        with self._lock:
+            if self._newest is not None:
+                oldest = self._newest - (self.slots - 1) * self.bucket_seconds
+                start_bucket_utc = max(start_bucket_utc, oldest)
+            for bucket in range(start_bucket_utc, end_bucket_utc + 1, self.bucket_seconds):
+                slot = (bucket // self.bucket_seconds) % self.slots
+                if self._buckets[slot] != bucket:
+                    continue
+                groups: Dict[int, Dict[str, int]] = {}
+                for status, per_path in self._counts[slot].items():
+                    key = group(status)
+                    if key is None:
+                        continue
+                    totals = groups.setdefault(key, {})
+                    if paths is None:
+                        counts = per_path.items()
+                    else:
+                        counts = [(path, per_path[path]) for path in paths if path in per_path]
+                    for path, count in counts:
+                        totals[path] = totals.get(path, 0) + count
+                for key, totals in sorted(groups.items()):
+                    ordered = sorted(totals) if paths is None else [path for path in paths if path in totals]
+                    rows.extend((bucket, path, key, totals[path]) for path in ordered if totals[path])
+        return rows
+
+    def snapshot(self, buckets: List[int]) -> Dict[str, Dict[int, List[int]]]:
+        """Returns ``path -> status -> [count per bucket]`` for ``buckets``.
+
+        Only non-zero series are included; buckets the ring does not hold
+        count as zero.
+        """
+        result: Dict[str, Dict[int, List[int]]] = {}
+        with self._lock:
+            for position, bucket in enumerate(buckets):
+                slot = (bucket // self.bucket_seconds) % self.slots
+                if self._buckets[slot] != bucket:
+                    continue
+                for status, per_path in self._counts[slot].items():
+                    for path, count in per_path.items():
+                        if not count:
+                            continue
+                        by_status = result.setdefault(path, {})
+                        counts = by_status.get(status)
+                        if counts is None:
+                            counts = by_status[status] = [0] * len(buckets)
+                        counts[position] = count
+        return result
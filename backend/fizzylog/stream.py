@@ -0,0 +1,89 @@
+from __future__ import annotations
+
+import asyncio
+import json
+from collections import deque
+from typing import AsyncIterator, Deque, Dict, Optional, Set
+
+
+KEEPALIVE_SECONDS = 15.0
+# Frames queued for a subscriber whose previous send has not finished.
+MAX_QUEUED_FRAMES = 8
+
+
+def format_event(event: str, payload: Dict[str, object]) -> bytes:
+    data = json.dumps(payload, separators=(",", ":"))
+    return f"event: {event}\ndata: {data}\n\n".encode("utf-8")
+
+
+class _Subscriber:
+    def __init__(self) -> None:
+        self.frames: Deque[bytes] = deque()
+        self.ready = asyncio.Event()
+
+
+class Broadcaster:
+    """Fans one pre-serialized server-sent event out to every subscriber.
+
+    ``publish`` may be called from any thread (the ingester calls it after
+    each flush); delivery happens on the event loop bound with ``attach``.
+    Every subscriber is handed the same bytes, so the work per flush does
+    not depend on the number of viewers.
+
+    Each subscriber queues up to ``max_queued`` frames while its previous
+    frame is still being sent. A subscriber that falls further behind has
+    its queue replaced by ``resync_frame``, which tells the client to
+    refetch instead of applying a partial run of updates (without one,
+    the oldest frame is dropped).
+    """
+
+    def __init__(self, resync_frame: Optional[bytes] = None, max_queued: int = MAX_QUEUED_FRAMES) -> None:
+        self._loop: Optional[asyncio.AbstractEventLoop] = None
+        self._subscribers: Set[_Subscriber] = set()
+        self.resync_frame = resync_frame
+        self.max_queued = max_queued
+
+    @property
+    def subscribers(self) -> int:
+        return len(self._subscribers)
+
+    def attach(self, loop: asyncio.AbstractEventLoop) -> None:
+        self._loop = loop
+
+    def publish(self, frame: bytes) -> None:
+        loop = self._loop
+        if loop is None or loop.is_closed():
+            return
+        loop.call_soon_threadsafe(self._deliver, frame)
+
+    def _deliver(self, frame: bytes) -> None:
+        for subscriber in self._subscribers:
+            frames = subscriber.frames
+            queued = frame
+            if len(frames) >= self.max_queued:
+                if self.resync_frame is None:
+                    frames.popleft()
+                else:
+                    # Too far behind to apply the updates one by one.
+                    frames.clear()
+                    queued = self.resync_frame
+            frames.append(queued)
+            subscriber.ready.set()
+
+    async def subscribe(self) -> AsyncIterator[bytes]:
+        subscriber = _Subscriber()
+        self._subscribers.add(subscriber)
+        try:
+            yield b"retry: 3000\n\n"
+            while True:
+                if not subscriber.frames:
+                    subscriber.ready.clear()
+                    try:
+                        await asyncio.wait_for(subscriber.ready.wait(), KEEPALIVE_SECONDS)
+                    except asyncio.TimeoutError:
+                        yield b": keepalive\n\n"
+                        continue
+                while subscriber.frames:
+                    yield subscriber.frames.popleft()
+        finally:
+            self._subscribers.discard(subscriber)
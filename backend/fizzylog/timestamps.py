@@ -0,0 +1,73 @@
+from __future__ import annotations
+
+from datetime import datetime, timezone
+from typing import Dict, Optional, Tuple
+
+
+NGINX_TIME_FORMAT = "%d/%b/%Y:%H:%M:%S %z"
+
+# "10/Oct/2000:13:55:36 -0700": the hour prefix ends at 14, minutes and
+# seconds sit at fixed offsets and the zone offset starts at 20.
+_NGINX_TIME_LENGTH = 26
+_TWO_DIGITS = {f"{value:02d}": value for value in range(60)}
+_CACHE_LIMIT = 64
+
+
+def parse_nginx_time_slow(text: str) -> Optional[int]:
+    try:
+        dt = datetime.strptime(text, NGINX_TIME_FORMAT).astimezone(timezone.utc)
+    except (ValueError, OverflowError):
+        return None
+    return int(dt.timestamp())
+
+
+class TimestampDecoder:
+    """Decodes nginx ``$time_local`` values into UTC epoch seconds.
+
+    The epoch of each ``date:hour offset`` prefix is computed once with
+    strptime and cached; minutes and seconds are added with integer
+    arithmetic. Anything that does not have the canonical fixed layout is
+    handed to strptime unchanged, so results always match it exactly.
+    """
+
+    def __init__(self) -> None:
+        self._hours: Dict[str, int] = {}
+        self._last: Tuple[str, Optional[int]] = ("", None)
+
+    def decode(self, text: str) -> Optional[int]:
+        last_text, last_epoch = self._last
+        if text == last_text:
+            return last_epoch
+
+        if (
+            len(text) != _NGINX_TIME_LENGTH
+            or text[14] != ":"
+            or text[17] != ":"
+            or text[20] != " "
+        ):
+            return parse_nginx_time_slow(text)
+        minutes = _TWO_DIGITS.get(text[15:17])
+        seconds = _TWO_DIGITS.get(text[18:20])
+        if minutes is None or seconds is None:
+            return parse_nginx_time_slow(text)
+
+        key = text[:14] + text[20:]
+        hour_epoch = self._hours.get(key)
+        if hour_epoch is None:
+            hour_epoch = parse_nginx_time_slow(f"{text[:14]}:00:00{text[20:]}")
+            if hour_epoch is None:
+                return parse_nginx_time_slow(text)
+            if len(self._hours) >= _CACHE_LIMIT:
+                self._hours.clear()
+            self._hours[key] = hour_epoch
+
+        epoch = hour_epoch + minutes * 60 + seconds
+        self._last = (text, epoch)
+        return epoch
+
+
+_default_decoder = TimestampDecoder()
+
+
+def parse_nginx_time(text: str) -> Optional[int]:
+    return _default_decoder.decode(text)
@@ -0,0 +1,106 @@
+from __future__ import annotations
+
+import ctypes
+import ctypes.util
+import errno
+import os
+import select
+import sys
+import time
+from typing import Optional
+
+
+IN_MODIFY = 0x00000002
+IN_ATTRIB = 0x00000004
+IN_DELETE_SELF = 0x00000400
+IN_MOVE_SELF = 0x00000800
+IN_NONBLOCK = 0o4000
+IN_CLOEXEC = 0o2000000
+
+# IN_ATTRIB covers the link count dropping to zero while we still hold the
+# file open, which never produces IN_DELETE_SELF.
+WATCH_MASK = IN_MODIFY | IN_ATTRIB | IN_MOVE_SELF | IN_DELETE_SELF
+
+POLL_INTERVAL_SECONDS = 0.2
+
+
+class PollWatcher:
+    """Sleep-based fallback: wakes every ``interval`` seconds."""
+
+    def __init__(self, interval: float = POLL_INTERVAL_SECONDS) -> None:
+        self.interval = interval
+
+    def watch(self, path: str) -> None:
+        pass
+
+    def wait(self, timeout: float) -> None:
+        time.sleep(max(0.0, min(timeout, self.interval)))
+
+    def close(self) -> None:
+        pass
+
+
+class InotifyWatcher:
+    """Blocks until the watched file is modified, moved or deleted.
+
+    Uses the libc inotify calls through ctypes, so there is no native
+    dependency. Only one file is watched at a time; ``watch`` replaces the
+    previous watch after a reopen.
+    """
+
+    def __init__(self) -> None:
+        libc_name = ctypes.util.find_library("c") or "libc.so.6"
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self._libc.inotify_init1.argtypes = [ctypes.c_int]
+        self._libc.inotify_add_watch.argtypes = [ctypes.c_int, ctypes.c_char_p, ctypes.c_uint32]
+        self._libc.inotify_rm_watch.argtypes = [ctypes.c_int, ctypes.c_int]
+        fd = self._libc.inotify_init1(IN_NONBLOCK | IN_CLOEXEC)
+        if fd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err))
+        self._fd = fd
+        self._wd: Optional[int] = None
+
+    def watch(self, path: str) -> None:
+        if self._wd is not None:
+            self._libc.inotify_rm_watch(self._fd, self._wd)
+            self._wd = None
+        wd = self._libc.inotify_add_watch(self._fd, os.fsencode(path), WATCH_MASK)
+        if wd < 0:
+            err = ctypes.get_errno()
+            raise OSError(err, os.strerror(err), path)
+        self._wd = wd
+        self._drain()
+
+    def wait(self, timeout: float) -> None:
+        ready, _, _ = select.select([self._fd], [], [], max(0.0, timeout))
+        if ready:
+            self._drain()
+
+    def _drain(self) -> None:
+        while True:
+            try:
+                if not os.read(self._fd, 4096):
+                    return
+            except OSError as exc:
+                if exc.errno in (errno.EAGAIN, errno.EWOULDBLOCK):
+                    return
+                raise
+
+    def close(self) -> None:
+        if self._fd >= 0:
+            os.close(self._fd)
+            self._fd = -1
+
+
+def create_watcher(mode: str):
+    if mode == "poll":
+        return PollWatcher()
+    if mode == "inotify":
+        return InotifyWatcher()
+    if sys.platform.startswith("linux"):
+        try:
+            return InotifyWatcher()
+        except (OSError, AttributeError):
+            pass
+    return PollWatcher()
@@ -0,0 +1,289 @@
+import asyncio
+import json
+import tempfile
+import time
+
+import pytest
+from fastapi import HTTPException
+
+from fizzylog import api, db
+from fizzylog.discovery import DiscoveryRing
+from fizzylog.hll import apply, client_register
+from fizzylog.api import create_app
+from fizzylog.config import TierConfig
+from fizzylog.ingest import IngestState
+from fizzylog.latency import bin_value, latency_bin
+from fizzylog.pathrules import PathRule
+from fizzylog.ring import HotRing
+from test_paths import make_config
+
+
+def get_endpoint(app, path):
+    for route in app.routes:
+        if getattr(route, "path", None) == path:
+            return route.endpoint
+    raise KeyError(path)
+
+
+def call_series(app, **params):
+    params.setdefault("status_ranges", None)
+    params.setdefault("status_exact", None)
+    params.setdefault("since_bucket", None)
+    params.setdefault("latency", False)
+    params.setdefault("clients", False)
+    params.setdefault("start", None)
+    params.setdefault("end", None)
+    params.setdefault("by_class", False)
+    params.setdefault("if_none_match", None)
+    return get_endpoint(app, "/api/v1/series")(**params)
+
+
+def test_series_etag_and_delta(monkeypatch):
+    # Pinned mid-bucket, so the window cannot move between requests.
+    monkeypatch.setattr(api.time, "time", lambda: 1728568536.0)
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        end_bucket = 1728568500
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(conn, {(end_bucket - 60, "/", 200): 3})
+        finally:
+            conn.close()
+        config = make_config(include_exact=["/"])
+        state = IngestState()
+        app = create_app(config, state, tmp.name)
+
+        full = call_series(app)
+        payload = json.loads(full.body)
+        assert len(payload["bucket_start_utc"]) == config.ui.max_points
+        assert payload["window_start_utc"] == payload["bucket_start_utc"][0]
+
+        assert "db;dur=" in full.headers["server-timing"]
+
+        metrics = get_endpoint(app, "/api/v1/metrics")().body.decode()
+        assert "fizzylog_series_seconds_count 1" in metrics
+
+        etag = full.headers["etag"]
+        assert call_series(app, if_none_match=etag).status_code == 304
+
+        delta = json.loads(call_series(app, since_bucket=end_bucket - 60).body)
+        assert delta["bucket_start_utc"] == [end_bucket - 60, end_bucket]
+        assert delta["series"] == [{"path": "/", "counts": [3, 0]}]
+
+
+def test_series_lists_busiest_dynamic_paths():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        end_bucket = (int(time.time()) // 60) * 60
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(
+                conn,
+                {
+                    (end_bucket - 120, "/api/users", 200): 5,
+                    (end_bucket - 60, "/api/orders", 200): 2,
+                    (end_bucket - 60, "/api/health", 200): 1,
+                },
+            )
+        finally:
+            conn.close()
+        config = make_config(include_exact=["/"])
+        config.paths.include_prefix = [PathRule("/api/")]
+        config.paths.max_dynamic_paths = 2
+        app = create_app(config, IngestState(), tmp.name)
+
+        payload = json.loads(call_series(app).body)
+        assert [item["path"] for item in payload["series"]] == ["/", "/api/orders", "/api/users"]
+        assert sum(payload["series"][2]["counts"]) == 5
+
+        # A delta keeps the paths ranked over the whole window.
+        delta = json.loads(call_series(app, since_bucket=end_bucket - 60).body)
+        assert [item["path"] for item in delta["series"]] == ["/", "/api/orders", "/api/users"]
+
+
+def test_discovery_endpoint_reports_top_rejected_paths():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        config = make_config(include_exact=["/"])
+        disabled = create_app(config, IngestState(), tmp.name)
+        with pytest.raises(HTTPException) as excinfo:
+            get_endpoint(disabled, "/api/v1/discovery")(limit=5)
+        assert excinfo.value.status_code == 404
+
+        end_bucket = (int(time.time()) // 60) * 60
+        state = IngestState(discovery=DiscoveryRing(60, 10, capacity=8))
+        state.discovery.add({(end_bucket, "/admin"): 3, (end_bucket - 60, "/.env"): 5})
+        app = create_app(config, state, tmp.name)
+
+        payload = get_endpoint(app, "/api/v1/discovery")(limit=1)
+        assert payload["paths"] == [{"path": "/.env", "count": 5, "error": 0}]
+
+
+def test_series_latency_quantiles():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        end_bucket = (int(time.time()) // 60) * 60
+        fast, slow = latency_bin("0.010"), latency_bin("1.000")
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(
+                conn,
+                {(end_bucket - 60, "/", 200): 100},
+                latency={(end_bucket - 60, "/", 200, fast): 98, (end_bucket - 60, "/", 200, slow): 2},
+            )
+        finally:
+            conn.close()
+        config = make_config(include_exact=["/"])
+        app = create_app(config, IngestState(), tmp.name)
+        with pytest.raises(HTTPException):
+            call_series(app, latency=True)
+
+        config.log.latency_variable = "request_time"
+        app = create_app(config, IngestState(), tmp.name)
+        payload = json.loads(call_series(app, latency=True).body)
+        series = payload["series"][0]
+        position = payload["bucket_start_utc"].index(end_bucket - 60)
+        assert series["latency"]["p50"][position] == bin_value(fast)
+        assert series["latency"]["p99"][position] == bin_value(slow)
+        assert series["latency"]["window"] == {"p50": bin_value(fast), "p95": bin_value(fast), "p99": bin_value(slow)}
+
+
+def test_series_distinct_clients():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        end_bucket = (int(time.time()) // 60) * 60
+        sketches = {}
+        for bucket, clients in ((end_bucket - 120, ["a", "b", "c"]), (end_bucket - 60, ["c", "d"])):
+            registers = bytearray(1024)
+            for client in clients:
+                index, rank = client_register(client)
+                apply(registers, {index: rank})
+            sketches[(bucket, "/")] = bytes(registers)
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(conn, {(end_bucket - 60, "/", 200): 2}, clients=sketches)
+        finally:
+            conn.close()
+        config = make_config(include_exact=["/"])
+        app = create_app(config, IngestState(), tmp.name)
+        with pytest.raises(HTTPException):
+            call_series(app, clients=True)
+
+        config.clients.enabled = True
+        app = create_app(config, IngestState(), tmp.name)
+        payload = json.loads(call_series(app, clients=True).body)
+        clients = payload["series"][0]["clients"]
+        position = payload["bucket_start_utc"].index(end_bucket - 60)
+        assert clients["counts"][position - 1 : position + 1] == [3, 2]
+        assert clients["window"] == 4
+
+
+def test_series_range_is_rebucketed_within_max_points():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600, 3600])
+        hour = (int(time.time()) // 3600) * 3600 - 3 * 3600
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(
+                conn,
+                {(hour - 60, "/", 200): 1, (hour, "/", 200): 2, (hour + 1800, "/", 200): 3},
+                tiers=[600, 3600],
+            )
+        finally:
+            conn.close()
+        config = make_config(include_exact=["/"])
+        config.ui.max_points = 4
+        app = create_app(config, IngestState(), tmp.name)
+
+        payload = json.loads(call_series(app, start=hour - 3600, end=hour + 3599).body)
+        assert payload["bucket_seconds"] == 1800
+        assert payload["bucket_start_utc"] == [hour - 3600 + 1800 * i for i in range(4)]
+        assert payload["series"][0]["counts"] == [0, 1, 2, 3]
+
+        with pytest.raises(HTTPException):
+            call_series(app, start=hour, end=hour - 1)
+        with pytest.raises(HTTPException):
+            call_series(app, start=hour, since_bucket=hour)
+
+
+def test_series_by_class_breakdown():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        end_bucket = (int(time.time()) // 60) * 60
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(
+                conn,
+                {(end_bucket - 60, "/", 200): 3, (end_bucket - 60, "/", 304): 2, (end_bucket - 60, "/", 503): 1},
+            )
+        finally:
+            conn.close()
+        app = create_app(make_config(include_exact=["/"]), IngestState(), tmp.name)
+        plain = json.loads(call_series(app, status_ranges="2xx,3xx").body)["series"][0]
+
+        payload = json.loads(call_series(app, status_ranges="2xx,3xx", by_class=True).body)
+        series = payload["series"][0]
+        position = payload["bucket_start_utc"].index(end_bucket - 60)
+        assert series["counts"] == plain["counts"]
+        assert series["counts"][position] == 5
+        assert {name: counts[position] for name, counts in series["classes"].items()} == {
+            "2xx": 3,
+            "3xx": 2,
+            "4xx": 0,
+            "5xx": 1,
+        }
+
+        exact = json.loads(call_series(app, status_exact="503", by_class=True).body)["series"][0]
+        assert exact["counts"][position] == 1
+        assert exact["classes"]["2xx"][position] == 3
+
+
+def test_stream_asks_for_refetch_when_window_uses_a_tier(monkeypatch):
+    monkeypatch.setattr(api.time, "time", lambda: 1728568536.0)
+    now_bucket = 1728568500
+
+    async def first_event(config):
+        state = IngestState(hot=HotRing(60, 10))
+        state.hot.reset(valid_from=0)
+        state.hot.add({(now_bucket, "/", 200): 2})
+        with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+            db.init_db(tmp.name)
+            app = create_app(config, state, tmp.name)
+            stream = (await get_endpoint(app, "/api/v1/stream")()).body_iterator
+            await stream.__anext__()
+            state.flush_listeners[0](1, [now_bucket])
+            frame = await stream.__anext__()
+            await stream.aclose()
+        return json.loads(frame.decode().split("data: ", 1)[1])
+
+    config = make_config(include_exact=["/"])
+    config.storage.tiers = [TierConfig(bucket_seconds=600, retention_seconds=604800)]
+    live = asyncio.run(first_event(config))
+    assert live["bucket_seconds"] == 60 and not live["resync"]
+    assert live["counts"] == {"/": {"200": [2]}}
+
+    # A week at 360 points is served from the 10-minute tier.
+    config.window.lookback_seconds = 7 * 86400
+    tiered = asyncio.run(first_event(config))
+    assert tiered["resync"]
+    assert tiered["bucket_seconds"] == 600
+    assert tiered["end_bucket_utc"] == (now_bucket // 600) * 600
+
+
+def test_series_cache_follows_ring_updates_between_flushes(monkeypatch):
+    monkeypatch.setattr(api.time, "time", lambda: 1728568536.0)
+    now_bucket = 1728568500
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        state = IngestState(hot=HotRing(60, 10))
+        state.hot.reset(valid_from=0)
+        state.hot.add({(now_bucket, "/", 200): 1})
+        app = create_app(make_config(include_exact=["/"]), state, tmp.name)
+
+        first = call_series(app)
+        # A failing flush leaves flush_generation alone while the ring moves on.
+        state.hot.add({(now_bucket, "/", 200): 2})
+        assert call_series(app, if_none_match=first.headers["etag"]).status_code == 200
+        payload = json.loads(call_series(app).body)
+
+    assert payload["series"][0]["counts"][-1] == 3
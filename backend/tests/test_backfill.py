@@ -0,0 +1,112 @@
+import gzip
+import os
+import tempfile
+import time
+
+from fizzylog import backfill, db
+from fizzylog.models import StatusFilter
+from test_paths import make_config
+
+
+def log_line(epoch, path, status=200):
+    ts = time.strftime("%d/%b/%Y:%H:%M:%S +0000", time.gmtime(epoch))
+    return f'198.51.100.4 - - [{ts}] "GET {path} HTTP/1.1" {status} 10 "-" "test"\n'
+
+
+def test_backfill_reads_rotated_and_live_logs(monkeypatch):
+    monkeypatch.setattr(backfill, "BACKFILL_CHUNK_BYTES", 300)
+    now = int(time.time())
+    base = now - 3600
+    with tempfile.TemporaryDirectory() as tmpdir:
+        live = os.path.join(tmpdir, "access.log")
+        with gzip.open(live + ".2.gz", "wt") as handle:
+            handle.writelines(log_line(base, "/") for _ in range(4))
+        with open(live + ".1", "w") as handle:
+            handle.writelines(log_line(base + 60, "/") for _ in range(10))
+        with open(live, "w") as handle:
+            handle.writelines(log_line(base + 120, "/terms.html") for _ in range(3))
+            handle.write(log_line(base + 120, "/terms.html")[:25])
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+
+        config = make_config(include_exact=["/", "/terms.html"])
+        config.log.path = live
+        result = backfill.run_backfill(config, sqlite_path, workers=2)
+
+        assert result.files == 3
+        assert result.lines == 17
+        complete = os.path.getsize(live) - 25
+        assert result.offsets == {live: (os.stat(live).st_ino, complete)}
+
+        second = backfill.run_backfill(config, sqlite_path, workers=1)
+        assert second.rows == 0
+
+        conn = db.get_connection(sqlite_path)
+        try:
+            rows = db.query_rollups(
+                conn,
+                ["/", "/terms.html"],
+                StatusFilter(mode="ranges", ranges=["2xx"], exact=[]),
+                0,
+                now,
+            )
+        finally:
+            conn.close()
+
+    bucket = (base // 60) * 60
+    assert rows == [
+        (bucket, "/", 4),
+        (bucket + 60, "/", 10),
+        (bucket + 120, "/terms.html", 3),
+    ]
+
+
+def test_backfill_skips_only_buckets_covered_for_the_same_log():
+    now = int(time.time())
+    bucket = ((now - 3600) // 60) * 60
+    with tempfile.TemporaryDirectory() as tmpdir:
+        first = os.path.join(tmpdir, "a.log")
+        second = os.path.join(tmpdir, "b.log")
+        # a.log was ingested live at bucket and bucket + 120, with the
+        # ingester down in between.
+        with open(first + ".1", "w") as handle:
+            handle.writelines(log_line(bucket + offset, "/") for offset in (0, 60, 120))
+        with open(second + ".1", "w") as handle:
+            handle.writelines(log_line(bucket + offset, "/terms.html") for offset in (0, 60, 120))
+        for path in (first, second):
+            open(path, "w").close()
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+        db.init_db(sqlite_path)
+        conn = db.get_connection(sqlite_path)
+        try:
+            db.write_rollups(
+                conn,
+                {(bucket, "/", 200): 1, (bucket + 120, "/", 200): 1},
+                {first: (os.stat(first).st_ino, 0), second: (os.stat(second).st_ino, 0)},
+                coverage={first: (bucket + 120, bucket + 120)},
+            )
+            db.write_rollups(conn, {}, coverage={first: (bucket, bucket)})
+        finally:
+            conn.close()
+
+        config = make_config(include_exact=["/", "/terms.html"])
+        config.log.paths = [first, second]
+        backfill.run_backfill(config, sqlite_path, workers=1)
+        # Loaded buckets are covered now, so a second run adds nothing.
+        assert backfill.run_backfill(config, sqlite_path, workers=1).rows == 0
+
+        conn = db.get_connection(sqlite_path)
+        try:
+            rows = db.query_rollups(
+                conn, ["/", "/terms.html"], StatusFilter(mode="ranges", ranges=["2xx"], exact=[]), 0, now
+            )
+        finally:
+            conn.close()
+
+    assert rows == [
+        (bucket, "/", 1),
+        (bucket, "/terms.html", 1),
+        (bucket + 60, "/", 1),
+        (bucket + 60, "/terms.html", 1),
+        (bucket + 120, "/", 1),
+        (bucket + 120, "/terms.html", 1),
+    ]
@@ -0,0 +1,91 @@
+import dataclasses
+import os
+import tempfile
+
+import pytest
+
+from fizzylog.config import expand_log_paths, load_config
+from fizzylog.pathrules import PathRule
+
+
+BASE_CONFIG = """
+paths:
+  include_exact: [/]
+"""
+
+
+def write_config(tmpdir, body):
+    path = os.path.join(tmpdir, "config.yml")
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write(body + BASE_CONFIG)
+    return path
+
+
+def test_log_paths_accepts_glob_string():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        for name in ("a.access.log", "b.access.log", "a.access.log.1", "a.access.log.2.gz", "c.access.log.1"):
+            open(os.path.join(tmpdir, name), "w").close()
+        config = load_config(write_config(tmpdir, f"log:\n  paths: {tmpdir}/*.access.log*\n"))
+
+        assert config.log.path == ""
+        assert expand_log_paths(config.log) == [
+            os.path.join(tmpdir, "a.access.log"),
+            os.path.join(tmpdir, "b.access.log"),
+            os.path.join(tmpdir, "c.access.log.1"),
+        ]
+        # While b.access.log is being rotated, its rotation is still skipped.
+        os.rename(os.path.join(tmpdir, "b.access.log"), os.path.join(tmpdir, "b.access.log.1"))
+        tailed = [os.path.join(tmpdir, "b.access.log")]
+        assert os.path.join(tmpdir, "b.access.log.1") not in expand_log_paths(config.log, tailed)
+
+
+def test_log_path_and_paths_are_combined():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = load_config(
+            write_config(tmpdir, "log:\n  path: /logs/main.log\n  paths: [/logs/main.log, /logs/other.log]\n")
+        )
+
+        assert expand_log_paths(config.log) == ["/logs/main.log", "/logs/other.log"]
+
+
+def write_paths_config(tmpdir, paths_body):
+    path = os.path.join(tmpdir, "config.yml")
+    with open(path, "w", encoding="utf-8") as handle:
+        handle.write("log:\n  path: /logs/access.log\npaths:\n" + paths_body)
+    return path
+
+
+def test_path_rules_replace_include_exact():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        config = load_config(
+            write_paths_config(
+                tmpdir,
+                "  include_prefix: [/api/]\n"
+                "  include_regex:\n"
+                "    - match: ^/product/(?P<id>\\d+)$\n"
+                "      rewrite: /product/:id\n",
+            )
+        )
+
+        assert config.paths.include_exact == []
+        assert config.paths.include_prefix == [PathRule("/api/")]
+        assert config.paths.include_regex == [PathRule(r"^/product/(?P<id>\d+)$", "/product/:id")]
+
+
+def test_invalid_path_regex_is_rejected():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = write_paths_config(tmpdir, "  include_regex: ['^/(unclosed']\n")
+        with pytest.raises(ValueError, match="paths: invalid regex"):
+            load_config(path)
+
+
+def test_default_tiers_are_not_shared_mutable_state():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        first = load_config(write_config(tmpdir, "log:\n  path: /logs/access.log\n"))
+        second = load_config(write_config(tmpdir, "log:\n  path: /logs/access.log\n"))
+
+    assert [tier.bucket_seconds for tier in first.storage.tiers] == [600, 3600]
+    first.storage.tiers.pop()
+    assert len(second.storage.tiers) == 2
+    with pytest.raises(dataclasses.FrozenInstanceError):
+        second.storage.tiers[0].retention_seconds = 60
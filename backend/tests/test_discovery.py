@@ -0,0 +1,55 @@
+from fizzylog.discovery import DiscoveryRing, SpaceSaving
+from fizzylog.ingest import PathNormalizer, aggregate_lines
+from test_paths import make_config
+
+
+def test_space_saving_is_exact_below_capacity():
+    sketch = SpaceSaving(4)
+    for path, count in (("/a", 3), ("/b", 1), ("/a", 2)):
+        sketch.add(path, count)
+
+    assert sketch.counts == {"/a": 5, "/b": 1}
+    assert sketch.errors == {"/a": 0, "/b": 0}
+    assert sketch.floor() == 0
+
+
+def test_space_saving_keeps_heavy_hitters_in_bounded_memory():
+    sketch = SpaceSaving(10)
+    for index in range(5000):
+        sketch.add(f"/scan/{index}")
+        if index % 5 == 0:
+            sketch.add("/wp-login.php")
+
+    assert len(sketch.counts) == 10
+    assert len(sketch._heap) <= 40
+    count = sketch.counts["/wp-login.php"]
+    assert count - sketch.errors["/wp-login.php"] <= 1000 <= count
+
+
+def test_discovery_ring_merges_buckets_and_drops_old_ones():
+    ring = DiscoveryRing(60, 3, capacity=2)
+    ring.add({(0, "/a"): 4, (60, "/a"): 1, (60, "/b"): 2})
+    ring.add({(120, "/b"): 1, (120, "/c"): 1})
+
+    top = ring.top(2, 60, 120)
+    assert top[0] == {"path": "/b", "count": 3, "error": 0}
+    # /a is absent from the full bucket 120, so that bucket's floor bounds what it may have lost.
+    assert top[1] == {"path": "/a", "count": 2, "error": 1}
+
+    ring.add({(180, "/e"): 1})
+    assert [item["path"] for item in ring.top(10, 0, 60)] == ["/b", "/a"]
+
+
+def test_aggregate_lines_records_rejected_paths():
+    config = make_config(include_exact=["/"], ignore_static_assets=True, ignore_extensions=[".css"])
+    lines = [
+        '1.2.3.4 - - [10/Oct/2024:13:55:36 +0000] "GET /?a=1 HTTP/1.1" 200 1 "-" "-"',
+        '1.2.3.4 - - [10/Oct/2024:13:55:37 +0000] "GET /admin?x=1 HTTP/1.1" 404 1 "-" "-"',
+        '1.2.3.4 - - [10/Oct/2024:13:55:38 +0000] "GET /admin HTTP/1.1" 404 1 "-" "-"',
+        '1.2.3.4 - - [10/Oct/2024:13:55:39 +0000] "GET /site.css HTTP/1.1" 200 1 "-" "-"',
+    ]
+    rejected = {}
+    ingested, errors, _ = aggregate_lines(lines, config, {}, PathNormalizer(config), rejected)
+
+    assert (ingested, errors) == (1, 0)
+    assert rejected == {(1728568500, "/admin"): 2}
@@ -0,0 +1,82 @@
+import pytest
+
+from fizzylog.formats import compile_log_format
+from fizzylog.latency import latency_bin
+
+
+COMBINED = '203.0.113.7 - - [10/Oct/2024:13:55:36 +0000] "GET /terms.html?x=1 HTTP/1.1" 404 512 "-" "curl/8.0"'
+
+
+def test_combined_preset_extracts_time_path_status():
+    parser = compile_log_format("nginx_combined")
+    assert parser.parse(COMBINED) == (1728568536, "/terms.html?x=1", 404)
+    assert parser.parse('203.0.113.7 - - [10/Oct/2024:13:55:36 +0000] "-" 400 0 "-" "-"') is None
+    assert parser.parse("garbage") is None
+
+
+def test_custom_text_format_stops_after_needed_fields():
+    parser = compile_log_format('$remote_addr [$time_iso8601] $status "$request_uri" $request_time "$http_user_agent"')
+    assert parser.pattern.pattern.endswith('"([^"]*)')
+    line = '198.51.100.4 [2024-10-10T15:55:36+02:00] 200 "/pricing" 0.004 "Mozilla/5.0"'
+    assert parser.parse(line) == (1728568536, "/pricing", 200)
+
+
+def test_json_format_reads_only_its_keys():
+    parser = compile_log_format('{"ts":"$msec","req":"$request","code":$status,"ua":"$http_user_agent"}')
+    line = '{"ts":"1728568536.120","req":"GET /a\\"b HTTP/1.1","code":301,"ua":"x"}'
+    assert parser.parse(line) == (1728568536, '/a"b', 301)
+    assert parser.parse("{not json") is None
+    assert compile_log_format("json").parse(
+        '{"time_local":"10/Oct/2024:13:55:36 +0000","request":"GET / HTTP/1.1","status":"200"}'
+    ) == (1728568536, "/", 200)
+
+
+def test_format_without_status_is_rejected():
+    with pytest.raises(ValueError, match="status"):
+        compile_log_format('$remote_addr [$time_local] "$request"')
+
+
+def test_latency_variable_adds_histogram_bin():
+    parser = compile_log_format(
+        '$remote_addr [$time_local] "$request" $status $upstream_response_time', "upstream_response_time"
+    )
+
+    parsed = parser.parse('1.2.3.4 [10/Oct/2024:13:55:36 +0000] "GET /a HTTP/1.1" 502 0.010, 0.020')
+    assert parsed == (1728568536, "/a", 502, latency_bin("0.030"))
+    assert parser.parse('1.2.3.4 [10/Oct/2024:13:55:36 +0000] "GET /a HTTP/1.1" 200 -')[3] is None
+
+    with pytest.raises(ValueError, match=r"no \$request_time"):
+        compile_log_format("nginx_combined", "request_time")
+
+
+def test_client_variable_adds_client_address():
+    parser = compile_log_format("nginx_combined", client_variable="remote_addr")
+    assert parser.parse(COMBINED) == (1728568536, "/terms.html?x=1", 404, "203.0.113.7")
+
+    timed = compile_log_format(
+        '$remote_addr [$time_local] "$request" $status $request_time', "request_time", "remote_addr"
+    )
+    parsed = timed.parse('- [10/Oct/2024:13:55:36 +0000] "GET /a HTTP/1.1" 200 0.010')
+    assert parsed == (1728568536, "/a", 200, latency_bin("0.010"), None)
+
+    json_parser = compile_log_format('{"ip":"$remote_addr","t":"$time_local","r":"$request","s":$status}', None, "remote_addr")
+    line = '{"ip":"2001:db8::1","t":"10/Oct/2024:13:55:36 +0000","r":"GET / HTTP/1.1","s":200}'
+    assert json_parser.parse(line)[3] == "2001:db8::1"
+
+    with pytest.raises(ValueError, match="cannot be used"):
+        compile_log_format("nginx_combined", client_variable="status")
+
+
+def test_trailing_variables_capture_the_rest_of_the_line():
+    parser = compile_log_format("[$time_local] $status $request_uri")
+    assert parser.parse("[10/Oct/2024:13:55:36 +0000] 200 /pricing?a=1\n") == (1728568536, "/pricing?a=1", 200)
+
+    clients = compile_log_format('[$time_local] "$request" $status $remote_addr', None, "remote_addr")
+    line = '[10/Oct/2024:13:55:36 +0000] "GET / HTTP/1.1" 200 203.0.113.7'
+    assert clients.parse(line) == (1728568536, "/", 200, "203.0.113.7")
+
+
+def test_unbracketed_time_local_keeps_its_space():
+    parser = compile_log_format('$remote_addr $time_local "$request" $status')
+    line = '203.0.113.7 10/Oct/2024:13:55:36 +0000 "GET /terms.html HTTP/1.1" 404'
+    assert parser.parse(line) == (1728568536, "/terms.html", 404)
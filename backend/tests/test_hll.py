@@ -0,0 +1,30 @@
+from fizzylog.hll import apply, client_register, estimate, standard_error, union
+
+
+def sketch(clients, precision=10):
+    registers = bytearray(1 << precision)
+    for client in clients:
+        index, rank = client_register(client, precision)
+        apply(registers, {index: rank})
+    return bytes(registers)
+
+
+def test_estimates_stay_within_three_standard_errors():
+    for precision in (8, 10, 12):
+        bound = 3 * standard_error(precision)
+        for distinct in (10, 500, 5000, 60000):
+            clients = [f"10.{i >> 16}.{(i >> 8) & 255}.{i & 255}" for i in range(distinct)]
+            registers = sketch(clients, precision)
+            assert len(registers) == 1 << precision
+            assert abs(estimate(registers) - distinct) <= max(1, bound * distinct)
+
+
+def test_union_matches_sketch_of_combined_clients():
+    first = [f"192.0.2.{i}" for i in range(200)]
+    second = [f"198.51.100.{i}" for i in range(200)] + first[:50]
+    merged = union(sketch(first), sketch(second))
+    assert merged == sketch(first + second)
+    assert union(merged, merged) == merged
+    # Repeated clients never raise the estimate.
+    assert sketch(first * 5) == sketch(first)
+    assert estimate(bytes(1024)) == 0
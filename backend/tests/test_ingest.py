@@ -0,0 +1,271 @@
+import io
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fizzylog import db
+from fizzylog.config import LogConfig
+from fizzylog.hll import client_register
+from fizzylog.ingest import OTHER_PATH, BlockReader, LineReader, LogIngester, aggregate_lines
+from fizzylog.latency import latency_bin
+from fizzylog.models import StatusFilter
+from fizzylog.pathrules import PathRule
+from test_paths import make_config
+
+
+LINE = '203.0.113.7 - - [10/Oct/2024:13:55:36 +0000] "GET {path} HTTP/1.1" {status} 512 "-" "curl/8.0"\n'
+
+
+def test_block_reader_keeps_partial_tail():
+    first = LINE.format(path="/", status=200)
+    second = LINE.format(path="/terms.html", status=404)
+    handle = io.BytesIO((first + second[:20]).encode())
+    reader = BlockReader(handle, chunk_bytes=4096)
+
+    assert reader.read() == [first.rstrip("\n")]
+    assert reader.pending == second[:20].encode()
+
+    handle.write(second[20:].encode())
+    handle.seek(len(first) + 20)
+    assert reader.read() == [second.rstrip("\n")]
+    assert reader.read() is None
+
+
+def test_line_reader_holds_partial_line():
+    line = LINE.format(path="/", status=200)
+    handle = io.BytesIO(line[:30].encode())
+    reader = LineReader(handle)
+
+    assert reader.read() == []
+    handle.write(line[30:].encode())
+    handle.seek(30)
+    assert reader.read() == [line]
+    assert reader.read() is None
+
+
+def test_aggregate_lines_batch():
+    config = make_config(include_exact=["/", "/terms.html"])
+    lines = [
+        LINE.format(path="/", status=200),
+        LINE.format(path="/?q=1", status=200),
+        LINE.format(path="/terms.html", status=404),
+        LINE.format(path="/other", status=200),
+        "garbage",
+    ]
+    buffer = {}
+    ingested, parse_errors, last_event_utc = aggregate_lines(lines, config, buffer)
+
+    assert ingested == 3
+    assert parse_errors == 1
+    assert last_event_utc == 1728568536
+    assert buffer == {(1728568500, "/", 200): 2, (1728568500, "/terms.html", 404): 1}
+
+
+def test_aggregate_lines_counts_latency_bins():
+    config = make_config(include_exact=["/"])
+    config.log.format = '$remote_addr [$time_local] "$request" $status $request_time'
+    config.log.latency_variable = "request_time"
+    lines = [
+        '203.0.113.7 [10/Oct/2024:13:55:36 +0000] "GET / HTTP/1.1" 200 0.012',
+        '203.0.113.7 [10/Oct/2024:13:55:37 +0000] "GET / HTTP/1.1" 200 0.012',
+        '203.0.113.7 [10/Oct/2024:13:55:38 +0000] "GET / HTTP/1.1" 200 -',
+    ]
+    buffer, latency = {}, {}
+    assert aggregate_lines(lines, config, buffer, latency=latency)[0] == 3
+
+    assert buffer == {(1728568500, "/", 200): 3}
+    assert latency == {(1728568500, "/", 200, latency_bin("0.012")): 2}
+
+
+def test_aggregate_lines_updates_client_sketches():
+    config = make_config(include_exact=["/"])
+    config.clients.enabled = True
+    lines = [
+        '203.0.113.7 - - [10/Oct/2024:13:55:36 +0000] "GET / HTTP/1.1" 200 1 "-" "-"',
+        '203.0.113.7 - - [10/Oct/2024:13:55:37 +0000] "GET / HTTP/1.1" 200 1 "-" "-"',
+        '198.51.100.2 - - [10/Oct/2024:13:55:38 +0000] "GET / HTTP/1.1" 304 1 "-" "-"',
+    ]
+    clients = {}
+    assert aggregate_lines(lines, config, {}, clients=clients)[0] == 3
+
+    expected = dict([client_register("203.0.113.7"), client_register("198.51.100.2")])
+    assert clients == {(1728568500, "/"): expected}
+
+
+def test_aggregate_lines_caps_dynamic_paths_per_bucket():
+    config = make_config(include_exact=["/"])
+    config.paths.include_prefix = [PathRule("/api/")]
+    config.paths.max_paths_per_bucket = 2
+    lines = [LINE.format(path=path, status=200) for path in ("/api/1", "/api/2", "/api/3", "/", "/api/1", "/api/4")]
+    buffer = {}
+    assert aggregate_lines(lines, config, buffer)[0] == 6
+
+    assert buffer == {
+        (1728568500, "/api/1", 200): 2,
+        (1728568500, "/api/2", 200): 1,
+        (1728568500, OTHER_PATH, 200): 2,
+        (1728568500, "/", 200): 1,
+    }
+
+
+def test_ingester_tails_multiple_files_into_one_buffer():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        paths = [os.path.join(tmpdir, name) for name in ("a.log", "b.log")]
+        for path in paths:
+            open(path, "w").close()
+        config = make_config(include_exact=["/"])
+        config.log = LogConfig(paths=[os.path.join(tmpdir, "*.log")])
+        ingester = LogIngester(config, ":memory:")
+        executor = ThreadPoolExecutor(max_workers=2)
+        try:
+            ingester._start_tailers(executor, start_at_end=True)
+            time.sleep(0.2)
+            for path in paths:
+                with open(path, "a") as handle:
+                    handle.write(LINE.format(path="/", status=200))
+            deadline = time.time() + 5
+            while sum(ingester._buffer.values()) < 2 and time.time() < deadline:
+                time.sleep(0.01)
+        finally:
+            ingester._stop_event.set()
+            executor.shutdown(wait=True)
+
+        assert sorted(ingester._tailers) == paths
+        buffer, checkpoints, _, _, _ = ingester._take_buffer()
+        assert buffer == {(1728568500, "/", 200): 2}
+        assert sorted(checkpoints) == paths
+        assert ingester.metrics.lines_read.value == 2
+        assert ingester.metrics.lines_parsed.value == 2
+        assert ingester.metrics.parse_errors.value == 0
+        assert 'fizzylog_buffer_keys 0' in ingester.state.metrics.render()
+
+
+def test_ingester_resumes_from_checkpoint_across_rotation():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_path = os.path.join(tmpdir, "access.log")
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+        with open(log_path, "w") as handle:
+            handle.write(LINE.format(path="/", status=200))
+        config = make_config(include_exact=["/"])
+        config.log = LogConfig(path=log_path)
+
+        def run_once(write):
+            ingester = LogIngester(config, sqlite_path)
+            ingester.start()
+            time.sleep(0.3)
+            write()
+            time.sleep(0.3)
+            ingester.stop()
+
+        def append(path, count):
+            with open(path, "a") as handle:
+                handle.writelines(LINE.format(path="/", status=200) for _ in range(count))
+
+        run_once(lambda: append(log_path, 2))
+        # While stopped: more writes, a rotation, late writes to the
+        # rotated file and a fresh log.
+        append(log_path, 3)
+        os.rename(log_path, log_path + ".1")
+        append(log_path + ".1", 1)
+        append(log_path, 2)
+        run_once(lambda: None)
+
+        conn = db.get_connection(sqlite_path)
+        try:
+            rows = db.query_rollups(
+                conn, ["/"], StatusFilter(mode="ranges", ranges=["2xx"], exact=[]), 0, 2**31
+            )
+            checkpoints = db.load_checkpoints(conn)
+        finally:
+            conn.close()
+
+    assert rows == [(1728568500, "/", 8)]
+    assert checkpoints[log_path][1] == 2 * len(LINE.format(path="/", status=200))
+
+
+def test_ingester_flushes_early_and_applies_backpressure():
+    config = make_config(include_exact=["/"])
+    config.ingest.flush_max_keys = 2
+    ingester = LogIngester(config, ":memory:")
+    ingester.flush_max_keys = 2
+    counts = {(60, "/", 200): 1, (120, "/", 200): 1}
+
+    ingester._merge("a.log", counts, 120, (1, 10))
+    assert ingester._wakeup.is_set()
+
+    merged = threading.Event()
+
+    def second_batch():
+        ingester._merge("a.log", {(180, "/", 200): 1}, 180, (1, 20))
+        merged.set()
+
+    ingester._merge("a.log", {(180, "/", 404): 1, (240, "/", 200): 1}, 240, (1, 15))
+    worker = threading.Thread(target=second_batch)
+    worker.start()
+    # Four keys is twice the limit, so the tailer waits for a flush.
+    assert not merged.wait(0.2)
+    buffer, checkpoints, _, _, _ = ingester._take_buffer()
+    assert len(buffer) == 4
+    assert checkpoints == {"a.log": (1, 15)}
+    assert merged.wait(2)
+    worker.join()
+    assert ingester._take_buffer()[0] == {(180, "/", 200): 1}
+
+
+def test_flush_limit_follows_commit_latency():
+    config = make_config(include_exact=["/"])
+    config.ingest.flush_max_keys = 50000
+    config.ingest.flush_target_seconds = 0.25
+    ingester = LogIngester(config, ":memory:")
+
+    ingester._adapt_flush_limit(10000, 1.0)
+    assert ingester.flush_max_keys == 2500
+    ingester._adapt_flush_limit(500, 10.0)
+    assert ingester.flush_max_keys == 2500
+    for _ in range(20):
+        ingester._adapt_flush_limit(50000, 0.1)
+    assert ingester.flush_max_keys == 50000
+
+
+def test_failed_flush_is_retried(monkeypatch):
+    with tempfile.TemporaryDirectory() as tmpdir:
+        log_path = os.path.join(tmpdir, "access.log")
+        sqlite_path = os.path.join(tmpdir, "rollups.sqlite")
+        open(log_path, "w").close()
+        config = make_config(include_exact=["/"])
+        config.log = LogConfig(path=log_path)
+        config.ingest.flush_seconds = 0.1
+
+        write_rollups = db.write_rollups
+        calls = []
+
+        def flaky_write(conn, rows, *args):
+            calls.append(dict(rows))
+            if rows and len([call for call in calls if call]) == 1:
+                raise sqlite3.OperationalError("database is locked")
+            write_rollups(conn, rows, *args)
+
+        monkeypatch.setattr(db, "write_rollups", flaky_write)
+        ingester = LogIngester(config, sqlite_path)
+        ingester.start()
+        time.sleep(0.3)
+        with open(log_path, "a") as handle:
+            handle.writelines(LINE.format(path="/", status=200) for _ in range(3))
+        deadline = time.time() + 5
+        while len([call for call in calls if call]) < 2 and time.time() < deadline:
+            time.sleep(0.05)
+        ingester.stop()
+
+        conn = db.get_connection(sqlite_path)
+        try:
+            rows = db.query_rollups(conn, ["/"], StatusFilter(mode="exact", ranges=[], exact=[200]), 0, 2**31)
+            checkpoints = db.load_checkpoints(conn)
+        finally:
+            conn.close()
+
+    assert [call for call in calls if call][:2] == [{(1728568500, "/", 200): 3}] * 2
+    assert rows == [(1728568500, "/", 3)]
+    assert checkpoints[log_path][1] == 3 * len(LINE.format(path="/", status=200))
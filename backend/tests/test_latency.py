@@ -0,0 +1,35 @@
+import random
+
+from fizzylog.latency import LATENCY_MAX_BIN, bin_value, latency_bin, merge, quantiles
+
+
+def test_latency_bin_parses_nginx_values():
+    assert latency_bin("0.000") == 0
+    assert latency_bin("-") is None
+    assert latency_bin("0.010, 0.020") == latency_bin("0.030")
+    assert latency_bin("0.010 : 0.020") == latency_bin("0.030")
+    assert latency_bin("0.010, -") == latency_bin("0.010")
+    assert latency_bin("9999.0") == LATENCY_MAX_BIN
+    assert latency_bin("abc") is None
+
+
+def test_bin_value_is_within_bin_error_bound():
+    for seconds in (0.0013, 0.017, 0.25, 3.7, 42.0):
+        assert abs(bin_value(latency_bin(str(seconds))) - seconds) / seconds < 0.095
+
+
+def test_quantiles_of_merged_histograms_track_exact_quantiles():
+    rng = random.Random(7)
+    samples = [rng.lognormvariate(-3, 1) for _ in range(20000)]
+    halves = [{}, {}]
+    for position, seconds in enumerate(samples):
+        histogram = halves[position % 2]
+        index = latency_bin(f"{seconds:.3f}")
+        histogram[index] = histogram.get(index, 0) + 1
+
+    estimated = quantiles(merge(halves))
+    ordered = sorted(samples)
+    for q, value in zip((0.5, 0.95, 0.99), estimated):
+        exact = ordered[int(q * len(ordered)) - 1]
+        assert abs(value - exact) / exact < 0.1
+    assert quantiles({}) == [None, None, None]
@@ -0,0 +1,22 @@
+from fizzylog.metrics import MetricsRegistry
+
+
+def test_registry_renders_prometheus_text():
+    registry = MetricsRegistry()
+    lines = registry.counter("fizzylog_lines_read_total", "Lines read.")
+    lines.inc(3)
+    assert registry.counter("fizzylog_lines_read_total", "Lines read.") is lines
+
+    latency = registry.histogram("fizzylog_series_seconds", "Series latency.", buckets=(0.01, 0.1))
+    latency.observe(0.005)
+    latency.observe(0.05)
+    latency.observe(2.0)
+    registry.gauge("fizzylog_bytes_behind", "Bytes behind.", lambda: {"/var/log/a.log": 10}, label="path")
+
+    text = registry.render()
+    assert "# TYPE fizzylog_lines_read_total counter\nfizzylog_lines_read_total 3\n" in text
+    assert 'fizzylog_series_seconds_bucket{le="0.01"} 1' in text
+    assert 'fizzylog_series_seconds_bucket{le="0.1"} 2' in text
+    assert 'fizzylog_series_seconds_bucket{le="+Inf"} 3' in text
+    assert "fizzylog_series_seconds_count 3" in text
+    assert 'fizzylog_bytes_behind{path="/var/log/a.log"} 10' in text
@@ -1,4 +1,7 @@
+import pytest
+
 from fizzylog.config import (
+    ApiConfig,
     Config,
     IngestConfig,
     LogConfig,
@@ -8,7 +11,8 @@ from fizzylog.config import (
     UIConfig,
     WindowConfig,
 )
-from fizzylog.ingest import normalize_path
+from fizzylog.ingest import PathNormalizer, normalize_path
+from fizzylog.pathrules import PathRule, compile_path_rules
 
 
 def make_config(
@@ -20,6 +24,7 @@ def make_config(
 ):
     return Config(
         log=LogConfig(path="/var/log/nginx/access.log"),
+        api=ApiConfig(),
         window=WindowConfig(),
         paths=PathsConfig(
             include_exact=include_exact,
@@ -53,3 +58,79 @@ def test_normalize_ignores_static_assets():
     )
     assert normalize_path("/style.css", config) is None
     assert normalize_path("/app.js", config) is None
+
+
+def test_normalizer_caches_hits_and_rejections():
+    config = make_config(include_exact=["/"], aliases={"/index.html": "/"})
+    normalizer = PathNormalizer(config)
+
+    assert normalizer.normalize("/index.html?utm=1") == "/"
+    assert normalizer.normalize("/index.html?utm=1") == "/"
+    assert normalizer.normalize("/terms.html") is None
+    assert normalizer.normalize("/terms.html") is None
+
+    stats = normalizer.cache_stats()
+    assert stats["hits"] == 2
+    assert stats["misses"] == 2
+    assert stats["hit_rate"] == 0.5
+
+
+def test_normalizer_cache_is_bounded():
+    config = make_config(include_exact=["/"])
+    config.paths.cache_size = 2
+    normalizer = PathNormalizer(config)
+    for index in range(10):
+        normalizer.normalize(f"/?page={index}")
+
+    assert normalizer.cache_stats()["size"] == 2
+
+
+def test_normalize_applies_prefix_glob_and_regex_rules():
+    config = make_config(include_exact=["/"])
+    config.paths.include_prefix = [PathRule("/api/"), PathRule("/api/v2/", "/api/v2")]
+    config.paths.include_glob = [PathRule("/blog/*/"), PathRule("/docs/**", "/docs")]
+    config.paths.include_regex = [PathRule(r"^/product/(?P<id>\d+)$", "/product/:id")]
+
+    assert normalize_path("/", config) == "/"
+    assert normalize_path("/api/v1/users?page=2", config) == "/api/v1/users"
+    assert normalize_path("/api/v2/users", config) == "/api/v2"
+    assert normalize_path("/blog/launch/", config) == "/blog/launch/"
+    assert normalize_path("/blog/2024/launch/", config) is None
+    assert normalize_path("/docs/guide/install", config) == "/docs"
+    assert normalize_path("/product/42", config) == "/product/:id"
+    assert normalize_path("/product/shoes", config) is None
+    assert normalize_path("/api", config) is None
+
+
+def test_matcher_rewrites_named_groups_and_tracks_static_paths():
+    matcher = compile_path_rules(
+        ["/"],
+        regex=[
+            PathRule(r"^/(?P<lang>en|de)/docs/(?P<page>\w+)$", "/docs/{page}"),
+            PathRule(r"(?i)^/Shop/(?P<id>\d+)$", "/shop/:id"),
+        ],
+        glob=[PathRule("/*/feed.xml", "/feed")],
+    )
+
+    assert matcher.match("/de/docs/intro") == "/docs/intro"
+    assert matcher.match("/shop/7") == "/shop/:id"
+    assert matcher.match("/news/feed.xml") == "/feed"
+    assert matcher.match("/news/other.xml") is None
+    assert matcher.static_paths == ["/", "/shop/:id", "/feed"]
+    assert matcher.dynamic
+
+
+def test_matcher_rejects_unknown_rewrite_group():
+    with pytest.raises(ValueError, match="unknown group 'slug'"):
+        compile_path_rules([], regex=[PathRule(r"^/post/(?P<id>\d+)$", "/post/{slug}")])
+
+
+def test_matcher_rejects_regexes_that_cannot_be_combined():
+    with pytest.raises(ValueError, match="named group"):
+        compile_path_rules([], regex=[PathRule(r"/c/(\w+)/\1")])
+    with pytest.raises(ValueError, match="verbose"):
+        compile_path_rules([], regex=[PathRule("(?x) /a/b  # comment")])
+    # Escaped backslashes and named backreferences are fine.
+    matcher = compile_path_rules([], regex=[PathRule(r"^/c/(?P<x>\w+)/(?P=x)$"), PathRule(r"^/d\\1$")])
+    assert matcher.match("/c/a/a") == "/c/a/a"
+    assert matcher.match("/d\\1") == "/d\\1"
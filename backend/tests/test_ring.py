@@ -0,0 +1,55 @@
+import tracemalloc
+
+from fizzylog.models import StatusFilter
+from fizzylog.ring import HotRing
+
+
+RANGES_2XX = StatusFilter(mode="ranges", ranges=["2xx"], exact=[])
+
+
+def test_ring_aggregates_and_filters_status():
+    ring = HotRing(60, slots=4)
+    ring.reset(valid_from=60)
+    ring.add({(0, "/", 200): 9, (60, "/", 200): 2, (60, "/", 404): 1, (120, "/terms", 204): 3})
+    ring.add({(60, "/", 200): 1})
+
+    assert ring.query(["/", "/terms"], RANGES_2XX, 0, 120) == [(60, "/", 3), (120, "/terms", 3)]
+    assert ring.query(["/"], StatusFilter(mode="exact", ranges=[], exact=[404]), 0, 120) == [(60, "/", 1)]
+    assert ring.query_classes(None, 0, 120) == [(60, "/", 2, 3), (60, "/", 4, 1), (120, "/terms", 2, 3)]
+
+
+def test_ring_coverage_and_eviction():
+    ring = HotRing(60, slots=3)
+    assert ring.first_bucket(600) is None
+
+    ring.reset(valid_from=60)
+    assert ring.first_bucket(120) == 60
+    ring.add({(60, "/", 200): 1, (300, "/", 200): 2})
+    # 60 was evicted by 300, and older buckets are never written back.
+    ring.add({(120, "/", 200): 5})
+    assert ring.first_bucket(300) == 180
+    assert ring.query(["/"], RANGES_2XX, 0, 300) == [(300, "/", 2)]
+
+
+def test_ring_forgets_paths_of_overwritten_slots():
+    ring = HotRing(60, slots=10)
+    ring.reset(valid_from=0)
+
+    def fill(first_bucket):
+        for bucket in range(first_bucket, first_bucket + 100):
+            ring.add({(bucket * 60, f"/api/item/{bucket}/{n}", 200): 1 for n in range(300)})
+
+    # Warm up with the same number of paths per slot, then measure what
+    # 30k more distinct paths cost.
+    fill(0)
+    tracemalloc.start()
+    try:
+        before = tracemalloc.get_traced_memory()[0]
+        fill(100)
+        grown = tracemalloc.get_traced_memory()[0] - before
+    finally:
+        tracemalloc.stop()
+
+    # Keeping every path ever seen costs about 10 MB here.
+    assert grown < 1024 * 1024
+    assert len(ring.query_classes(None, 0, 200 * 60)) == 10 * 300
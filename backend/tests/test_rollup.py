@@ -1,9 +1,14 @@
+import os
 import tempfile
 
 from fizzylog import db
+from fizzylog.hll import apply, client_register
 from fizzylog.models import StatusFilter
 
 
+STATUS_2XX = StatusFilter(mode="ranges", ranges=["2xx"], exact=[])
+
+
 def test_rollup_aggregation():
     with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
         db.init_db(tmp.name)
@@ -30,3 +35,266 @@ def test_rollup_aggregation():
             conn.close()
 
     assert rows == [(100, "/", 3), (160, "/", 3)]
+
+
+def test_rollups_maintain_coarser_tiers():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(conn, {(540, "/", 200): 2, (600, "/", 200): 3, (660, "/", 301): 1}, tiers=[600])
+            db.write_rollups(conn, {(1140, "/", 200): 4}, tiers=[600])
+            rows = db.query_rollups(
+                conn,
+                ["/"],
+                StatusFilter(mode="ranges", ranges=["2xx", "3xx"], exact=[]),
+                0,
+                1200,
+                tier_seconds=600,
+            )
+        finally:
+            conn.close()
+
+    assert rows == [(0, "/", 2), (600, "/", 8)]
+
+
+def test_latency_histograms_merge_by_status_and_tier():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            latency = {(540, "/", 200, 20): 2, (600, "/", 200, 20): 1, (660, "/", 500, 40): 3}
+            db.write_rollups(conn, {(540, "/", 200): 2}, tiers=[600], latency=latency)
+            db.write_rollups(conn, {}, tiers=[600], latency={(600, "/", 204, 24): 5})
+            base = db.query_latency(conn, ["/"], STATUS_2XX, 0, 1200)
+            tier = db.query_latency(conn, None, STATUS_2XX, 0, 1200, tier_seconds=600)
+        finally:
+            conn.close()
+
+    assert base == [(540, "/", 20, 2), (600, "/", 20, 1), (600, "/", 24, 5)]
+    assert sorted(tier) == [(0, "/", 20, 2), (600, "/", 20, 1), (600, "/", 24, 5)]
+
+
+def sketch(clients):
+    registers = bytearray(1024)
+    for client in clients:
+        index, rank = client_register(client)
+        apply(registers, {index: rank})
+    return bytes(registers)
+
+
+def test_client_sketches_merge_across_buckets_and_tiers():
+    first = [f"192.0.2.{i}" for i in range(100)]
+    second = [f"198.51.100.{i}" for i in range(60)]
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(conn, {}, tiers=[600], clients={(540, "/"): sketch(first)})
+            # A second flush for the same bucket merges instead of replacing.
+            db.write_rollups(conn, {}, tiers=[600], clients={(540, "/"): sketch(second)})
+            db.write_rollups(conn, {}, tiers=[600], clients={(600, "/"): sketch(first[:10])})
+            base = db.query_clients(conn, ["/"], 0, 1200)
+            tier = db.query_clients(conn, None, 0, 1200, tier_seconds=600)
+            total = db.query_clients_total(conn, ["/"], 0, 1200)
+        finally:
+            conn.close()
+
+    assert [row[:2] for row in base] == [(540, "/"), (600, "/")]
+    assert abs(base[0][2] - 160) <= 5 and base[1][2] == 10
+    assert tier[0][:2] == (0, "/") and tier[0][2] == base[0][2]
+    # The ten clients seen in both buckets are counted once.
+    assert total == {"/": base[0][2]}
+
+
+def test_status_classes_are_rolled_up_at_write_time():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            rows = {(60, "/", 200): 1, (60, "/", 204): 2, (60, "/", 301): 4, (660, "/", 404): 8, (660, "/", 101): 1}
+            db.write_rollups(conn, rows, tiers=[600])
+            classes = db.query_classes(conn, ["/"], 0, 660)
+            tier = db.query_classes(conn, None, 0, 600, tier_seconds=600)
+            ranges = StatusFilter(mode="ranges", ranges=["2xx", "4xx"], exact=[])
+            filtered = db.query_rollups(conn, ["/"], ranges, 0, 660)
+            exact = db.query_rollups(conn, ["/"], StatusFilter(mode="exact", ranges=[], exact=[204]), 0, 660)
+        finally:
+            conn.close()
+
+    assert classes == [(60, "/", 2, 3), (60, "/", 3, 4), (660, "/", 1, 1), (660, "/", 4, 8)]
+    assert tier == [(0, "/", 2, 3), (0, "/", 3, 4), (600, "/", 1, 1), (600, "/", 4, 8)]
+    assert filtered == [(60, "/", 3), (660, "/", 8)]
+    assert exact == [(60, "/", 2)]
+
+
+def test_retention_drops_expired_partitions():
+    day = 86400
+    status_filter = StatusFilter(mode="ranges", ranges=["2xx"], exact=[])
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            db.write_rollups(conn, {(60, "/", 200): 1, (day + 60, "/", 200): 2}, tiers=[600])
+            # Base partitions are hourly and the 600 s tier's daily; each
+            # level has a per-status and a per-class partition.
+            assert db.apply_retention(conn, 3600, {600: day - 1}) == 2
+            assert db.query_rollups(conn, ["/"], status_filter, 0, 2 * day) == [(day + 60, "/", 2)]
+            assert db.query_rollups(conn, ["/"], status_filter, 0, 2 * day, 600) == [
+                (0, "/", 1),
+                (day, "/", 2),
+            ]
+            assert db.apply_retention(conn, 3600, {600: day}) == 2
+            assert db.query_rollups(conn, ["/"], status_filter, 0, 2 * day, 600) == [(day, "/", 2)]
+            assert db.first_bucket(conn) == day + 60
+        finally:
+            conn.close()
+
+
+def test_init_db_migrates_single_table_layout():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        conn = db.get_connection(tmp.name)
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE rollup_counts (
+                    bucket_start_utc INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (bucket_start_utc, path, status)
+                );
+                INSERT INTO rollup_counts VALUES (60, '/', 200, 2), (7260, '/', 200, 5);
+                """
+            )
+        finally:
+            conn.close()
+
+        db.init_db(tmp.name, [600])
+        conn = db.get_connection(tmp.name)
+        try:
+            tables = {
+                row[0] for row in conn.execute("SELECT name FROM sqlite_master WHERE type = 'table'")
+            }
+            assert "rollup_counts" not in tables
+            assert {"rollup_counts_p0", "rollup_counts_p7200", "rollup_counts_600_p0"} <= tables
+            assert conn.execute("PRAGMA user_version").fetchone()[0] == db.SCHEMA_VERSION
+            status_filter = StatusFilter(mode="exact", ranges=[], exact=[200])
+            assert db.query_rollups(conn, ["/"], status_filter, 0, 7200) == [(60, "/", 2)]
+            assert db.query_rollups(conn, ["/"], status_filter, 0, 7200, 600) == [(0, "/", 2), (7200, "/", 5)]
+        finally:
+            conn.close()
+
+
+def test_init_db_moves_text_partitions_to_path_ids():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        conn = db.get_connection(tmp.name)
+        try:
+            conn.executescript(
+                """
+                CREATE TABLE rollup_levels (
+                    name TEXT PRIMARY KEY,
+                    bucket_seconds INTEGER NOT NULL,
+                    partition_seconds INTEGER NOT NULL
+                );
+                INSERT INTO rollup_levels VALUES ('rollup_counts', 60, 3600);
+                CREATE TABLE rollup_counts_p0 (
+                    bucket_start_utc INTEGER NOT NULL,
+                    path TEXT NOT NULL,
+                    status INTEGER NOT NULL,
+                    count INTEGER NOT NULL,
+                    PRIMARY KEY (bucket_start_utc, path, status)
+                );
+                INSERT INTO rollup_counts_p0 VALUES (60, '/', 200, 2), (60, '/terms.html', 200, 4);
+                PRAGMA user_version = 1;
+                """
+            )
+        finally:
+            conn.close()
+
+        db.init_db(tmp.name)
+        conn = db.get_connection(tmp.name)
+        try:
+            assert db.query_rollups(conn, ["/", "/terms.html"], STATUS_2XX, 0, 60) == [
+                (60, "/", 2),
+                (60, "/terms.html", 4),
+            ]
+            columns = [row[1] for row in conn.execute("PRAGMA table_info(rollup_counts_p0)")]
+            assert columns == ["path_id", "bucket_start_utc", "status", "count"]
+            # Rollups from before coverage was recorded cover every log.
+            assert [start for start, _ in db.load_coverage(conn)[db.ALL_SOURCES]] == [60]
+            db.write_rollups(conn, {(60, "/", 200): 1, (120, "/new", 500): 1})
+            assert db.query_rollups(conn, ["/"], STATUS_2XX, 0, 60) == [(60, "/", 3)]
+        finally:
+            conn.close()
+
+
+def test_select_tier_prefers_coarsest_with_enough_points():
+    assert db.select_tier(60, [600, 3600], 21600, 360) is None
+    assert db.select_tier(60, [600, 3600], 7 * 86400, 360) == 600
+    assert db.select_tier(60, [600, 3600], 30 * 86400, 360) == 3600
+
+
+def test_select_step_fits_range_in_max_points():
+    now = 10_000_000
+    levels = [(None, 60, 43200), (600, 600, 604800), (3600, 3600, 2592000)]
+    assert db.select_step(levels, now - 3600, now, 360, now) == (None, 60)
+    # The base level no longer covers a day ago.
+    assert db.select_step(levels, now - 86400, now, 360, now) == (600, 600)
+    assert db.select_step(levels, now - 20 * 86400, now - 10 * 86400, 100, now) == (3600, 10800)
+    # Aligned to 60s the range would need two buckets.
+    assert db.select_step([(None, 60, now)], 50, 70, 1, now) == (None, 120)
+
+
+def test_query_rebuckets_across_partitions():
+    with tempfile.NamedTemporaryFile(suffix=".sqlite") as tmp:
+        db.init_db(tmp.name)
+        conn = db.get_connection(tmp.name)
+        try:
+            rows = {(3540, "/", 200): 1, (3600, "/", 200): 2, (3660, "/", 204): 4, (7200, "/", 200): 8}
+            latency = {(3540, "/", 200, 20): 1, (3600, "/", 200, 20): 2}
+            clients = {(3540, "/"): sketch(["a", "b"]), (3600, "/"): sketch(["b", "c"])}
+            db.write_rollups(conn, rows, latency=latency, clients=clients)
+            counts = db.query_rollups(conn, ["/"], STATUS_2XX, 0, 10740, step=7200)
+            histograms = db.query_latency(conn, None, STATUS_2XX, 0, 7140, step=7200)
+            distinct = db.query_clients(conn, ["/"], 0, 7140, step=7200)
+        finally:
+            conn.close()
+
+    assert counts == [(0, "/", 7), (7200, "/", 8)]
+    assert histograms == [(0, "/", 20, 3)]
+    assert distinct == [(0, "/", 3)]
+
+
+def test_read_pool_reuses_connections_until_file_replaced():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "rollups.sqlite")
+        db.init_db(path)
+        conn = db.get_connection(path)
+        try:
+            db.write_rollups(conn, {(100, "/", 200): 1})
+        finally:
+            conn.close()
+
+        pool = db.ReadPool(path, max_size=2)
+        with pool.connection() as first:
+            assert db.query_rollups(first, ["/"], STATUS_2XX, 0, 100) == [(100, "/", 1)]
+        with pool.connection() as second:
+            assert second is first
+        assert pool.stats()["opened"] == 1
+        assert pool.stats()["reused"] == 1
+
+        replacement = os.path.join(tmpdir, "replacement.sqlite")
+        db.init_db(replacement)
+        conn = db.get_connection(replacement)
+        try:
+            db.write_rollups(conn, {(100, "/", 200): 5})
+        finally:
+            conn.close()
+        os.replace(replacement, path)
+
+        with pool.connection() as third:
+            assert third is not first
+            assert db.query_rollups(third, ["/"], STATUS_2XX, 0, 100) == [(100, "/", 5)]
+        assert pool.stats()["opened"] == 2
+        pool.close()
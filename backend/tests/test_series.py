@@ -1,4 +1,8 @@
-from fizzylog.api import _build_series
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+from fizzylog.api import SeriesCache, _build_series
 
 
 def test_series_zero_fill_alignment():
@@ -10,3 +14,63 @@ def test_series_zero_fill_alignment():
     assert series[0]["counts"] == [2, 0, 4]
     assert series[1]["path"] == "/terms"
     assert series[1]["counts"] == [0, 1, 0]
+
+
+def test_series_cache_reuses_body_until_generation_changes():
+    cache = SeriesCache()
+    calls = []
+
+    def build():
+        calls.append(1)
+        return {"n": len(calls)}
+
+    etag, body = cache.get(("ranges", ("2xx",), (), 60), 0, build)
+    assert cache.get(("ranges", ("2xx",), (), 60), 0, build) == (etag, body)
+    assert body == b'{"n":1}'
+    assert len(calls) == 1
+
+    new_etag, new_body = cache.get(("ranges", ("2xx",), (), 60), 1, build)
+    assert new_body == b'{"n":2}'
+    assert new_etag != etag
+
+
+def test_series_cache_builds_outside_lock_and_shares_misses():
+    cache = SeriesCache()
+    release = threading.Event()
+    calls = []
+
+    def slow_build():
+        calls.append("slow")
+        release.wait(5)
+        return {"slow": True}
+
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        first = executor.submit(cache.get, ("range", 0), 0, slow_build)
+        while not calls:
+            time.sleep(0.01)
+        same = executor.submit(cache.get, ("range", 0), 0, slow_build)
+        # Another key is served while the slow build is still running.
+        assert cache.get(("live",), 0, lambda: {"live": True})[1] == b'{"live":true}'
+        release.set()
+        assert first.result() == same.result()
+    assert calls == ["slow"]
+
+
+def test_series_cache_evicts_least_recently_used():
+    cache = SeriesCache(max_entries=2)
+    calls = []
+
+    def build(name):
+        def run():
+            calls.append(name)
+            return {"name": name}
+
+        return run
+
+    cache.get(("a",), 0, build("a"))
+    cache.get(("b",), 0, build("b"))
+    cache.get(("a",), 0, build("a"))
+    cache.get(("c",), 0, build("c"))
+    cache.get(("a",), 0, build("a"))
+    cache.get(("b",), 0, build("b"))
+    assert calls == ["a", "b", "c", "b"]
@@ -0,0 +1,63 @@
+import asyncio
+import threading
+
+from fizzylog.ring import HotRing
+from fizzylog.stream import Broadcaster, format_event
+
+
+def test_broadcaster_shares_frame_across_subscribers():
+    async def scenario():
+        broadcaster = Broadcaster()
+        broadcaster.attach(asyncio.get_running_loop())
+        streams = [broadcaster.subscribe() for _ in range(3)]
+        for stream in streams:
+            assert await stream.__anext__() == b"retry: 3000\n\n"
+        pending = [asyncio.ensure_future(stream.__anext__()) for stream in streams]
+        await asyncio.sleep(0)
+        assert broadcaster.subscribers == 3
+
+        frame = format_event("buckets", {"generation": 1})
+        thread = threading.Thread(target=broadcaster.publish, args=(frame,))
+        thread.start()
+        thread.join()
+        received = await asyncio.gather(*pending)
+        for stream in streams:
+            await stream.aclose()
+        return frame, received, broadcaster.subscribers
+
+    frame, received, subscribers = asyncio.run(scenario())
+    assert frame == b'event: buckets\ndata: {"generation":1}\n\n'
+    assert all(item is frame for item in received)
+    assert subscribers == 0
+
+
+def test_broadcaster_queues_frames_for_busy_subscribers():
+    async def scenario():
+        broadcaster = Broadcaster(resync_frame=b"resync", max_queued=2)
+        broadcaster.attach(asyncio.get_running_loop())
+        stream = broadcaster.subscribe()
+        await stream.__anext__()
+        # The subscriber is not waiting (still sending) while these arrive.
+        broadcaster._deliver(b"one")
+        broadcaster._deliver(b"two")
+        received = [await stream.__anext__(), await stream.__anext__()]
+        for frame in (b"three", b"four", b"five"):
+            broadcaster._deliver(frame)
+        received.append(await stream.__anext__())
+        broadcaster._deliver(b"six")
+        received.append(await stream.__anext__())
+        await stream.aclose()
+        return received
+
+    assert asyncio.run(scenario()) == [b"one", b"two", b"resync", b"six"]
+
+
+def test_ring_snapshot_by_status():
+    ring = HotRing(60, slots=4)
+    ring.reset(valid_from=0)
+    ring.add({(60, "/", 200): 2, (120, "/", 404): 1, (120, "/terms", 200): 5})
+
+    assert ring.snapshot([60, 120]) == {
+        "/": {200: [2, 0], 404: [0, 1]},
+        "/terms": {200: [0, 5]},
+    }
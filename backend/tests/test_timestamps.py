@@ -0,0 +1,50 @@
+import random
+from datetime import datetime, timezone
+
+from fizzylog.timestamps import TimestampDecoder
+
+
+MONTHS = ["Jan", "Feb", "Mar", "Apr", "May", "Jun", "Jul", "Aug", "Sep", "Oct", "Nov", "Dec"]
+
+
+def reference(text):
+    try:
+        dt = datetime.strptime(text, "%d/%b/%Y:%H:%M:%S %z").astimezone(timezone.utc)
+    except ValueError:
+        return None
+    return int(dt.timestamp())
+
+
+def random_timestamp(rng):
+    sign = rng.choice("+-")
+    offset = f"{sign}{rng.randint(0, 14):02d}{rng.choice([0, 30, 45, rng.randint(0, 59)]):02d}"
+    text = (
+        f"{rng.randint(1, 31):02d}/{rng.choice(MONTHS)}/{rng.randint(1971, 2037)}:"
+        f"{rng.randint(0, 23):02d}:{rng.randint(0, 61):02d}:{rng.randint(0, 61):02d} {offset}"
+    )
+    if rng.random() < 0.05:
+        index = rng.randrange(len(text))
+        text = text[:index] + rng.choice("0 :/x9") + text[index + 1 :]
+    return text
+
+
+def test_decoder_matches_strptime_on_random_corpus():
+    rng = random.Random(20241010)
+    decoder = TimestampDecoder()
+    for _ in range(30000):
+        text = random_timestamp(rng)
+        assert decoder.decode(text) == reference(text), text
+
+
+def test_decoder_matches_strptime_on_ordered_log():
+    rng = random.Random(7)
+    decoder = TimestampDecoder()
+    epoch = 1711846800
+    for _ in range(20000):
+        epoch += rng.choice([0, 0, 0, 1, 1, 59, 3599])
+        for offset in ("+0000", "-0700", "+0530"):
+            sign = 1 if offset[0] == "+" else -1
+            shift = sign * (int(offset[1:3]) * 3600 + int(offset[3:5]) * 60)
+            local = datetime.fromtimestamp(epoch + shift, timezone.utc)
+            text = local.strftime("%d/%b/%Y:%H:%M:%S ") + offset
+            assert decoder.decode(text) == reference(text) == epoch, text
@@ -0,0 +1,38 @@
+import os
+import sys
+import tempfile
+import threading
+import time
+
+import pytest
+
+from fizzylog.watch import InotifyWatcher, PollWatcher, create_watcher
+
+
+def test_poll_watcher_sleeps_at_most_interval():
+    watcher = PollWatcher(interval=0.01)
+    started = time.monotonic()
+    watcher.wait(5)
+    assert time.monotonic() - started < 1
+
+
+@pytest.mark.skipif(not sys.platform.startswith("linux"), reason="inotify is Linux-only")
+def test_inotify_watcher_wakes_on_append():
+    with tempfile.TemporaryDirectory() as tmpdir:
+        path = os.path.join(tmpdir, "access.log")
+        open(path, "w").close()
+        watcher = InotifyWatcher()
+        try:
+            watcher.watch(path)
+            timer = threading.Timer(0.05, lambda: open(path, "a").write("line\n"))
+            timer.start()
+            started = time.monotonic()
+            watcher.wait(5)
+            timer.join()
+            assert time.monotonic() - started < 2
+        finally:
+            watcher.close()
+
+
+def test_create_watcher_poll_mode():
+    assert isinstance(create_watcher("poll"), PollWatcher)
@@ -8,7 +8,13 @@ const timeToggleEl = document.getElementById("time-utc");
 let meta = null;
 let chart = null;
 let refreshTimer = null;
+let stream = null;
 let lastUpdateMs = null;
+let lastSeriesKey = null;
+// Series currently charted: { query, bucketSeconds, bucketStarts, countsByPath, paths }.
+let seriesState = null;
+// Buckets re-requested on each delta poll, since the newest ones may still change.
+const DELTA_OVERLAP_BUCKETS = 2;
 
 const RANGE_OPTIONS = ["2xx", "3xx", "4xx", "5xx"];
 let selectedRanges = new Set();
@@ -227,12 +233,201 @@ async function fetchMeta() {
 
 async function fetchSeries() {
   const query = buildQuery();
-  const response = await fetch(`/api/v1/series?${query}`);
+  let url = `/api/v1/series?${query}`;
+  let sinceBucket = null;
+  if (seriesState && seriesState.query === query && seriesState.bucketStarts.length > 0) {
+    const starts = seriesState.bucketStarts;
+    sinceBucket = starts[Math.max(0, starts.length - DELTA_OVERLAP_BUCKETS)];
+    url += `&since_bucket=${sinceBucket}`;
+  }
+  // The browser revalidates with If-None-Match; an unchanged response
+  // comes back from its cache with the same ETag.
+  const response = await fetch(url, { cache: "no-cache" });
   if (!response.ok) {
     const detail = await response.text();
     throw new Error(detail || "Failed to load series");
   }
-  return response.json();
+  const etag = response.headers.get("ETag");
+  return {
+    query,
+    sinceBucket,
+    key: etag ? `${url}|${etag}` : null,
+    data: await response.json(),
+  };
+}
+
+function replaceSeriesState(query, data) {
+  const countsByPath = new Map();
+  (data.series || []).forEach((item) => countsByPath.set(item.path, item.counts.slice()));
+  seriesState = {
+    query,
+    bucketSeconds: data.bucket_seconds,
+    bucketStarts: (data.bucket_start_utc || []).slice(),
+    countsByPath,
+    paths: (data.series || []).map((item) => item.path),
+  };
+}
+
+// Merges a delta response into seriesState in place: overlapping buckets
+// are overwritten, new ones appended, and buckets that slid out of the
+// window trimmed from the front. Returns false if a full reload is needed.
+function mergeSeriesDelta(data) {
+  const state = seriesState;
+  const series = data.series || [];
+  if (
+    data.bucket_seconds !== state.bucketSeconds ||
+    series.length !== state.paths.length ||
+    series.some((item, index) => item.path !== state.paths[index])
+  ) {
+    return false;
+  }
+  const starts = data.bucket_start_utc || [];
+  const step = state.bucketSeconds;
+  const first = state.bucketStarts[0];
+  for (let j = 0; j < starts.length; j += 1) {
+    const position = (starts[j] - first) / step;
+    if (!Number.isInteger(position) || position < 0 || position > state.bucketStarts.length) {
+      return false;
+    }
+    if (position === state.bucketStarts.length) {
+      state.bucketStarts.push(starts[j]);
+    }
+    series.forEach((item) => {
+      state.countsByPath.get(item.path)[position] = item.counts[j];
+    });
+  }
+  let trim = 0;
+  while (trim < state.bucketStarts.length && state.bucketStarts[trim] < data.window_start_utc) {
+    trim += 1;
+  }
+  if (trim > 0) {
+    state.bucketStarts.splice(0, trim);
+    state.countsByPath.forEach((counts) => counts.splice(0, trim));
+  }
+  return true;
+}
+
+function seriesStateResponse() {
+  return {
+    bucket_start_utc: seriesState.bucketStarts,
+    series: seriesState.paths.map((path) => ({ path, counts: seriesState.countsByPath.get(path) })),
+  };
+}
+
+function statusMatcher() {
+  const exactValue = exactInputEl.value.trim();
+  if (exactValue.length > 0) {
+    const codes = exactValue.split(",").map((token) => Number(token.trim()));
+    return (status) => codes.includes(status);
+  }
+  const ranges = Array.from(selectedRanges);
+  if (ranges.length === 0 && meta) {
+    ranges.push(...meta.status_filter.default_ranges);
+  }
+  if (ranges.length === 0) {
+    return null;
+  }
+  return (status) => ranges.includes(`${Math.floor(status / 100)}xx`);
+}
+
+// Applies a pushed "buckets" event to seriesState: the window is extended
+// with zero buckets up to end_bucket_utc, the changed buckets are
+// overwritten with their filtered totals, and buckets that slid out of
+// the window are trimmed. Returns false if the event cannot be applied.
+function applyStreamEvent(event) {
+  const state = seriesState;
+  const matches = statusMatcher();
+  if (
+    !state ||
+    !matches ||
+    event.resync ||
+    event.bucket_seconds !== state.bucketSeconds ||
+    state.bucketStarts.length === 0
+  ) {
+    return false;
+  }
+  const step = state.bucketSeconds;
+  let last = state.bucketStarts[state.bucketStarts.length - 1];
+  while (last < event.end_bucket_utc) {
+    last += step;
+    state.bucketStarts.push(last);
+    state.countsByPath.forEach((counts) => counts.push(0));
+  }
+  const first = state.bucketStarts[0];
+  event.bucket_start_utc.forEach((bucket, j) => {
+    const position = (bucket - first) / step;
+    if (position < 0) {
+      return;
+    }
+    state.countsByPath.forEach((counts, path) => {
+      const byStatus = event.counts[path] || {};
+      let total = 0;
+      Object.keys(byStatus).forEach((status) => {
+        if (matches(Number(status))) {
+          total += byStatus[status][j];
+        }
+      });
+      counts[position] = total;
+    });
+  });
+  let trim = 0;
+  while (trim < state.bucketStarts.length && state.bucketStarts[trim] < event.window_start_utc) {
+    trim += 1;
+  }
+  if (trim > 0) {
+    state.bucketStarts.splice(0, trim);
+    state.countsByPath.forEach((counts) => counts.splice(0, trim));
+  }
+  return true;
+}
+
+function startPolling() {
+  if (refreshTimer) {
+    clearInterval(refreshTimer);
+  }
+  const refreshSeconds = (meta && meta.ui && meta.ui.refresh_seconds) || 2;
+  refreshTimer = setInterval(fetchAndRender, refreshSeconds * 1000);
+}
+
+function stopPolling() {
+  if (refreshTimer) {
+    clearInterval(refreshTimer);
+    refreshTimer = null;
+  }
+}
+
+// Pushed bucket updates replace polling while the stream is open; polling
+// resumes whenever it drops and EventSource keeps trying to reconnect.
+function openStream() {
+  if (typeof EventSource === "undefined") {
+    return;
+  }
+  stream = new EventSource("/api/v1/stream");
+  stream.addEventListener("open", () => {
+    stopPolling();
+    fetchAndRender();
+  });
+  stream.addEventListener("error", () => {
+    if (!refreshTimer) {
+      startPolling();
+    }
+  });
+  stream.addEventListener("buckets", (message) => {
+    let event = null;
+    try {
+      event = JSON.parse(message.data);
+    } catch (error) {
+      return;
+    }
+    if (!applyStreamEvent(event)) {
+      fetchAndRender();
+      return;
+    }
+    renderSeries(seriesStateResponse());
+    lastSeriesKey = null;
+    lastUpdateMs = Date.now();
+    setStatus(`Updated ${formatTimestamp(lastUpdateMs, true)}`);
+  });
 }
 
 function initChart() {
@@ -378,8 +573,19 @@ function lightenColor(hexColor, factor) {
 
 async function fetchAndRender() {
   try {
-    const series = await fetchSeries();
-    renderSeries(series);
+    const result = await fetchSeries();
+    if (!result.key || result.key !== lastSeriesKey) {
+      if (result.sinceBucket === null) {
+        replaceSeriesState(result.query, result.data);
+      } else if (!mergeSeriesDelta(result.data)) {
+        seriesState = null;
+        lastSeriesKey = null;
+        await fetchAndRender();
+        return;
+      }
+      renderSeries(seriesStateResponse());
+      lastSeriesKey = result.key;
+    }
     lastUpdateMs = Date.now();
     setStatus(`Updated ${formatTimestamp(lastUpdateMs, true)}`);
   } catch (error) {
@@ -431,11 +637,8 @@ async function init() {
     initChart();
     await fetchAndRender();
 
-    const refreshSeconds = meta.ui.refresh_seconds || 2;
-    if (refreshTimer) {
-      clearInterval(refreshTimer);
-    }
-    refreshTimer = setInterval(fetchAndRender, refreshSeconds * 1000);
+    startPolling();
+    openStream();
   } catch (error) {
     setStatus("Failed to initialize");
     console.error(error);